@@ -0,0 +1,144 @@
+# api.py
+# API JSON en lecture seule du catalogue (/api/v1/documents) pour les bornes et clients mobiles : pagination par curseur,
+# champs à la demande (?fields=), ETag dérivé de la version des documents (If-None-Match -> 304 sans sérialisation).
+# Encodage par orjson s'il est installé, sinon json compact de la bibliothèque standard.
+from flask import request, url_for, current_app
+from sqlalchemy.orm import load_only
+from models import Document
+import hashlib
+import json
+try:
+    import orjson
+except ImportError: # Dépendance optionnelle : pip install orjson
+    orjson = None
+
+MAX_PAGE_SIZE = 200
+STATUSES = ('disponible', 'emprunte', 'reserve')
+FORMATS = ('physical', 'digital')
+
+# Champ exposé -> colonnes à charger (id et version sont toujours chargés : lien et ETag)
+FIELDS = {
+    'id': (),
+    'title': (Document.title,),
+    'author': (Document.author,),
+    'summary': (Document.summary,),
+    'status': (Document.status,),
+    'is_physical': (Document.is_physical,),
+    'is_digital': (Document.is_digital,),
+    'available': (Document.status, Document.is_physical, Document.is_digital),
+    'cover_url': (Document.cover_image_filename,),
+    'version': (),
+}
+LIST_FIELDS = tuple(name for name in FIELDS if name != 'summary') # Liste : résumé seulement sur demande
+DETAIL_FIELDS = tuple(FIELDS)
+
+
+class ApiError(Exception):
+    """Paramètre invalide ou accès refusé : réponse JSON {"error": message} avec le code donné."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def parse_fields(text, default):
+    """'title,status' -> ('id', 'title', 'status') ; l'id est toujours inclus. Lève ApiError si champ inconnu."""
+    if not text:
+        return default
+    names = [name.strip() for name in text.split(',') if name.strip()]
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise ApiError(f"Champ(s) inconnu(s) : {', '.join(unknown)} (disponibles : {', '.join(FIELDS)})")
+    return ('id',) + tuple(dict.fromkeys(name for name in names if name != 'id'))
+
+
+def parse_page_size(text, default):
+    try:
+        size = int(text) if text else default
+    except ValueError:
+        raise ApiError("limit doit être un entier")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def load_fields(fields):
+    """Option de chargement : seules les colonnes des champs demandés (plus id et version)."""
+    columns = {Document.id, Document.version}
+    for name in fields:
+        columns.update(FIELDS[name])
+    return load_only(*columns)
+
+
+def filter_documents(query, status=None, fmt=None):
+    """Filtres ?status= et ?format= (index is_physical + status, is_digital)."""
+    if status:
+        if status not in STATUSES:
+            raise ApiError(f"status invalide (attendu : {', '.join(STATUSES)})")
+        query = query.filter(Document.is_physical == True, Document.status == status)
+    if fmt:
+        if fmt not in FORMATS:
+            raise ApiError(f"format invalide (attendu : {', '.join(FORMATS)})")
+        query = query.filter(Document.is_physical == True if fmt == 'physical' else Document.is_digital == True)
+    return query
+
+
+def serialize(doc, fields):
+    """Document -> dict limité aux champs demandés, dans l'ordre de FIELDS."""
+    item = {}
+    for name in fields:
+        if name == 'available':
+            item[name] = doc.is_digital or (doc.is_physical and doc.status == 'disponible')
+        elif name == 'cover_url':
+            item[name] = url_for('static', filename='uploads/covers/' + doc.cover_image_filename) if doc.cover_image_filename else None
+        else:
+            item[name] = getattr(doc, name)
+    return item
+
+
+def document_etag(doc_id, version, fields):
+    """ETag d'un document : change avec sa version ou le jeu de champs demandé."""
+    return f"d{doc_id}-v{version}-{_fields_key(fields)}"
+
+
+def list_etag(documents, fields, links):
+    """ETag d'une page : ids et versions des documents, champs et liens (curseurs) de la page."""
+    digest = hashlib.sha1(_fields_key(fields).encode())
+    for doc in documents:
+        digest.update(f"{doc.id}:{doc.version};".encode())
+    digest.update(repr(sorted(links.items())).encode())
+    return 'l' + digest.hexdigest()[:20]
+
+
+def _fields_key(fields):
+    return hashlib.sha1(','.join(fields).encode()).hexdigest()[:8]
+
+
+def not_modified(etag):
+    """Vrai si le client possède déjà cette représentation (If-None-Match, comparaison faible)."""
+    return request.if_none_match.contains_weak(etag)
+
+
+def dumps(payload):
+    """Sérialisation en octets UTF-8 (orjson si disponible)."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200, etag=None):
+    """Réponse JSON ; avec ETag, revalidation obligatoire par le client (304 tant que la version ne change pas)."""
+    response = current_app.response_class(dumps(payload), status=status, mimetype='application/json')
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified_response(etag):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def error_response(error):
+    return json_response({'error': error.message}, status=error.status)
@@ -1,13 +1,49 @@
 # app.py (Version Corrigée Complète)
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, abort, jsonify
-from models import db, User, Document, Reservation, Loan
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, abort, jsonify, make_response, g, Response
+from models import db, User, Document, Reservation, Loan, next_version
+import search_index
+from pagination import keyset_paginate, KeysetPage
+import migrations
+import query_plans
+import stats
+import query_budget
+import structured_logging
+import logging
+import request_metrics
+import db_config
+from query_budget import query_budget as route_query_budget
+from identity_cache import IdentityCache
+from chat_service import ChatService, ChatBusy, MODEL_ENGINE, PROMPT_VERSION, sse_event
+from chat_cache import ChatResponseCache
+from fragment_cache import FragmentCache
+from catalogue_retrieval import CatalogueRetriever
+import hashlib
+import covers
+import pdf_delivery
+import static_assets
+import expiry_sweeper
+import reservation_queue
+import circulation
+import passwords
+import rate_limit
+from rate_limit import rate_limit as route_rate_limit
+import catalogue_import
+import api
+import queue
+import sys
+import click
+import re
 from datetime import datetime, timedelta
 import os
+from werkzeug.exceptions import HTTPException
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename # Pour sécuriser les noms de fichiers uploadés
-from werkzeug.security import generate_password_hash, check_password_hash
 import uuid # Pour générer des noms de fichiers uniques
 from sqlalchemy import or_
 from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload, raiseload
 import openai 
 from dotenv import load_dotenv
 from waitress import serve
@@ -16,11 +52,19 @@ load_dotenv()
 # Configuration de l'application Flask
 app = Flask(__name__)
 
-# Configuration de la base de données SQLite
+# Journalisation : JSON à niveaux avec identifiant de requête (LOG_FORMAT=text en développement), écrite par un
+# thread dédié ; LOG_SAMPLE_RATES = fraction conservée des événements fréquents (ex. catalogue.search=0.1)
+structured_logging.init_app(app, level=os.getenv('LOG_LEVEL', 'INFO'), fmt=os.getenv('LOG_FORMAT', 'json'),
+                            sample_rates=structured_logging.parse_sample_rates(os.getenv('LOG_SAMPLE_RATES')),
+                            queue_size=int(os.getenv('LOG_QUEUE_SIZE', structured_logging.QUEUE_SIZE)))
+log = logging.getLogger('biblio')
+
+# Configuration de la base de données
 basedir = os.path.abspath(os.path.dirname(__file__))
 instance_path = os.path.join(basedir, 'instance')
 os.makedirs(instance_path, exist_ok=True)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(instance_path, 'library.db')
+# Base : SQLite locale par défaut (pragmas WAL...), ou DATABASE_URL (ex. PostgreSQL) ; voir db_config.py
+db_config.init_app(app, os.path.join(instance_path, 'library.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'une-cle-secrete-tres-difficile-a-deviner' # À CHANGER EN PRODUCTION
 
@@ -28,12 +72,41 @@ app.config['SECRET_KEY'] = 'une-cle-secrete-tres-difficile-a-deviner' # À CHANG
 PDF_UPLOAD_FOLDER = os.path.join(app.instance_path, 'uploads', 'pdfs')
 os.makedirs(PDF_UPLOAD_FOLDER, exist_ok=True)
 DIGITAL_LOAN_DURATION = 14 # jours
+PHYSICAL_LOAN_DURATION = int(os.getenv('PHYSICAL_LOAN_DURATION', circulation.LOAN_DAYS)) # jours
+CIRCULATION_BATCH_MAX = app.config['CIRCULATION_BATCH_MAX'] = int(os.getenv('CIRCULATION_BATCH_MAX', 200)) # Scans par lot (comptoir)
+RESERVATION_HOLD_DAYS = int(os.getenv('RESERVATION_HOLD_DAYS', reservation_queue.HOLD_DAYS)) # Retrait d'un document mis de côté
+# Livraison : 'direct' (Flask, Range/206), 'x-sendfile' (Apache/lighttpd) ou 'x-accel' (nginx, location internal)
+app.config['PDF_DELIVERY_MODE'] = os.getenv('PDF_DELIVERY_MODE', 'direct')
+app.config['PDF_ACCEL_PREFIX'] = os.getenv('PDF_ACCEL_PREFIX', '/protected-pdfs/')
+app.config['PDF_URL_TTL'] = int(os.getenv('PDF_URL_TTL', 600)) # Validité des URL signées (secondes)
+if app.config['PDF_DELIVERY_MODE'] not in pdf_delivery.DELIVERY_MODES:
+    raise ValueError(f"PDF_DELIVERY_MODE invalide : {app.config['PDF_DELIVERY_MODE']}")
+
+# Configuration Catalogue (pagination par curseur)
+app.config['CATALOGUE_PAGE_SIZE'] = int(os.getenv('CATALOGUE_PAGE_SIZE', 24))
+app.config['CATALOGUE_INFINITE_SCROLL'] = os.getenv('CATALOGUE_INFINITE_SCROLL', '0') == '1'
+app.config['API_PAGE_SIZE'] = int(os.getenv('API_PAGE_SIZE', 50)) # /api/v1/documents sans ?limit= (max api.MAX_PAGE_SIZE)
+
+# Statistiques gérant : durée de validité de l'instantané (secondes)
+app.config['STATS_SNAPSHOT_TTL'] = int(os.getenv('STATS_SNAPSHOT_TTL', 300))
 
 # Configuration Images Couverture
 COVER_UPLOAD_FOLDER = os.path.join(basedir, 'static', 'uploads', 'covers')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 os.makedirs(COVER_UPLOAD_FOLDER, exist_ok=True)
 
+# Variantes redimensionnées (WebP/JPEG) pour les templates : None si non générées (image originale utilisée)
+app.jinja_env.globals['cover_sources'] = lambda filename, kind: covers.cover_sources(COVER_UPLOAD_FOLDER, url_for, filename, kind)
+
+# HTML rendu des cartes / de l'en-tête des pages détail, réutilisé tant que document.version ne change pas
+# (FRAGMENT_CACHE_SIZE entrées par processus, 0 = désactivé)
+fragment_cache = FragmentCache(max_entries=int(os.getenv('FRAGMENT_CACHE_SIZE', 5000)),
+                               on_lookup=request_metrics.observe_fragment_cache)
+app.jinja_env.globals['document_fragment'] = fragment_cache.render
+
+# Fichiers statiques : URL versionnées (?v=empreinte), cache long immutable, variantes .br/.gz précompressées
+static_assets.init_app(app)
+
 def allowed_file(filename):
     """Vérifie si l'extension du fichier est autorisée."""
     return '.' in filename and \
@@ -42,27 +115,85 @@ def allowed_file(filename):
 # --- Configuration Clé API OpenAI ---
 openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
-    print("\n" + "*"*40)
-    print("ATTENTION : Clé API OpenAI (OPENAI_API_KEY) non trouvée dans l'environnement.")
-    print("Le chatbot IA ne pourra pas fonctionner.")
-    print("Veuillez créer un fichier .env et y ajouter OPENAI_API_KEY=votre_clé")
-    print("*"*40 + "\n")
+    log.warning("Clé API OpenAI (OPENAI_API_KEY) non trouvée : le chatbot IA ne pourra pas fonctionner "
+                "(ajouter OPENAI_API_KEY=votre_clé dans le fichier .env).")
     # On assigne None pour pouvoir vérifier plus tard
     openai.api_key = None
 else:
     openai.api_key = openai_api_key
-    print("Clé API OpenAI chargée avec succès.")
+    log.info("Clé API OpenAI chargée avec succès.")
 
 # Initialisation de SQLAlchemy
 db.init_app(app)
 
+# Budget de requêtes SQL par route (anti N+1) : échoue en debug/test si dépassé
+app.config['QUERY_BUDGET_DEFAULT'] = int(os.getenv('QUERY_BUDGET_DEFAULT', 20))
+query_budget.init_app(app)
+
+# Instrumentation : Server-Timing (temps base / total), requêtes SQL lentes, métriques Prometheus (/metrics)
+# METRICS_PATH = fichier SQLite partagé entre workers gunicorn (défaut : instance/metrics.db ; vide = métriques du seul
+# worker qui répond)
+app.config['SLOW_QUERY_MS'] = int(os.getenv('SLOW_QUERY_MS', 200)) # 0 = pas de journal
+app.config['SERVER_TIMING'] = os.getenv('SERVER_TIMING', '1') == '1'
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN') or None # Jeton Bearer exigé par /metrics si défini
+if not app.config['METRICS_TOKEN']:
+    log.warning("METRICS_TOKEN non défini : /metrics est accessible sans authentification "
+                "(définir METRICS_TOKEN ou filtrer /metrics au niveau du proxy).")
+metrics_registry = request_metrics.MetricsRegistry(
+    path=os.getenv('METRICS_PATH', os.path.join(instance_path, 'metrics.db')) or None)
+request_metrics.init_app(app, metrics_registry)
+
+# Mots de passe : schéma / coût configurables (PASSWORD_SCHEME...), anciens hachages convertis à la connexion,
+# calculs simultanés bornés (PASSWORD_HASH_CONCURRENCY) pour qu'une rafale de connexions n'occupe pas tous les threads
+password_service = passwords.PasswordService()
+
+# Limitation de débit (seau à jetons) des routes coûteuses, par utilisateur connecté sinon par IP : budget
+# "jetons/secondes" par route ("0" = illimité), état partagé entre workers dans un fichier SQLite local
+app.config['RATE_LIMIT_ENABLED'] = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+# Adresse client derrière le routeur (Heroku, nginx...) : X-Forwarded-For/-Proto ajoutés par TRUSTED_PROXY_HOPS
+# proxys de confiance (0 = exposition directe : remote_addr tel quel, en-têtes ignorés). Sans cela, tous les anonymes
+# partagent l'IP du routeur, donc un même seau de débit
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 1))
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
+rate_limiter = rate_limit.TokenBucketLimiter(
+    os.getenv('RATE_LIMIT_PATH') or os.path.join(instance_path, 'rate_limit.db'),
+    {'chat': rate_limit.parse_budget(os.getenv('RATE_LIMIT_CHAT', '10/60')),
+     'login': rate_limit.parse_budget(os.getenv('RATE_LIMIT_LOGIN', '10/60')),
+     'search': rate_limit.parse_budget(os.getenv('RATE_LIMIT_SEARCH', '60/60'))})
+rate_limit.init_app(app, rate_limiter)
+
+# --- Utilisateur courant : résolu une fois par requête (g) + cache inter-requêtes avec TTL ---
+identity_cache = IdentityCache(ttl=int(os.getenv('IDENTITY_CACHE_TTL', 60)))
+
+def get_current_user():
+    """Utilisateur connecté (CachedUser en lecture seule) ou None ; au plus un SELECT par TTL."""
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        cached_user = None
+        if user_id is not None:
+            cached_user = identity_cache.get(user_id)
+            if cached_user is None:
+                user = db.session.get(User, user_id)
+                cached_user = identity_cache.put(user) if user else None
+        g.current_user = cached_user
+    return g.current_user
+
+# --- Expiration en arrière-plan des prêts échus et abonnements terminés ---
+# Thread lancé seulement si EXPIRY_SWEEPER=1, à définir sur un seul processus (sinon un balayeur par worker gunicorn
+# et par commande flask, en concurrence pour le verrou d'écriture SQLite) ; à défaut, planifier `flask expire-sweep`
+app.config['EXPIRY_SWEEPER'] = os.getenv('EXPIRY_SWEEPER', '0') == '1'
+app.config['EXPIRY_SWEEP_INTERVAL'] = int(os.getenv('EXPIRY_SWEEP_INTERVAL', 900)) # Secondes entre deux passes
+app.config['EXPIRY_SWEEP_BATCH_SIZE'] = int(os.getenv('EXPIRY_SWEEP_BATCH_SIZE', expiry_sweeper.DEFAULT_BATCH_SIZE))
+sweeper = expiry_sweeper.ExpirySweeper(app, app.config['EXPIRY_SWEEP_INTERVAL'],
+                                       app.config['EXPIRY_SWEEP_BATCH_SIZE'], identity_cache, RESERVATION_HOLD_DAYS)
+if app.config['EXPIRY_SWEEPER'] and app.config['EXPIRY_SWEEP_INTERVAL'] > 0:
+    sweeper.start()
+
 # --- Context Processor pour injecter current_user dans les templates ---
 @app.context_processor
 def inject_user():
-    if 'user_id' in session:
-        user = User.query.get(session['user_id'])
-        return dict(current_user=user)
-    return dict(current_user=None)
+    return dict(current_user=get_current_user())
 # -----------------------------------------------------------------------
 
 # --- Routes de Base ---
@@ -78,6 +209,7 @@ if __name__ == "__main__":
 
     
 @app.route('/login', methods=['GET', 'POST'])
+@route_rate_limit('login', methods=('POST',))
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -86,11 +218,22 @@ def login():
             flash('Nom d\'utilisateur et mot de passe requis.', 'warning')
             return redirect(url_for('login'))
         user = User.query.filter_by(username=username).first()
-        # !! RAPPEL SECURITE MDP !! - Utiliser le hachage en production
-        if user and check_password_hash(user.password, password): # <-- MODIFIÉ ICI
+        try:
+            valid, needs_rehash = password_service.verify(user.password, password) if user else (False, False)
+        except passwords.HashingBusy:
+            log.warning("Connexion refusée : hachage des mots de passe saturé", extra={'event': 'auth.busy'})
+            flash('Trop de connexions simultanées, veuillez réessayer dans un instant.', 'warning')
+            return render_template('login.html'), 503, {'Retry-After': '2'}
+        if valid and needs_rehash: # Schéma ou coût changé : nouveau hachage tant que le mot de passe en clair est connu
+            try:
+                user.password = password_service.hash(password); db.session.commit()
+            except Exception as e: # Connexion non bloquée : nouvel essai à la prochaine connexion
+                db.session.rollback(); log.warning("Re-hachage du mot de passe différé: %s", e)
+        if valid:
             session['user_id'] = user.id
             session['user_role'] = user.role
             session['username'] = user.username
+            identity_cache.put(user) # Déjà chargé : pas de SELECT au prochain rendu
             flash('Connexion réussie !', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -109,6 +252,7 @@ def logout():
 
 # --- Route Tableau de Bord Principal ---
 @app.route('/dashboard')
+@route_query_budget(10)
 def dashboard():
     if 'user_role' not in session:
         flash('Veuillez vous connecter.', 'warning')
@@ -120,8 +264,10 @@ def dashboard():
     if role == 'membre':
         user_loans = []; user_reservations = []
         try:
-            user_loans = Loan.query.filter_by(user_id=user_id, status='active').order_by(Loan.due_date).all()
-            user_reservations = Reservation.query.filter_by(user_id=user_id, status='active').order_by(Reservation.reservation_date.desc()).all()
+            # Documents chargés avec la même requête (évite un SELECT par ligne dans le template)
+            user_loans = Loan.query.options(joinedload(Loan.document)).filter_by(user_id=user_id, status='active').order_by(Loan.due_date).all()
+            # (réservation, rang dans la file) : rang calculé dans la même requête (sous-requête sur l'index de file)
+            user_reservations = reservation_queue.member_reservations(user_id).all()
         except Exception as e: flash(f"Erreur récupération données: {e}", "danger")
         today_date = datetime.utcnow().date()
         return render_template('member_dashboard.html', loans=user_loans, reservations=user_reservations, today_date=today_date)
@@ -135,37 +281,23 @@ def dashboard():
         # --- Calcul des statistiques pour le rapport ---
         report_stats = {}
         try:
-            report_stats['total_documents'] = db.session.query(func.count(Document.id)).scalar()
-            report_stats['physical_available'] = Document.query.filter_by(is_physical=True, status='disponible').count()
-            report_stats['physical_borrowed'] = Document.query.filter_by(is_physical=True, status='emprunte').count()
-            report_stats['digital_documents'] = Document.query.filter_by(is_digital=True).count()
-            report_stats['active_digital_loans'] = Loan.query.filter_by(status='active').count()
-            report_stats['active_reservations'] = Reservation.query.filter_by(status='active').count()
-            report_stats['total_members'] = User.query.filter_by(role='membre').count()
-            report_stats['active_members'] = User.query.filter_by(role='membre', subscription_status='active').count() # Si abo implémenté
-            report_stats['total_staff'] = User.query.filter(User.role.in_(['bibliothecaire', 'prepose', 'gerant'])).count()
-
-            # Optionnel: Documents les plus empruntés (numérique) - Exemple simple
-            most_loaned_query = db.session.query(
-                    Document.title, func.count(Loan.id).label('loan_count')
-                ).join(Loan).filter(Loan.status == 'active') \
-                 .group_by(Document.id).order_by(func.count(Loan.id).desc()).limit(5).all()
-            report_stats['most_loaned_digital'] = most_loaned_query
-
+            # Instantané pré-calculé (une ligne) ; recalcul en une passe si expiré (TTL) ou invalidé
+            report_stats = stats.get_snapshot(app.config['STATS_SNAPSHOT_TTL'])
         except Exception as e:
             flash(f"Erreur lors du calcul des statistiques : {e}", "danger")
-            print(f"Erreur DB calcul stats gérant: {e}")
+            log.exception("Erreur DB calcul stats gérant")
             report_stats = {} # Renvoyer vide en cas d'erreur
 
         # --- Récupération des listes d'utilisateurs ---
         librarians = []
         members = []
         try:
-            librarians = User.query.filter_by(role='bibliothecaire').order_by(User.username).all()
-            members = User.query.filter_by(role='membre').order_by(User.username).all()
+            # raiseload : toute relation touchée dans le template échoue au lieu de faire une requête par ligne
+            librarians = User.query.options(raiseload('*')).filter_by(role='bibliothecaire').order_by(User.username).all()
+            members = User.query.options(raiseload('*')).filter_by(role='membre').order_by(User.username).all()
         except Exception as e:
             flash(f"Erreur lors de la récupération des listes d'utilisateurs : {e}", "danger")
-            print(f"Erreur DB listes utilisateurs gérant: {e}")
+            log.exception("Erreur DB listes utilisateurs gérant")
 
 
         return render_template('manager_dashboard.html',
@@ -179,47 +311,128 @@ def dashboard():
 
 
 # --- Routes Catalogue & Détail ---
+def _catalogue_page():
+    """Page courante du catalogue d'après les paramètres q / after / before."""
+    search_query = request.args.get('q', None)
+    query_builder = Document.query
+    sort_columns = [Document.title, Document.id]
+    if search_query:
+        # Index FTS5 (titre, auteur, résumé), trié par pertinence
+        query_builder, sort_columns = search_index.apply_search(query_builder, search_query)
+        log.info("Recherche catalogue", extra={'event': 'catalogue.search', 'query': search_query}) # Échantillonné
+    return keyset_paginate(query_builder, sort_columns, app.config['CATALOGUE_PAGE_SIZE'],
+                           after=request.args.get('after'), before=request.args.get('before'))
+
 @app.route('/catalogue')
+@route_query_budget(5)
+@route_rate_limit('search', only_if=lambda: bool(request.args.get('q')))
 def catalogue():
     if 'user_id' not in session:
         flash('Connectez-vous pour voir le catalogue.', 'warning')
         return redirect(url_for('login'))
 
-    search_query = request.args.get('q', None)
     try:
-        query_builder = Document.query
-        if search_query:
-            search_term = f"%{search_query}%"
-            query_builder = query_builder.filter(
-                or_(
-                    Document.title.ilike(search_term),
-                    Document.author.ilike(search_term)
-                    # Ajouter Document.summary.ilike(search_term) si besoin
-                )
-            )
-            print(f"Recherche catalogue pour: {search_query}") # Log serveur
-        all_documents = query_builder.order_by(Document.title).all()
+        page = _catalogue_page()
     except Exception as e:
         flash(f"Erreur lors de la récupération du catalogue: {e}", "danger")
-        print(f"Erreur DB catalogue: {e}") # Log serveur
-        all_documents = []
-    return render_template('catalogue.html', documents=all_documents)
+        log.exception("Erreur DB catalogue")
+        page = KeysetPage([])
+    return render_template('catalogue.html', documents=page.items, page=page)
+
+@app.route('/catalogue/page')
+@route_query_budget(5)
+@route_rate_limit('search', only_if=lambda: bool(request.args.get('q')))
+def catalogue_fragment():
+    """Fragment HTML (cartes seules) pour le défilement infini ; URL suivante dans X-Next-Page."""
+    if 'user_id' not in session: abort(401)
+    page = _catalogue_page()
+    response = make_response(render_template('_catalogue_cards.html', documents=page.items))
+    if page.has_next:
+        response.headers['X-Next-Page'] = url_for('catalogue_fragment', q=request.args.get('q') or None, after=page.next_cursor)
+    return response
 
 @app.route('/document/<int:doc_id>')
 def document_detail(doc_id):
     if 'user_id' not in session:
         flash('Connectez-vous pour voir les détails.', 'warning')
         return redirect(url_for('login'))
+    current_loan = current_resa = resa_position = None
     try:
         document = Document.query.get_or_404(doc_id)
+        if session.get('user_role') == 'membre':
+            # Recherches ciblées (index) au lieu de charger tous les prêts/réservations du membre
+            current_loan = Loan.query.filter_by(user_id=session['user_id'], document_id=doc_id, status='active').first()
+            current_resa = reservation_queue.open_reservation(session['user_id'], doc_id).first()
+            if current_resa: resa_position = reservation_queue.position(current_resa)
     except Exception as e:
         flash(f"Erreur lors de la récupération du document: {e}", "danger")
-        print(f"Erreur DB détail doc {doc_id}: {e}") # Log serveur
+        log.warning("Erreur détail doc %s: %s", doc_id, e)
         return redirect(url_for('catalogue'))
-    return render_template('document_detail.html', doc=document)
+    return render_template('document_detail.html', doc=document, current_loan=current_loan, current_resa=current_resa, resa_position=resa_position)
+
+@app.route('/fragment_cache/stats')
+def fragment_cache_stats():
+    """Compteurs succès/échecs du cache des fragments de ce processus (gérant)."""
+    if session.get('user_role') != 'gerant': abort(403)
+    return jsonify(fragment_cache.stats())
 # --- Fin Routes Catalogue & Détail ---
 
 
+# --- API JSON lecture seule (/api/v1) : bornes et clients mobiles ---
+@app.errorhandler(api.ApiError)
+def api_error(e):
+    return api.error_response(e)
+
+def _require_api_session():
+    if 'user_id' not in session:
+        raise api.ApiError("Authentification requise.", 401)
+
+@app.route('/api/v1/documents')
+@route_query_budget(3)
+@route_rate_limit('search', only_if=lambda: bool(request.args.get('q')))
+def api_documents():
+    """Liste paginée par curseur : ?q=, ?status=, ?format=, ?fields=, ?limit=, ?after= / ?before=."""
+    _require_api_session()
+    fields = api.parse_fields(request.args.get('fields'), api.LIST_FIELDS)
+    page_size = api.parse_page_size(request.args.get('limit'), app.config['API_PAGE_SIZE'])
+    query_builder = api.filter_documents(Document.query.options(api.load_fields(fields)),
+                                         request.args.get('status'), request.args.get('format'))
+    sort_columns = [Document.title, Document.id]
+    search_query = request.args.get('q')
+    if search_query:
+        query_builder, sort_columns = search_index.apply_search(query_builder, search_query)
+        log.info("Recherche API", extra={'event': 'catalogue.search', 'query': search_query}) # Échantillonné
+    page = keyset_paginate(query_builder, sort_columns, page_size,
+                           after=request.args.get('after'), before=request.args.get('before'))
+
+    params = {name: request.args.get(name) or None for name in ('q', 'status', 'format', 'fields', 'limit')}
+    links = {'next': url_for('api_documents', after=page.next_cursor, **params) if page.has_next else None,
+             'prev': url_for('api_documents', before=page.prev_cursor, **params) if page.has_prev else None}
+    etag = api.list_etag(page.items, fields, links)
+    if api.not_modified(etag):
+        return api.not_modified_response(etag) # Page inchangée : ni sérialisation ni corps
+    return api.json_response({'data': [api.serialize(doc, fields) for doc in page.items], 'links': links}, etag=etag)
+
+@app.route('/api/v1/documents/<int:doc_id>')
+@route_query_budget(2)
+def api_document(doc_id):
+    """Un document (?fields=) ; avec If-None-Match, seule sa version est lue tant qu'elle n'a pas changé."""
+    _require_api_session()
+    fields = api.parse_fields(request.args.get('fields'), api.DETAIL_FIELDS)
+    if request.if_none_match:
+        version = db.session.execute(select(Document.version).where(Document.id == doc_id)).scalar()
+        if version is None:
+            raise api.ApiError("Document introuvable.", 404)
+        etag = api.document_etag(doc_id, version, fields)
+        if api.not_modified(etag):
+            return api.not_modified_response(etag)
+    doc = Document.query.options(api.load_fields(fields)).filter_by(id=doc_id).first()
+    if doc is None:
+        raise api.ApiError("Document introuvable.", 404)
+    return api.json_response(api.serialize(doc, fields), etag=api.document_etag(doc.id, doc.version, fields))
+# --- Fin API JSON ---
+
+
 # --- Route Ajout Document (Bibliothécaire) ---
 @app.route('/add_document', methods=['POST'])
 def add_document():
@@ -230,12 +443,14 @@ def add_document():
     title = request.form.get('title'); author = request.form.get('author'); summary = request.form.get('summary')
     is_physical = request.form.get('is_physical') == 'y'; is_digital = request.form.get('is_digital') == 'y'
     file_path_pdf = request.form.get('file_path', None); cover_image_file = request.files.get('cover_image')
+    barcode = (request.form.get('barcode') or '').strip() or None
     cover_filename_to_save = None
 
     # Validations initiales
     if not title: flash("Titre requis.", "warning"); return redirect(url_for('dashboard'))
     if not is_physical and not is_digital: flash("Format requis.", "warning"); return redirect(url_for('dashboard'))
     if is_digital and (not file_path_pdf or not file_path_pdf.strip()): flash("Nom fichier PDF requis si Numérique coché.", "warning"); return redirect(url_for('dashboard'))
+    if barcode and Document.query.filter_by(barcode=barcode).first(): flash(f"Code-barres '{barcode}' déjà utilisé.", "warning"); return redirect(url_for('dashboard'))
 
     # Traitement Image
     if cover_image_file and cover_image_file.filename != '':
@@ -248,9 +463,11 @@ def add_document():
                 try:
                     cover_image_file.save(save_path)
                     cover_filename_to_save = unique_filename
-                    print(f"Image uploadée sauvegardée: {unique_filename}")
+                    log.info("Image uploadée sauvegardée: %s", unique_filename)
+                    try: covers.process_cover(COVER_UPLOAD_FOLDER, unique_filename) # Variantes carte/détail
+                    except Exception: log.exception("Err variantes img %s", unique_filename)
                 except Exception as e:
-                    flash(f"Erreur sauvegarde image: {e}", "danger"); print(f"Erreur save img: {e}")
+                    flash(f"Erreur sauvegarde image: {e}", "danger"); log.exception("Erreur sauvegarde image")
             except IndexError:
                  flash(f"Nom de fichier image invalide: {original_filename}", "warning")
         else:
@@ -273,14 +490,18 @@ def add_document():
         new_doc = Document(
             title=title, author=author or None, summary=summary or None, status='disponible',
             is_physical=is_physical, is_digital=is_digital, file_path=cleaned_file_path_pdf if is_digital else None,
-            cover_image_filename=cover_filename_to_save
+            cover_image_filename=cover_filename_to_save, barcode=barcode if is_physical else None
         )
-        db.session.add(new_doc); db.session.commit()
+        db.session.add(new_doc); db.session.flush() # Obtenir l'ID pour l'index
+        search_index.index_document(new_doc)
+        stats.bump(total_documents=1, physical_available=int(is_physical), digital_documents=int(is_digital))
+        db.session.commit()
+        catalogue_retriever.upsert(new_doc)
         formats = [f for f, present in [("Physique", is_physical), ("Numérique", is_digital)] if present]
         img_msg = " avec image" if cover_filename_to_save else ""
         flash(f"Document '{title}' ({', '.join(formats)}) ajouté{img_msg}.", "success")
     except Exception as e:
-        db.session.rollback(); flash(f"Erreur ajout en base de données: {e}", "danger"); print(f"Erreur DB ajout: {e}")
+        db.session.rollback(); flash(f"Erreur ajout en base de données: {e}", "danger"); log.exception("Erreur DB ajout document")
 
     return redirect(url_for('dashboard'))
 # --- Fin Route Ajout Document ---
@@ -308,12 +529,17 @@ def edit_document(doc_id):
         remove_cover = request.form.get('remove_cover') == 'y'
         new_cover_image_file = request.files.get('cover_image')
         new_physical_status = request.form.get('status')
+        barcode = (request.form.get('barcode') or '').strip() or None
 
         # Validations
         if not doc.title: flash("Titre requis.", "warning"); return render_template('edit_document.html', doc=doc)
         if not doc.is_physical and not doc.is_digital: flash("Format requis.", "warning"); return render_template('edit_document.html', doc=doc)
         if doc.is_digital and (not new_file_path_pdf or not new_file_path_pdf.strip()): flash("Nom fichier PDF requis.", "warning"); return render_template('edit_document.html', doc=doc)
-        if doc.is_physical and new_physical_status and new_physical_status not in ['disponible', 'emprunte']:
+        if barcode and Document.query.filter(Document.barcode == barcode, Document.id != doc.id).first():
+            flash(f"Code-barres '{barcode}' déjà utilisé.", "warning"); return render_template('edit_document.html', doc=doc)
+        doc.barcode = barcode if doc.is_physical else None
+        if doc.is_physical and new_physical_status and new_physical_status not in ['disponible', 'emprunte'] \
+                and not (new_physical_status == 'reserve' and original_physical_status == 'reserve'): # 'reserve' : posé par la file uniquement
             flash("Statut physique invalide.", "warning"); return render_template('edit_document.html', doc=doc)
 
         # Traitement PDF Path
@@ -330,7 +556,7 @@ def edit_document(doc_id):
         if remove_cover:
             doc.cover_image_filename = None
             delete_old_cover = True
-            print(f"Suppression image demandée pour doc {doc_id}")
+            log.info("Suppression image demandée pour doc %s", doc_id)
         elif new_cover_image_file and new_cover_image_file.filename != '':
             if allowed_file(new_cover_image_file.filename):
                 original_filename = secure_filename(new_cover_image_file.filename) # Définition ici
@@ -342,43 +568,52 @@ def edit_document(doc_id):
                         new_cover_image_file.save(save_path)
                         doc.cover_image_filename = unique_filename
                         delete_old_cover = True
-                        print(f"Nouvelle image sauvegardée: {unique_filename}")
+                        log.info("Nouvelle image sauvegardée: %s", unique_filename)
+                        try: covers.process_cover(COVER_UPLOAD_FOLDER, unique_filename) # Variantes carte/détail
+                        except Exception: log.exception("Err variantes img %s", unique_filename)
                     except Exception as e:
-                        flash(f"Erreur sauvegarde nouvelle image: {e}", "danger"); print(f"Erreur save img: {e}")
+                        flash(f"Erreur sauvegarde nouvelle image: {e}", "danger"); log.exception("Erreur sauvegarde image")
                 except IndexError:
                      flash(f"Nom de fichier image invalide: {original_filename}", "warning")
             else:
                 flash("Format nouvelle image non autorisé.", "warning")
 
-        # Application et Synchro Statut Physique
-        reservations_cancelled_count = 0
+        # Application et Synchro Statut Physique (file de réservations : UPDATE ensemblistes, pas de boucle)
+        reservations_cancelled_count = 0; handed_off = False
         if doc.is_physical and new_physical_status:
-            if original_physical_status == 'emprunte' and new_physical_status == 'disponible':
-                print(f"Statut doc {doc.id} changé: emp -> dispo. Vérif réservations...")
-                active_reservations = Reservation.query.filter_by(document_id=doc.id, status='active').all()
-                for resa in active_reservations:
-                    resa.status = 'cancelled'; reservations_cancelled_count += 1
-                    print(f"  > Annulation Résa ID {resa.id}")
-            doc.status = new_physical_status # Appliquer le nouveau statut
+            if original_physical_status == 'reserve' and new_physical_status != 'reserve':
+                reservations_cancelled_count = reservation_queue.cancel_hold(doc.id) # Mise de côté levée par le bibliothécaire
+            if original_physical_status in ('emprunte', 'reserve') and new_physical_status == 'disponible':
+                # Équivaut à un retour : prêt physique clôturé, remis au premier de la file s'il y en a un
+                circulation.close_loans(doc.id)
+                handed_off = reservation_queue.hand_off([doc.id], datetime.utcnow(), RESERVATION_HOLD_DAYS) > 0
+                doc.status = 'reserve' if handed_off else 'disponible'
+            elif new_physical_status != 'reserve':
+                doc.status = new_physical_status # Appliquer le nouveau statut
         elif not doc.is_physical:
+            if original_physical_status is not None:
+                reservations_cancelled_count = reservation_queue.cancel_all(doc.id)
             doc.status = 'disponible' # Optionnel : reset si devient non-physique
 
         # Sauvegarde DB
         try:
+            search_index.index_document(doc) # Mise à jour index recherche (même transaction)
+            stats.invalidate() # Formats/statut/réservations modifiés : recalcul complet des stats
             db.session.commit() # Commit modifs sur doc et réservations
+            catalogue_retriever.upsert(doc)
             # Suppression ancien fichier image après commit réussi
             if delete_old_cover and old_cover_filename:
-                try: os.remove(os.path.join(COVER_UPLOAD_FOLDER, old_cover_filename)); print(f"Ancienne img supprimée: {old_cover_filename}")
-                except OSError as e: print(f"Err suppr img {old_cover_filename}: {e}")
+                covers.delete_cover(COVER_UPLOAD_FOLDER, old_cover_filename); log.info("Ancienne image supprimée: %s", old_cover_filename)
 
             flash_message = f"Document '{doc.title}' modifié."
+            if handed_off: flash_message += " Mis de côté pour le premier membre de la file d'attente."
             if reservations_cancelled_count > 0:
                 flash_message += f" {reservations_cancelled_count} réservation(s) annulée(s)."
                 flash(flash_message, "warning")
             else: flash(flash_message, "success")
             return redirect(url_for('document_detail', doc_id=doc.id))
         except Exception as e:
-            db.session.rollback(); flash(f"Erreur modification DB: {e}", "danger"); print(f"Erreur DB modif: {e}")
+            db.session.rollback(); flash(f"Erreur modification DB: {e}", "danger"); log.exception("Erreur DB modification document %s", doc_id)
 
     # Méthode GET
     return render_template('edit_document.html', doc=doc)
@@ -392,17 +627,20 @@ def delete_document(doc_id):
     doc = Document.query.get_or_404(doc_id); title = doc.title; cover = doc.cover_image_filename; pdf = doc.file_path
     try:
         # Suppression DB (cascade gère prêts/résas)
+        search_index.remove_document(doc.id)
+        stats.invalidate()
         db.session.delete(doc); db.session.commit()
+        catalogue_retriever.remove(doc_id)
+        fragment_cache.invalidate(doc_id) # Libère ses fragments dans ce processus
         # Suppression fichiers après succès DB
         if cover:
-            try: os.remove(os.path.join(COVER_UPLOAD_FOLDER, cover)); print(f"Img supprimée: {cover}")
-            except OSError as e: print(f"Err suppr img {cover}: {e}")
+            covers.delete_cover(COVER_UPLOAD_FOLDER, cover); log.info("Image supprimée: %s", cover)
         if pdf:
-            try: os.remove(os.path.join(PDF_UPLOAD_FOLDER, pdf)); print(f"PDF supprimé: {pdf}")
-            except OSError as e: print(f"Err suppr pdf {pdf}: {e}")
+            try: os.remove(os.path.join(PDF_UPLOAD_FOLDER, pdf)); log.info("PDF supprimé: %s", pdf)
+            except OSError as e: log.warning("Err suppr pdf %s: %s", pdf, e)
         flash(f"Document '{title}' supprimé.", "success")
     except Exception as e:
-        db.session.rollback(); flash(f"Erreur suppression: {e}", "danger"); print(f"Erreur DB suppr: {e}")
+        db.session.rollback(); flash(f"Erreur suppression: {e}", "danger"); log.exception("Erreur DB suppression document %s", doc_id)
     return redirect(url_for('catalogue'))
 # --- Fin Route Suppression Document ---
 
@@ -411,46 +649,86 @@ def delete_document(doc_id):
 @app.route('/record_loan', methods=['POST'])
 def record_loan():
     if session.get('user_role') != 'prepose': flash("Accès non autorisé.", "danger"); return redirect(url_for('dashboard'))
-    doc_id_str = request.form.get('document_id'); member_id = request.form.get('member_id') # Récupérer ID membre aussi
-    if not doc_id_str: flash("ID document requis.", "warning"); return redirect(url_for('dashboard'))
-    if not member_id: flash("ID membre requis.", "warning"); return redirect(url_for('dashboard')) # Valider membre
+    doc_scan = request.form.get('document_id'); member_scan = request.form.get('member_id') # Code-barres / n° de carte (ou ID / nom d'utilisateur)
+    if not doc_scan: flash("ID document requis.", "warning"); return redirect(url_for('dashboard'))
+    if not member_scan: flash("ID membre requis.", "warning"); return redirect(url_for('dashboard')) # Valider membre
     try:
-        doc_id = int(doc_id_str)
-        doc = Document.query.get(doc_id)
-        # Vérifier existence membre (simpliste)
-        member = User.query.filter_by(username=member_id, role='membre').first() # Ou rechercher par un ID membre numérique
-        if not member: flash(f"Membre ID '{member_id}' non trouvé.", "warning"); return redirect(url_for('dashboard'))
-
+        member = circulation.find_member(member_scan)
+        if not member: flash(f"Membre ID '{member_scan}' non trouvé.", "warning"); return redirect(url_for('dashboard'))
+        doc = circulation.find_document(doc_scan)
         if doc and doc.is_physical:
-            if doc.status == 'disponible':
-                doc.status = 'emprunte'; db.session.commit()
-                # NOTE: Idéalement, créer un enregistrement de prêt physique ici aussi
-                flash(f"Doc '{doc.title}' prêté à {member_id}.", "success")
-            else: flash(f"Doc '{doc.title}' non dispo.", "warning")
+            # Transition conditionnelle en base : deux postes scannant le même exemplaire -> un seul prêt
+            ok, result = circulation.checkout(doc, member, PHYSICAL_LOAN_DURATION)
+            if ok:
+                db.session.commit()
+                flash(f"Doc '{doc.title}' prêté à {member.username} jusqu'au {result.due_date.strftime('%d/%m/%Y')}.", "success")
+            else:
+                db.session.rollback()
+                if result == 'reserved_for_other': flash(f"Doc '{doc.title}' mis de côté pour un autre membre.", "warning")
+                else: flash(f"Doc '{doc.title}' non dispo.", "warning")
         elif doc: flash("Pour docs physiques.", "warning")
-        else: flash(f"Doc ID {doc_id} non trouvé.", "danger")
-    except ValueError: flash("ID invalide.", "danger")
-    except Exception as e: db.session.rollback(); flash(f"Erreur prêt: {e}", "danger"); print(f"Err prêt physique: {e}")
+        else: flash(f"Doc '{doc_scan}' non trouvé.", "danger")
+    except Exception as e: db.session.rollback(); flash(f"Erreur prêt: {e}", "danger"); log.exception("Err prêt physique")
     return redirect(url_for('dashboard'))
 
 @app.route('/record_return', methods=['POST'])
 def record_return():
     if session.get('user_role') != 'prepose': flash("Accès non autorisé.", "danger"); return redirect(url_for('dashboard'))
-    doc_id_str = request.form.get('document_id')
-    if not doc_id_str: flash("ID document requis.", "warning"); return redirect(url_for('dashboard'))
+    doc_scan = request.form.get('document_id')
+    if not doc_scan: flash("ID document requis.", "warning"); return redirect(url_for('dashboard'))
     try:
-        doc_id = int(doc_id_str)
-        doc = Document.query.get(doc_id)
+        doc = circulation.find_document(doc_scan)
         if doc and doc.is_physical:
-            if doc.status == 'emprunte':
-                doc.status = 'disponible'; db.session.commit()
-                # NOTE: Logique pour notifier la prochaine personne en réservation ici
-                flash(f"Doc '{doc.title}' retourné.", "success")
-            else: flash(f"Doc '{doc.title}' non emprunté.", "warning")
+            # Retour + clôture du prêt + remise au premier de la file : une seule transaction
+            new_status = circulation.checkin(doc, RESERVATION_HOLD_DAYS)
+            if new_status is None: db.session.rollback(); flash(f"Doc '{doc.title}' non emprunté.", "warning")
+            else:
+                db.session.commit()
+                if new_status == 'reserve': flash(f"Doc '{doc.title}' retourné et mis de côté pour le prochain membre en file.", "success")
+                else: flash(f"Doc '{doc.title}' retourné.", "success")
         elif doc: flash("Pour docs physiques.", "warning")
-        else: flash(f"Doc ID {doc_id} non trouvé.", "danger")
-    except ValueError: flash("ID invalide.", "danger")
-    except Exception as e: db.session.rollback(); flash(f"Erreur retour: {e}", "danger"); print(f"Err retour physique: {e}")
+        else: flash(f"Doc '{doc_scan}' non trouvé.", "danger")
+    except Exception as e: db.session.rollback(); flash(f"Erreur retour: {e}", "danger"); log.exception("Err retour physique")
+    return redirect(url_for('dashboard'))
+@app.route('/circulation/batch', methods=['POST'])
+@route_query_budget(6 * CIRCULATION_BATCH_MAX + 10) # Coût constant par document (lookups groupés)
+def circulation_batch():
+    """Prêts ou retours d'une série de scans en une seule transaction, résultat par document (JSON ou formulaire)."""
+    wants_json = request.is_json
+    def fail(message, status=400):
+        if wants_json: return jsonify({'error': message}), status
+        flash(message, "danger" if status == 403 else "warning"); return redirect(url_for('dashboard'))
+    if session.get('user_role') != 'prepose': return fail("Accès non autorisé.", 403)
+    if wants_json:
+        data = request.get_json(silent=True) or {}
+        action, member_scan, scans = data.get('action'), data.get('member_id'), data.get('document_ids') or []
+        if not isinstance(scans, list) or not all(isinstance(scan, (str, int)) for scan in scans): return fail("document_ids : liste attendue.")
+        scans = [str(scan).strip() for scan in scans if str(scan).strip()]
+    else:
+        action, member_scan = request.form.get('action'), request.form.get('member_id')
+        scans = [scan for scan in re.split(r'[\s,;]+', request.form.get('document_ids', '')) if scan] # Un scan par ligne
+    if action not in ('loan', 'return'): return fail("Action invalide (loan ou return).")
+    if not scans: return fail("Aucun document scanné.")
+    if len(scans) > CIRCULATION_BATCH_MAX: return fail(f"Trop de documents ({len(scans)} > {CIRCULATION_BATCH_MAX}).")
+    member = None
+    if action == 'loan':
+        if not member_scan: return fail("ID membre requis.")
+        member = circulation.find_member(member_scan)
+        if not member: return fail(f"Membre ID '{member_scan}' non trouvé.")
+    try:
+        # Un seul commit (un fsync) pour tout le lot ; un élément en échec n'écrit rien
+        results = circulation.process_batch(action, scans, member, PHYSICAL_LOAN_DURATION, RESERVATION_HOLD_DAYS)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback(); log.exception("Err lot circulation")
+        return fail(f"Erreur lot ({action}) : {e}", 500)
+    succeeded = sum(1 for result in results if result['ok'])
+    if wants_json:
+        return jsonify({'action': action, 'succeeded': succeeded, 'failed': len(results) - succeeded, 'results': results})
+    label = "prêt(s)" if action == 'loan' else "retour(s)"
+    flash(f"{succeeded} {label} enregistré(s) sur {len(results)}.", "success" if succeeded == len(results) else "warning")
+    failures = [f"{result['scan']} : {result['message']}" for result in results if not result['ok']]
+    if failures: flash("Échecs — " + " ; ".join(failures), "warning")
     return redirect(url_for('dashboard'))
 # --- Fin Routes Prêt/Retour Physique ---
 
@@ -468,12 +746,12 @@ def borrow_digital(doc_id):
         existing_loan = Loan.query.filter_by(user_id=user_id, document_id=doc_id, status='active').first()
         if existing_loan: flash(f"'{doc.title}' déjà emprunté.", "info"); return redirect(url_for('document_detail', doc_id=doc_id))
         full_file_path = os.path.join(PDF_UPLOAD_FOLDER, doc.file_path)
-        if not os.path.exists(full_file_path): flash("Fichier serveur manquant.", "danger"); print(f"Err Fichier Manquant: {full_file_path}"); return redirect(url_for('document_detail', doc_id=doc_id))
+        if not os.path.exists(full_file_path): flash("Fichier serveur manquant.", "danger"); log.error("Fichier PDF manquant: %s", full_file_path); return redirect(url_for('document_detail', doc_id=doc_id))
         loan_date = datetime.utcnow(); due_date = loan_date + timedelta(days=DIGITAL_LOAN_DURATION)
         new_loan = Loan(user_id=user_id, document_id=doc_id, loan_date=loan_date, due_date=due_date, status='active')
-        db.session.add(new_loan); db.session.commit()
+        db.session.add(new_loan); stats.bump(active_digital_loans=1); db.session.commit()
         flash(f"'{doc.title}' emprunté jusqu'au {due_date.strftime('%d/%m/%Y')}.", "success")
-    except Exception as e: db.session.rollback(); flash(f"Erreur emprunt: {e}", "danger"); print(f"Err emprunt num: {e}")
+    except Exception as e: db.session.rollback(); flash(f"Erreur emprunt: {e}", "danger"); log.exception("Err emprunt numérique")
     return redirect(url_for('dashboard'))
 
 @app.route('/reserve_document/<int:doc_id>', methods=['POST'])
@@ -484,44 +762,60 @@ def reserve_document(doc_id):
     try:
         doc = Document.query.get_or_404(doc_id)
         if not doc.is_physical: flash("Résa pour docs physiques.", "warning"); return redirect(url_for('document_detail', doc_id=doc_id))
-        existing_res = Reservation.query.filter_by(user_id=user_id, document_id=doc_id, status='active').first()
+        existing_res = reservation_queue.open_reservation(user_id, doc_id).first()
         if existing_res: flash(f"'{doc.title}' déjà réservé.", "info"); return redirect(url_for('document_detail', doc_id=doc_id))
-        if doc.status == 'emprunte':
-            new_res = Reservation(user_id=user_id, document_id=doc_id); db.session.add(new_res); db.session.commit()
-            flash(f"'{doc.title}' réservé.", "success")
+        if doc.status in ('emprunte', 'reserve'):
+            # Numéro de passage calculé dans l'INSERT (fin de file)
+            new_res = reservation_queue.enqueue(user_id, doc_id)
+            stats.bump(active_reservations=1); db.session.commit()
+            flash(f"'{doc.title}' réservé (position {reservation_queue.position(new_res)} dans la file).", "success")
         elif doc.status == 'disponible': flash(f"'{doc.title}' est disponible.", "info")
         else: flash(f"'{doc.title}' non réservable ({doc.status}).", "warning")
-    except Exception as e: db.session.rollback(); flash(f"Erreur résa: {e}", "danger"); print(f"Err résa physique: {e}")
+    except Exception as e: db.session.rollback(); flash(f"Erreur résa: {e}", "danger"); log.exception("Err réservation physique")
     return redirect(url_for('document_detail', doc_id=doc_id))
 
 @app.route('/access_document/<int:loan_id>')
 def access_document(loan_id):
+    """Vérifie le prêt (base) puis redirige vers une URL signée courte ; les requêtes Range du lecteur PDF n'y touchent plus."""
     if 'user_id' not in session: abort(401)
     user_id = session['user_id']
     try:
-        loan = Loan.query.get_or_404(loan_id)
+        loan = Loan.query.options(joinedload(Loan.document)).get_or_404(loan_id)
         if loan.user_id != user_id: abort(403)
         if loan.status != 'active': flash("Prêt inactif.", "warning"); return redirect(url_for('dashboard'))
-        if datetime.utcnow() > loan.due_date: loan.status = 'expired'; db.session.commit(); flash("Prêt terminé.", "warning"); return redirect(url_for('dashboard'))
+        if datetime.utcnow() > loan.due_date: loan.status = 'expired'; stats.bump(active_digital_loans=-1); db.session.commit(); flash("Prêt terminé.", "warning"); return redirect(url_for('dashboard'))
         doc = loan.document
         if not doc or not doc.file_path: abort(404)
-        file_path_in_db = doc.file_path
-        if '..' in file_path_in_db or file_path_in_db.startswith('/'): abort(400)
-        return send_from_directory(PDF_UPLOAD_FOLDER, file_path_in_db, as_attachment=False)
-    except FileNotFoundError: print(f"ERREUR: Fichier non trouvé! Loan {loan_id}, Path: {file_path_in_db}"); abort(404)
-    except Exception as e: flash(f"Erreur accès doc: {e}", "danger"); print(f"Err Accès Doc {loan_id}: {e}"); return redirect(url_for('dashboard'))
+        if not pdf_delivery.is_safe_filename(doc.file_path): abort(400)
+        token = pdf_delivery.make_token(app.secret_key, loan.id, user_id, doc.file_path, loan.due_date)
+        return redirect(url_for('loan_pdf', token=token))
+    except Exception as e:
+        if isinstance(e, HTTPException): raise # abort() : code HTTP conservé
+        flash(f"Erreur accès doc: {e}", "danger"); log.exception("Err accès doc (prêt %s)", loan_id); return redirect(url_for('dashboard'))
+
+@app.route('/pdf/<token>')
+def loan_pdf(token):
+    """Sert le PDF d'un prêt à partir de l'URL signée seule (aucune requête SQL) : Range/206, ETag, Last-Modified."""
+    claims = pdf_delivery.load_token(app.secret_key, token, app.config['PDF_URL_TTL'])
+    if claims is None: abort(403) # Signature invalide, URL expirée ou prêt échu : repasser par /access_document
+    if session.get('user_id') != claims['u']: abort(403) # URL liée à la session de l'emprunteur
+    try:
+        return pdf_delivery.pdf_response(PDF_UPLOAD_FOLDER, claims['f'], mode=app.config['PDF_DELIVERY_MODE'],
+                                         accel_prefix=app.config['PDF_ACCEL_PREFIX'],
+                                         max_age=pdf_delivery.seconds_left(claims, app.config['PDF_URL_TTL']))
+    except FileNotFoundError: log.error("Fichier PDF non trouvé (prêt %s): %s", claims['l'], claims['f']); abort(404)
 
 @app.route('/return_digital/<int:loan_id>', methods=['POST'])
 def return_digital(loan_id):
     if 'user_id' not in session: flash("Connectez-vous.", "warning"); return redirect(url_for('login'))
     user_id = session['user_id']
     try:
-        loan = Loan.query.get_or_404(loan_id)
+        loan = Loan.query.options(joinedload(Loan.document)).get_or_404(loan_id)
         if loan.user_id != user_id: flash("Action non autorisée.", "danger"); return redirect(url_for('dashboard'))
         if loan.status != 'active': flash("Prêt déjà inactif.", "info"); return redirect(url_for('dashboard'))
-        loan.status = 'returned'; db.session.commit()
+        loan.status = 'returned'; stats.bump(active_digital_loans=-1); db.session.commit()
         flash(f"'{loan.document.title}' retourné.", "success")
-    except Exception as e: db.session.rollback(); flash(f"Erreur retour: {e}", "danger"); print(f"Err DB Retour Num: {e}")
+    except Exception as e: db.session.rollback(); flash(f"Erreur retour: {e}", "danger"); log.exception("Err DB retour numérique")
     return redirect(url_for('dashboard'))
 
 @app.route('/cancel_reservation/<int:reservation_id>', methods=['POST'])
@@ -529,12 +823,15 @@ def cancel_reservation(reservation_id):
     if 'user_id' not in session: flash("Connectez-vous.", "warning"); return redirect(url_for('login'))
     user_id = session['user_id']
     try:
-        res = Reservation.query.get_or_404(reservation_id)
+        res = Reservation.query.options(joinedload(Reservation.document)).get_or_404(reservation_id)
         if res.user_id != user_id: flash("Action non autorisée.", "danger"); return redirect(url_for('dashboard'))
-        if res.status != 'active': flash("Réservation déjà inactive.", "info"); return redirect(url_for('dashboard'))
-        res.status = 'cancelled'; db.session.commit()
+        if res.status not in reservation_queue.OPEN_STATUSES: flash("Réservation déjà inactive.", "info"); return redirect(url_for('dashboard'))
+        was_held = res.status == 'ready'
+        res.status = 'cancelled'; stats.bump(active_reservations=-1)
+        if was_held: db.session.flush(); reservation_queue.release_hold(res.document_id, RESERVATION_HOLD_DAYS) # Au suivant de la file
+        db.session.commit()
         flash(f"Réservation pour '{res.document.title}' annulée.", "success")
-    except Exception as e: db.session.rollback(); flash(f"Erreur annulation: {e}", "danger"); print(f"Err DB Annul Résa: {e}")
+    except Exception as e: db.session.rollback(); flash(f"Erreur annulation: {e}", "danger"); log.exception("Err DB annulation réservation")
     return redirect(url_for('dashboard'))
 
 @app.route('/pay_fine_simulated/<int:doc_id>', methods=['POST'])
@@ -542,12 +839,12 @@ def pay_fine_simulated(doc_id):
     if 'user_id' not in session: flash("Connectez-vous.", "warning"); return redirect(url_for('login'))
     doc = Document.query.get(doc_id); doc_title = f" (lié à '{doc.title}')" if doc else ""
     flash(f"Paiement amende simulé traité{doc_title}.", "success")
-    print(f"--- Sim Pmt Amende --- User: {session['user_id']}, Doc: {doc_id} ---")
+    log.info("Simulation paiement amende (doc %s)", doc_id)
     return redirect(url_for('document_detail', doc_id=doc_id))
 # --- Fin Routes Actions Membre ---
 
 # app.py
-# ... imports (generate_password_hash, check_password_hash, datetime, timedelta) ...
+# ... imports (password_service, datetime, timedelta) ...
 
 # --- NOUVELLE ROUTE : Inscription Membre ---
 @app.route('/register', methods=['GET', 'POST'])
@@ -581,7 +878,11 @@ def register():
             return redirect(url_for('register'))
 
         # Hacher le mot de passe
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = password_service.hash(password)
+        except passwords.HashingBusy:
+            flash("Service très sollicité, veuillez réessayer dans un instant.", "warning")
+            return redirect(url_for('register'))
 
         # Créer l'utilisateur avec statut 'pending'
         try:
@@ -593,9 +894,11 @@ def register():
                 subscription_status='pending', # En attente de paiement
                 subscription_type=subscription_type
             )
-            db.session.add(new_user)
+            db.session.add(new_user); db.session.flush() # ID pour le n° de carte
+            new_user.member_number = circulation.member_number(new_user.id)
+            stats.bump(total_members=1)
             db.session.commit()
-            print(f"Utilisateur {username} créé (ID: {new_user.id}) avec statut pending.")
+            log.info("Utilisateur %s créé (ID: %s) avec statut pending.", username, new_user.id)
 
             # Préparer les détails pour la page de paiement
             plan_details = {
@@ -613,7 +916,7 @@ def register():
         except Exception as e:
             db.session.rollback()
             flash(f"Erreur lors de la création du compte : {e}", "danger")
-            print(f"Erreur DB inscription: {e}")
+            log.exception("Erreur DB inscription")
             return redirect(url_for('register'))
 
     # Méthode GET : afficher le formulaire
@@ -658,18 +961,20 @@ def process_simulated_payment():
         user.subscription_status = 'active'
         user.subscription_start_date = start_date
         user.subscription_end_date = end_date
+        stats.bump(active_members=1)
 
         db.session.commit()
+        identity_cache.invalidate(user.id)
 
         # Log serveur (SANS données sensibles)
-        print(f"SIMULATION PAIEMENT: Activation {subscription_type} pour User ID {user_id}. Données carte reçues mais ignorées.")
+        log.info("Simulation paiement : activation %s pour l'utilisateur %s (données carte ignorées).", subscription_type, user_id)
         flash("Paiement (simulé) accepté ! Votre compte est activé. Veuillez vous connecter.", "success")
         return redirect(url_for('login'))
 
     except Exception as e:
         db.session.rollback()
         flash(f"Erreur lors de l'activation du compte : {e}", "danger")
-        print(f"Erreur DB activation compte post-sim-payment: {e}")
+        log.exception("Erreur DB activation compte après paiement simulé")
         return redirect(url_for('register'))
 # --- FIN ROUTE PAIEMENT SIMULÉ ---
 
@@ -703,7 +1008,11 @@ def create_staff_user():
         return redirect(url_for('dashboard'))
 
     # Hacher le mot de passe
-    hashed_password = generate_password_hash(password)
+    try:
+        hashed_password = password_service.hash(password)
+    except passwords.HashingBusy:
+        flash("Service très sollicité, veuillez réessayer dans un instant.", "warning")
+        return redirect(url_for('dashboard'))
 
     # Créer l'utilisateur
     try:
@@ -717,12 +1026,13 @@ def create_staff_user():
             subscription_type='none'
         )
         db.session.add(new_staff)
+        stats.bump(total_staff=1)
         db.session.commit()
         flash(f"Compte {role} '{username}' créé avec succès.", "success")
     except Exception as e:
         db.session.rollback()
         flash(f"Erreur lors de la création du compte : {e}", "danger")
-        print(f"Erreur DB création staff: {e}")
+        log.exception("Erreur DB création staff")
 
     return redirect(url_for('dashboard'))
 # --- FIN ROUTE Création Personnel ---
@@ -753,94 +1063,258 @@ def delete_user(user_id):
     try:
         # 5. Supprimer l'utilisateur (cascade devrait gérer prêts/résas)
         db.session.delete(user_to_delete)
+        stats.invalidate() # Prêts/réservations supprimés en cascade
         db.session.commit()
+        identity_cache.invalidate(user_id)
         flash(f"Utilisateur '{username_deleted}' (Rôle: {role_deleted}) supprimé avec succès.", "success")
-        print(f"Utilisateur ID {user_id} ({username_deleted}) supprimé par Gérant ID {session.get('user_id')}")
+        log.info("Utilisateur ID %s (%s) supprimé par le gérant", user_id, username_deleted)
 
     except Exception as e:
         db.session.rollback()
         flash(f"Erreur lors de la suppression de l'utilisateur : {e}", "danger")
-        print(f"Erreur DB suppression utilisateur {user_id}: {e}")
+        log.exception("Erreur DB suppression utilisateur %s", user_id)
 
     # 6. Rediriger vers le tableau de bord gérant
     return redirect(url_for('dashboard'))
 # --- FIN NOUVELLE ROUTE Suppression Utilisateur ---
 
+# --- Route Rafraîchissement Statistiques (Gérant) ---
+@app.route('/refresh_stats', methods=['POST'])
+def refresh_stats():
+    if session.get('user_role') != 'gerant':
+        flash("Action non autorisée.", "danger")
+        return redirect(url_for('dashboard'))
+    try:
+        stats.refresh_snapshot()
+        flash("Statistiques recalculées.", "success")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Erreur lors du calcul des statistiques : {e}", "danger")
+        log.exception("Erreur DB rafraîchissement stats")
+    return redirect(url_for('dashboard'))
+# --- FIN Route Rafraîchissement Statistiques ---
+
 # app.py
 # ... (imports: Flask, jsonify, request, session, openai, os) ...
 # ... (config, chargement clé API, routes existantes) ...
 
 # --- NOUVELLE ROUTE : Endpoint pour le Chatbot IA ---
-@app.route('/chat', methods=['POST'])
-def chat():
+# Appels au modèle dans un pool borné (chat_service) : les workers ne font qu'attendre le résultat
+chat_service = ChatService(on_upstream=request_metrics.observe_chat_upstream)
+# Cache des réponses (questions quasi identiques) ; CHAT_CACHE_PATH = fichier SQLite partagé entre workers
+chat_cache = ChatResponseCache(max_entries=int(os.getenv('CHAT_CACHE_SIZE', 1000)),
+                               ttl=int(os.getenv('CHAT_CACHE_TTL', 86400)),
+                               path=os.getenv('CHAT_CACHE_PATH') or None)
+# Documents cités dans le message -> extrait catalogue (statut en direct) ajouté au prompt ; index construit puis
+# synchronisé (delta id/version) par un thread de fond, jamais dans une requête
+catalogue_retriever = CatalogueRetriever(sync_interval=int(os.getenv('CHAT_CATALOGUE_SYNC_INTERVAL', 30)))
+if openai.api_key:
+    catalogue_retriever.start(app)
+
+def _chat_context(user_message):
+    """Extrait catalogue pour le message + version de cache (le contexte fait partie de la clé)."""
+    try:
+        catalogue_context = catalogue_retriever.context_for(user_message)
+    except Exception as e:
+        log.exception("[Chatbot] Recherche catalogue impossible")
+        catalogue_context = ''
+    if not catalogue_context:
+        return '', PROMPT_VERSION
+    return catalogue_context, PROMPT_VERSION + ':' + hashlib.sha1(catalogue_context.encode('utf-8')).hexdigest()[:12]
+
+def _read_chat_message():
+    """Valide le JSON reçu ; retourne (message, None) ou (None, réponse d'erreur)."""
     if not openai.api_key:
-        return jsonify({"reply": "Configuration de l'assistant IA manquante."}), 503
-
-    data = request.json
+        return None, (jsonify({"reply": "Configuration de l'assistant IA manquante."}), 503)
+    data = request.get_json(silent=True)
     if not data or 'message' not in data:
-        return jsonify({"reply": "Aucun message reçu."}), 400
-    user_message = data['message'].strip()
+        return None, (jsonify({"reply": "Aucun message reçu."}), 400)
+    user_message = str(data['message']).strip()
     if not user_message:
-        return jsonify({"reply": "Message vide reçu."}), 400
-
-    print(f"[Chatbot Request] Message reçu : '{user_message}'")
+        return None, (jsonify({"reply": "Message vide reçu."}), 400)
+    return user_message, None
+
+def _chat_error_reply(e):
+    """Message utilisateur + code HTTP pour une erreur d'appel au modèle."""
+    if isinstance(e, ChatBusy):
+        log.warning("[Chatbot] Pool et file d'attente pleins, demande refusée.", extra={'event': 'chat.busy'})
+        return "L'assistant est très sollicité, veuillez réessayer dans un moment.", 503
+    if isinstance(e, openai.AuthenticationError):
+        log.error("[Chatbot] Erreur authentification OpenAI: %s", e)
+        return "Erreur de configuration de l'assistant IA (clé API).", 500
+    if isinstance(e, openai.RateLimitError):
+        log.warning("[Chatbot] Limite de taux OpenAI atteinte: %s", e)
+        return "L'assistant est très sollicité, veuillez réessayer dans un moment.", 429
+    if isinstance(e, (openai.APITimeoutError, TimeoutError, queue.Empty)):
+        log.warning("[Chatbot] Timeout API OpenAI: %s", e, extra={'event': 'chat.timeout'})
+        return "L'assistant IA met trop de temps à répondre, veuillez réessayer.", 504 # Gateway Timeout
+    log.error("[Chatbot] Erreur inattendue lors de l'appel OpenAI", exc_info=e)
+    return "Désolé, une erreur est survenue en contactant l'assistant IA.", 500
 
-    # --- Logique d'interaction avec OpenAI ---
+@app.route('/chat', methods=['POST'])
+@route_rate_limit('chat')
+def chat():
+    user_message, error_response = _read_chat_message()
+    if error_response:
+        return error_response
+
+    log.info("[Chatbot] Message reçu", extra={'event': 'chat.request', 'chars': len(user_message)})
+    catalogue_context, cache_version = _chat_context(user_message)
+    cached_reply = chat_cache.get(user_message, cache_version)
+    if cached_reply is not None:
+        log.info("[Chatbot] Réponse servie depuis le cache.", extra={'event': 'chat.cache_hit'})
+        return jsonify({"reply": cached_reply})
     try:
-        # 1. Définir le contexte/prompt système (À ADAPTER !)
-        system_prompt = """
-        Tu es BiblioBot IA, un assistant virtuel pour la bibliothèque BiblioTech IA.
-        Réponds aux questions des utilisateurs de manière concise et amicale, en français.
-        Tes connaissances incluent :
-        - Horaires : 9h à 18h, lundi au samedi.
-        - Recherche : Utiliser la barre de recherche du catalogue.
-        - Prêts numériques : 14 jours.
-        - Réservations physiques : Possible si livre emprunté.
-        - Pour les questions sur la disponibilité d'un livre spécifique ou sur le compte utilisateur, explique que tu ne peux pas accéder à ces informations en temps réel et qu'il faut consulter le catalogue ou le tableau de bord.
-        - Refuse poliment les questions hors sujet de la bibliothèque.
-        """
-        # 2. Choisir le modèle
-        model_engine = "gpt-3.5-turbo" # Bon point de départ
-
-        # 3. Faire l'appel API
-        print(f"[Chatbot Request] Appel à OpenAI avec model={model_engine}...")
-        completion = openai.chat.completions.create(
-            model=model_engine,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            max_tokens=150,  # Limiter la réponse pour la vitesse et le coût
-            temperature=0.7, # Contrôle la créativité (0 = déterministe, >1 = très créatif)
-            n=1,             # Demander une seule réponse
-            stop=None        # Pas de séquence d'arrêt spécifique
-        )
-
-        # 4. Extraire la réponse texte
-        # La structure de la réponse peut légèrement varier, mais c'est souvent ceci :
-        bot_reply = completion.choices[0].message.content.strip()
-
-        print(f"[Chatbot Response] Réponse OpenAI reçue: '{bot_reply}'")
-
-        # 5. Renvoyer la réponse au format JSON
+        bot_reply = chat_service.complete(user_message, catalogue_context)
+        log.info("[Chatbot] Réponse reçue du modèle", extra={'event': 'chat.reply', 'model': MODEL_ENGINE, 'chars': len(bot_reply or '')})
+        if bot_reply:
+            chat_cache.put(user_message, cache_version, bot_reply)
         return jsonify({"reply": bot_reply})
-
-    # --- Gestion des erreurs OpenAI spécifiques et génériques ---
-    except openai.AuthenticationError as e:
-        print(f"[Chatbot Error] Erreur authentification OpenAI: {e}")
-        return jsonify({"reply": "Erreur de configuration de l'assistant IA (clé API)."}), 500
-    except openai.RateLimitError as e:
-        print(f"[Chatbot Error] Limite de taux OpenAI atteinte: {e}")
-        return jsonify({"reply": "L'assistant est très sollicité, veuillez réessayer dans un moment."}), 429
-    except openai.APITimeoutError as e:
-         print(f"[Chatbot Error] Timeout API OpenAI: {e}")
-         return jsonify({"reply": "L'assistant IA met trop de temps à répondre, veuillez réessayer."}), 504 # Gateway Timeout
     except Exception as e:
-        print(f"[Chatbot Error] Erreur inattendue lors de l'appel OpenAI : {e}")
-        # Log l'erreur complète pour le debug serveur si besoin: import traceback; traceback.print_exc()
-        return jsonify({"reply": "Désolé, une erreur est survenue en contactant l'assistant IA."}), 500
+        reply, status = _chat_error_reply(e)
+        return jsonify({"reply": reply}), status
+
+@app.route('/chat/stream', methods=['POST'])
+@route_rate_limit('chat')
+def chat_stream():
+    """Variante streamée de /chat : fragments envoyés en Server-Sent Events (token / done / error)."""
+    user_message, error_response = _read_chat_message()
+    if error_response:
+        return error_response
+
+    log.info("[Chatbot] Message reçu (stream)", extra={'event': 'chat.request', 'chars': len(user_message)})
+    sse_headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'} # Pas de tampon proxy
+    catalogue_context, cache_version = _chat_context(user_message)
+    cached_reply = chat_cache.get(user_message, cache_version)
+    if cached_reply is not None:
+        log.info("[Chatbot] Réponse servie depuis le cache.", extra={'event': 'chat.cache_hit'})
+        return Response(sse_event({"token": cached_reply}) + sse_event({}, event='done'),
+                        mimetype='text/event-stream', headers=sse_headers)
+    try:
+        chunks = chat_service.stream(user_message, catalogue_context)
+    except ChatBusy as e:
+        reply, status = _chat_error_reply(e)
+        return jsonify({"reply": reply}), status
+
+    def generate():
+        try:
+            reply_parts = []
+            for text_chunk in chunks:
+                reply_parts.append(text_chunk)
+                yield sse_event({"token": text_chunk})
+            bot_reply = ''.join(reply_parts).strip()
+            if bot_reply:
+                chat_cache.put(user_message, cache_version, bot_reply)
+            yield sse_event({}, event='done')
+        except Exception as e:
+            reply, _ = _chat_error_reply(e)
+            yield sse_event({"reply": reply}, event='error')
+
+    response = Response(generate(), mimetype='text/event-stream', headers=sse_headers)
+    response.call_on_close(chunks.cancel) # Fin ou déconnexion du client (même avant le premier fragment)
+    return response
+
+@app.route('/chat/cache_stats')
+def chat_cache_stats():
+    """Compteurs succès/échecs du cache des réponses (gérant)."""
+    if session.get('user_role') != 'gerant': abort(403)
+    return jsonify(chat_cache.stats())
 # --- FIN ROUTE /chat ---
 
+# --- Route Métriques (Prometheus) ---
+@app.route('/metrics')
+def metrics():
+    """Métriques au format d'exposition Prometheus (agrégées entre workers via METRICS_PATH)."""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}": abort(401)
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4', headers={'Cache-Control': 'no-store'})
+# --- Fin Route Métriques ---
+
+# --- Commandes CLI (flask --app app <commande>) ---
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Reconstruit l'index plein texte du catalogue (bases existantes)."""
+    count = search_index.rebuild_index()
+    print(f"Index de recherche reconstruit : {count} document(s) indexé(s).")
+
+@app.cli.command('import-catalogue')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None, help="Déduit de l'extension par défaut.")
+@click.option('--batch-size', default=1000, show_default=True, help="Lignes par transaction.")
+@click.option('--on-duplicate', type=click.Choice(['skip', 'upsert']), default='skip', show_default=True,
+              help="Doublon (code-barres, sinon titre + auteur) : ignoré ou mis à jour.")
+@click.option('--restart', is_flag=True, help="Ignore le point de reprise et repart du début.")
+@click.option('--check-files', is_flag=True, help="Rejette les documents numériques dont le PDF est absent.")
+def import_catalogue_command(path, fmt, batch_size, on_duplicate, restart, check_files):
+    """Importe un catalogue CSV/JSONL en flux (colonnes : title, author, summary, is_physical, is_digital, file_path, barcode, status)."""
+    try:
+        report = catalogue_import.import_catalogue(path, fmt, batch_size, on_duplicate, restart,
+                                                   PDF_UPLOAD_FOLDER if check_files else None)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    print(f"Import terminé en {report['seconds']}s : {report['inserted']} inséré(s), {report['updated']} mis à jour, "
+          f"{report['skipped']} doublon(s) ignoré(s), {report['errors']} ligne(s) invalide(s).")
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Crée les tables manquantes et applique les migrations de schéma (index, colonnes)."""
+    db.create_all()
+    applied = migrations.upgrade()
+    for version, description in applied:
+        print(f"Migration {version} appliquée : {description}")
+    print(f"Schéma à jour (version {migrations.current_version()}).")
+
+@app.cli.command('backfill-covers')
+@click.option('--force', is_flag=True, help="Régénérer aussi les couvertures déjà traitées.")
+def backfill_covers_command(force):
+    """Génère les variantes (carte/détail, WebP + JPEG) des couvertures existantes."""
+    processed, errors = covers.backfill(COVER_UPLOAD_FOLDER, force=force)
+    # Nouvelle version des documents concernés : les fragments en cache (<img> sans variantes) sont re-rendus
+    for start in range(0, len(processed), 500):
+        db.session.execute(
+            update(Document).where(Document.cover_image_filename.in_(processed[start:start + 500]))
+            .values(version=next_version()).execution_options(synchronize_session=False))
+    db.session.commit()
+    print(f"{len(processed)} couverture(s) traitée(s), {errors} erreur(s).")
+
+@app.cli.command('precompress-static')
+@click.option('--force', is_flag=True, help="Régénère aussi les variantes déjà à jour.")
+def precompress_static_command(force):
+    """Génère les variantes .gz/.br des fichiers statiques texte (à lancer au déploiement)."""
+    written = static_assets.precompress(app.static_folder, force=force)
+    print(f"{written} variante(s) précompressée(s) écrite(s)." + ("" if static_assets.brotli else " (brotli non installé : gzip seulement)"))
+
+@app.cli.command('expire-sweep')
+@click.option('--batch-size', default=expiry_sweeper.DEFAULT_BATCH_SIZE, show_default=True, help="Lignes par transaction.")
+def expire_sweep_command(batch_size):
+    """Expire les prêts numériques échus, les abonnements terminés et les mises de côté non retirées (à planifier, ex. cron)."""
+    report = expiry_sweeper.sweep(batch_size, hold_days=RESERVATION_HOLD_DAYS)
+    print(f"{report['loans']} prêt(s), {report['subscriptions']} abonnement(s) et {report['holds']} mise(s) de côté expiré(s) en {report['seconds']}s.")
+
+@app.cli.command('refresh-stats')
+def refresh_stats_command():
+    """Recalcule l'instantané des statistiques du gérant."""
+    snapshot = stats.refresh_snapshot()
+    print(f"Statistiques recalculées ({snapshot.computed_at:%Y-%m-%d %H:%M:%S} UTC).")
+
+@app.cli.command('explain-queries')
+def explain_queries_command():
+    """Affiche le plan SQLite des requêtes chaudes ; code de sortie 1 si l'une parcourt une table entière."""
+    if db.engine.dialect.name != 'sqlite':
+        print("Vérification disponible uniquement pour SQLite."); return
+    missing = migrations.missing_indexes()
+    if missing:
+        print(f"ATTENTION : index manquants ({', '.join(missing)}). Lancez 'flask db-upgrade'.")
+    failures = 0
+    for route, description, plan, ok in query_plans.check_query_plans():
+        print(f"[{'OK' if ok else 'SCAN'}] {route} - {description}")
+        for detail in plan:
+            print(f"       {detail}")
+        failures += 0 if ok else 1
+    if failures:
+        print(f"{failures} requête(s) sans index."); sys.exit(1)
+# --- Fin Commandes CLI ---
+
 # ... (if __name__ == '__main__':) ...
 
 # --- Bloc d'exécution principal ---
@@ -850,6 +1324,8 @@ if __name__ == '__main__':
         # Commentez/décommentez create_all() selon si vous voulez forcer la recréation
         # Attention: supprime les données existantes si vous supprimez le fichier .db
         db.create_all()
+        migrations.upgrade() # Index/colonnes ajoutés depuis la création de la base
+        search_index.create_index()
         print("Tables OK.")
 
         # === Section Données de Test (À ADAPTER/DÉCOMMENTER) ===
@@ -862,14 +1338,16 @@ if __name__ == '__main__':
         if not User.query.first():
            print("Ajout utilisateurs test AVEC MOTS DE PASSE HACHÉS...")
            # Hasher le mot de passe une fois
-           hashed_password_default = generate_password_hash('password')
+           hashed_password_default = password_service.hash('password')
            users = [
                User(username='membre', password=hashed_password_default, role='membre', subscription_status='inactive'), # Ajouter statut par défaut
                User(username='biblio', password=hashed_password_default, role='bibliothecaire', subscription_status='n/a'),
                User(username='prepose', password=hashed_password_default, role='prepose', subscription_status='n/a'),
                User(username='gerant', password=hashed_password_default, role='gerant', subscription_status='n/a')
            ]
-           db.session.add_all(users)
+           db.session.add_all(users); db.session.flush()
+           for user in users:
+               if user.role == 'membre': user.member_number = circulation.member_number(user.id)
            db.session.commit()
            print("Utilisateurs de test ajoutés.")
         else:
@@ -904,7 +1382,7 @@ if __name__ == '__main__':
             # Filtrer pour ne pas ajouter de doc numérique si le fichier manque
             docs_to_add = [d for d in docs if d.is_physical or (d.is_digital and d.file_path)]
             if docs_to_add:
-                 db.session.add_all(docs_to_add); db.session.commit(); print(f"{len(docs_to_add)} documents ajoutés.")
+                 db.session.add_all(docs_to_add); db.session.commit(); search_index.rebuild_index(); print(f"{len(docs_to_add)} documents ajoutés.")
             else: print("Aucun document ajouté (vérifiez fichiers/code).")
         else:
             print("Documents déjà présents.")
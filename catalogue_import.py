@@ -0,0 +1,269 @@
+# catalogue_import.py
+# Import en masse du catalogue (CSV ou JSONL) : lecture en flux (mémoire constante), validation ligne par ligne,
+# insertion par lots (executemany) avec index plein texte, doublons ignorés ou mis à jour, reprise sur point de contrôle.
+from sqlalchemy import select, insert, update
+from models import db, Document, next_version
+import search_index
+import stats
+import csv
+import json
+import os
+import time
+
+# Champs mis à jour en mode upsert : le statut (circulation en cours) n'est jamais écrasé
+UPSERT_FIELDS = ('title', 'author', 'summary', 'is_physical', 'is_digital', 'file_path', 'barcode')
+MAX_LENGTHS = {'title': 200, 'author': 150, 'file_path': 300, 'barcode': 64}
+IMPORT_STATUSES = ('disponible', 'emprunte')
+TRUE_VALUES = {'1', 'true', 'vrai', 'oui', 'yes', 'y', 'o', 'x'}
+FALSE_VALUES = {'0', 'false', 'faux', 'non', 'no', 'n', ''}
+MAX_REPORTED_ERRORS = 20
+
+
+class RowError(ValueError):
+    """Ligne invalide (ignorée et comptée)."""
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise ValueError(f"Format non reconnu pour {path} (utiliser --format csv|jsonl).")
+
+
+def read_records(path, fmt):
+    """Générateur (n° de ligne, dict ou RowError) : une seule ligne en mémoire à la fois."""
+    with open(path, newline='' if fmt == 'csv' else None, encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, RowError(f"JSON invalide ({e.msg})"); continue
+                yield line_no, record if isinstance(record, dict) else RowError("objet JSON attendu")
+
+
+def _parse_bool(value, field):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise RowError(f"{field} : booléen invalide '{value}'")
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def validate(record, pdf_folder=None):
+    """Valeurs prêtes à insérer pour une ligne, ou RowError (mêmes règles que le formulaire d'ajout)."""
+    row = {field: _clean(record.get(field)) for field in ('title', 'author', 'summary', 'file_path', 'barcode', 'status')}
+    row['is_physical'] = _parse_bool(record.get('is_physical'), 'is_physical')
+    row['is_digital'] = _parse_bool(record.get('is_digital'), 'is_digital')
+    if not row['title']:
+        raise RowError("title requis")
+    if not row['is_physical'] and not row['is_digital']:
+        raise RowError("au moins un format requis (is_physical / is_digital)")
+    for field, max_length in MAX_LENGTHS.items():
+        if row[field] and len(row[field]) > max_length:
+            raise RowError(f"{field} trop long ({len(row[field])} > {max_length})")
+    if row['is_digital']:
+        if not row['file_path']:
+            raise RowError("file_path requis pour un document numérique")
+        if os.path.basename(row['file_path']) != row['file_path'] or row['file_path'] in ('.', '..'):
+            raise RowError(f"file_path invalide '{row['file_path']}' (nom de fichier seul attendu)")
+        if pdf_folder and not os.path.exists(os.path.join(pdf_folder, row['file_path'])):
+            raise RowError(f"fichier PDF absent '{row['file_path']}'")
+    else:
+        row['file_path'] = None
+    if not row['is_physical']:
+        row['barcode'] = None
+    status = row['status'] or 'disponible'
+    if status not in IMPORT_STATUSES:
+        raise RowError(f"status invalide '{status}'")
+    row['status'] = status if row['is_physical'] else 'disponible'
+    return row
+
+
+def _key(row):
+    """Identité d'un document : code-barres si présent, sinon (titre, auteur)."""
+    return ('barcode', row['barcode']) if row['barcode'] else ('title', row['title'], row['author'] or '')
+
+
+def _existing_ids(rows):
+    """Ids des documents déjà en base pour les clés du lot (deux requêtes IN sur index)."""
+    existing = {}
+    barcodes = [row['barcode'] for row in rows if row['barcode']]
+    if barcodes:
+        for barcode, doc_id in db.session.execute(
+                select(Document.barcode, Document.id).where(Document.barcode.in_(barcodes))):
+            existing[('barcode', barcode)] = doc_id
+    titles = list({row['title'] for row in rows if not row['barcode']})
+    if titles:
+        for doc_id, title, author in db.session.execute(
+                select(Document.id, Document.title, Document.author).where(Document.title.in_(titles))):
+            existing.setdefault(('title', title, author or ''), doc_id)
+    return existing
+
+
+def _barcode_conflicts(inserts, updates):
+    """Lignes dont le code-barres appartient déjà à un autre document, ou à une ligne précédente du lot
+    (l'index unique ux_document_barcode ferait échouer tout le lot). Retourne {id(ligne): message}."""
+    written = [(row, None) for row in inserts] + [(row, row['id']) for row in updates]
+    barcodes = list({row['barcode'] for row, _ in written if row['barcode']})
+    if not barcodes:
+        return {}
+    owners = dict(db.session.execute(select(Document.barcode, Document.id).where(Document.barcode.in_(barcodes))).all())
+    claimed, conflicts = set(), {}
+    for row, doc_id in written:
+        barcode = row['barcode']
+        if not barcode:
+            continue
+        if barcode in claimed or (barcode in owners and owners[barcode] != doc_id):
+            owner = f"document {owners[barcode]}" if barcode in owners and barcode not in claimed else "une autre ligne du lot"
+            conflicts[id(row)] = f"code-barres '{barcode}' déjà attribué ({owner}) pour « {row['title']} »"
+        else:
+            claimed.add(barcode)
+    return conflicts
+
+
+def import_batch(rows, on_duplicate='skip'):
+    """Écrit un lot (sans commit) : insertions en executemany, mises à jour groupées.
+    Retourne (insérés, mis à jour, ignorés, erreurs) ; erreurs = messages des lignes rejetées (code-barres en conflit)."""
+    pending = {}
+    skipped = 0
+    for row in rows:
+        key = _key(row)
+        if key in pending and on_duplicate == 'skip':
+            skipped += 1; continue
+        pending[key] = row # upsert : la dernière occurrence du fichier l'emporte
+    existing = _existing_ids(list(pending.values()))
+
+    inserts, updates = [], []
+    for key, row in pending.items():
+        doc_id = existing.get(key)
+        if doc_id is None:
+            inserts.append(row)
+        elif on_duplicate == 'upsert':
+            updates.append(dict({field: row[field] for field in UPSERT_FIELDS}, id=doc_id))
+        else:
+            skipped += 1
+    conflicts = _barcode_conflicts(inserts, updates)
+    if conflicts:
+        inserts = [row for row in inserts if id(row) not in conflicts]
+        updates = [row for row in updates if id(row) not in conflicts]
+
+    if inserts:
+        # INSERT multi-lignes avec RETURNING (ids dans l'ordre des lignes) : indexation plein texte des ids réellement
+        # attribués, contigus ou non
+        ids = db.session.execute(
+            insert(Document.__table__).returning(Document.__table__.c.id, sort_by_parameter_order=True), inserts).scalars().all()
+        search_index.index_many([dict(row, id=doc_id) for row, doc_id in zip(inserts, ids)], replace=False)
+    if updates:
+        db.session.execute(update(Document), updates) # UPDATE groupé par clé primaire
+        db.session.execute(  # Versions (ETag de l'API) : une requête pour tout le lot
+            update(Document).where(Document.id.in_([row['id'] for row in updates]))
+            .values(version=next_version()).execution_options(synchronize_session=False))
+        search_index.index_many(updates)
+    return len(inserts), len(updates), skipped, list(conflicts.values())
+
+
+# --- Point de reprise ---
+def checkpoint_path(path):
+    return path + '.checkpoint'
+
+
+def _source_signature(path):
+    info = os.stat(path)
+    return {'source': os.path.abspath(path), 'size': info.st_size, 'mtime': info.st_mtime}
+
+
+def load_checkpoint(path):
+    """Progression enregistrée si elle correspond au même fichier source (taille + date), sinon None."""
+    try:
+        with open(checkpoint_path(path), encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return None
+    signature = _source_signature(path)
+    if any(checkpoint.get(name) != value for name, value in signature.items()):
+        return None
+    return checkpoint
+
+
+def _save_checkpoint(path, progress):
+    temporary = checkpoint_path(path) + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(dict(progress, **_source_signature(path)), f)
+    os.replace(temporary, checkpoint_path(path)) # Écriture atomique
+
+
+def import_catalogue(path, fmt=None, batch_size=1000, on_duplicate='skip', restart=False, pdf_folder=None, report=print):
+    """Importe le fichier lot par lot (un commit + un point de reprise par lot). Retourne le bilan cumulé."""
+    fmt = fmt or detect_format(path)
+    progress = {'records': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'errors': 0}
+    checkpoint = None if restart else load_checkpoint(path)
+    if checkpoint:
+        progress.update({name: checkpoint.get(name, 0) for name in progress})
+        report(f"Reprise après {progress['records']} enregistrement(s) déjà traités.")
+    resume_after = progress['records']
+    started = time.perf_counter()
+    batch, seen = [], 0
+    reported_errors = 0
+
+    def report_error(message):
+        nonlocal reported_errors
+        progress['errors'] += 1
+        if reported_errors < MAX_REPORTED_ERRORS:
+            reported_errors += 1
+            report(f"  {message}")
+
+    def flush():
+        inserted, updated, skipped, errors = import_batch(batch, on_duplicate)
+        for message in errors:
+            report_error(f"Ligne ignorée : {message}")
+        stats.invalidate() # Compteurs du gérant recalculés à la prochaine lecture
+        db.session.commit()
+        progress['records'] = seen
+        progress['inserted'] += inserted; progress['updated'] += updated; progress['skipped'] += skipped
+        _save_checkpoint(path, progress)
+        elapsed = time.perf_counter() - started
+        report(f"  {seen} lus | {progress['inserted']} insérés | {progress['updated']} mis à jour | "
+               f"{progress['skipped']} ignorés | {progress['errors']} erreurs | {(seen - resume_after) / elapsed:.0f} enr/s")
+        batch.clear()
+
+    for line_no, record in read_records(path, fmt):
+        seen += 1
+        if seen <= resume_after:
+            continue # Déjà importé lors d'une exécution précédente
+        try:
+            if isinstance(record, RowError):
+                raise record
+            batch.append(validate(record, pdf_folder))
+        except RowError as e:
+            report_error(f"Ligne {line_no} ignorée : {e}")
+        if len(batch) >= batch_size:
+            flush()
+    if batch or seen > progress['records']:
+        flush()
+    try:
+        os.remove(checkpoint_path(path)) # Import terminé
+    except FileNotFoundError:
+        pass
+    progress['seconds'] = round(time.perf_counter() - started, 2)
+    return progress
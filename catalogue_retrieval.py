@@ -0,0 +1,206 @@
+# catalogue_retrieval.py
+# Recherche locale des documents cités dans un message du chatbot : index inversé en mémoire (titre/auteur),
+# statut lu en direct (clé primaire) puis résumé compact injecté dans le prompt.
+from flask import current_app
+from sqlalchemy import select, func
+from models import db, Document, version_clock
+from chat_cache import normalize_question
+import logging
+import math
+import threading
+import time
+import os
+
+log = logging.getLogger(__name__)
+
+# Mots trop fréquents pour identifier un document
+STOPWORDS = {
+    'le', 'la', 'les', 'un', 'une', 'des', 'de', 'du', 'et', 'ou', 'en', 'au', 'aux', 'a', 'l', 'd',
+    'est', 'il', 'elle', 'je', 'vous', 'tu', 'on', 'ce', 'ces', 'cet', 'cette', 'que', 'qui', 'quoi',
+    'pour', 'par', 'sur', 'dans', 'avec', 'sans', 'pas', 'ne', 'plus', 'livre', 'livres', 'roman',
+    'disponible', 'dispo', 'emprunter', 'reserver', 'avez', 'bonjour', 'merci', 'svp',
+}
+MIN_TOKEN_LENGTH = 3
+MAX_POSTINGS = 500 # Jeton présent dans plus de documents : non discriminant, ignoré
+CHARS_PER_TOKEN = 4 # Estimation grossière pour le budget de tokens
+# Recouvrement de la requête delta (ms) : horloges des workers décalées, transactions validées après coup
+SYNC_OVERLAP_MS = 120000
+
+
+def tokenize(text):
+    return {token for token in normalize_question(text).split()
+            if len(token) >= MIN_TOKEN_LENGTH and token not in STOPWORDS}
+
+
+def _index_into(postings, doc_tokens, doc_id, title, author):
+    _unindex_from(postings, doc_tokens, doc_id)
+    title_tokens, author_tokens = tokenize(title), tokenize(author)
+    doc_tokens[doc_id] = (title_tokens, author_tokens)
+    for token in title_tokens | author_tokens:
+        postings.setdefault(token, set()).add(doc_id)
+
+
+def _unindex_from(postings, doc_tokens, doc_id):
+    title_tokens, author_tokens = doc_tokens.pop(doc_id, (set(), set()))
+    for token in title_tokens | author_tokens:
+        ids = postings.get(token)
+        if ids:
+            ids.discard(doc_id)
+            if not ids:
+                del postings[token]
+
+
+class CatalogueRetriever:
+    """Index inversé jeton -> ids de documents (titre + auteur), construit et tenu à jour par un thread de fond.
+    Les requêtes ne font que lire l'index (jamais de construction dans le chemin du chatbot) ; tant qu'il n'est pas
+    prêt, aucun extrait catalogue n'est ajouté au prompt."""
+    def __init__(self, max_results=3, max_context_tokens=120, sync_interval=30, fetch_batch=500):
+        self.max_results = max_results
+        self.max_context_tokens = max_context_tokens
+        self.sync_interval = sync_interval # Prise en compte des ajouts/modifs/suppressions des autres workers
+        self.fetch_batch = fetch_batch
+        self._postings = {}   # jeton -> set(doc_id)
+        self._doc_tokens = {} # doc_id -> (jetons titre, jetons auteur)
+        self._versions = {}   # doc_id -> document.version indexée (détection des changements)
+        self._watermark = 0   # Plus grande version vue (document.version = horodatage ms de la modification)
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    # --- Thread de fond ---
+    def start(self, app):
+        """Lance (une fois par processus) la construction puis la synchronisation périodique."""
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(app,), name='catalogue-retriever', daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    if self._built_at is None:
+                        self.rebuild()
+                    else:
+                        self.sync()
+            except Exception:
+                log.exception("[Catalogue Retriever] Erreur de synchronisation")
+            if self._stop.wait(self.sync_interval):
+                return
+
+    # --- Construction / mises à jour ---
+    def rebuild(self):
+        """Construction complète dans des dictionnaires locaux, puis remplacement atomique (lectures non bloquées)."""
+        started = time.perf_counter()
+        postings, doc_tokens, versions = {}, {}, {}
+        read_at = version_clock() # Toute modification validée après la lecture a une version proche ou supérieure
+        rows = db.session.execute(select(Document.id, Document.version, Document.title, Document.author)
+                                  .execution_options(yield_per=5000))
+        for doc_id, version, title, author in rows:
+            _index_into(postings, doc_tokens, doc_id, title, author)
+            versions[doc_id] = version
+        db.session.rollback() # Fin de la transaction de lecture
+        with self._lock:
+            self._postings, self._doc_tokens, self._versions = postings, doc_tokens, versions
+            self._watermark = max(read_at, max(versions.values(), default=0))
+            self._built_at = time.monotonic()
+        log.info("[Catalogue Retriever] Index construit : %s documents en %.2fs", len(doc_tokens),
+                 time.perf_counter() - started, extra={'event': 'retriever.rebuild', 'documents': len(doc_tokens)})
+
+    def sync(self):
+        """Delta depuis la base : documents de version récente (index ix_document_version) réindexés s'ils ont
+        changé ; les ids ne sont relus en entier que si le nombre de documents trahit une suppression.
+        Retourne (réindexés, retirés)."""
+        known = self._versions
+        read_at = version_clock()
+        rows = db.session.execute(
+            select(Document.id, Document.version, Document.title, Document.author)
+            .where(Document.version > self._watermark - SYNC_OVERLAP_MS)).all()
+        changed = [row for row in rows if known.get(row.id) != row.version]
+        added = sum(1 for row in changed if row.id not in known)
+        removed = []
+        if db.session.execute(select(func.count(Document.id))).scalar() != len(known) + added:
+            ids = set(db.session.execute(select(Document.id)).scalars())
+            removed = [doc_id for doc_id in known if doc_id not in ids]
+        db.session.rollback()
+        with self._lock:
+            for doc_id in removed:
+                _unindex_from(self._postings, self._doc_tokens, doc_id)
+                known.pop(doc_id, None) # Versions : écrites par ce seul thread
+            for row in changed:
+                _index_into(self._postings, self._doc_tokens, row.id, row.title, row.author)
+                known[row.id] = row.version
+            self._watermark = max([self._watermark, read_at] + [row.version for row in rows])
+        return len(changed), len(removed)
+
+    def upsert(self, doc):
+        """Mise à jour immédiate après ajout/modification d'un document (ce processus ; les autres au prochain delta)."""
+        if self._built_at is None:
+            return
+        with self._lock:
+            _index_into(self._postings, self._doc_tokens, doc.id, doc.title, doc.author)
+
+    def remove(self, doc_id):
+        if self._built_at is None:
+            return
+        with self._lock:
+            _unindex_from(self._postings, self._doc_tokens, doc_id)
+
+    # --- Recherche ---
+    def find_ids(self, message):
+        """Ids des documents dont le titre/auteur est cité dans le message, par pertinence décroissante."""
+        if self._thread is None or self._pid != os.getpid():
+            self.start(current_app._get_current_object()) # Processus sans démarrage explicite (ou après fork)
+        tokens = tokenize(message)
+        with self._lock:
+            total = max(len(self._doc_tokens), 1)
+            scores = {}
+            for token in tokens:
+                postings = self._postings.get(token)
+                if not postings or len(postings) > MAX_POSTINGS:
+                    continue
+                weight = math.log(1 + total / len(postings))
+                for doc_id in postings:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight
+            candidates = [(score, doc_id) for doc_id, score in scores.items() if self._is_cited(tokens, doc_id)]
+        candidates.sort(key=lambda item: (-item[0], item[1]))
+        return [doc_id for _, doc_id in candidates[:self.max_results]]
+
+    def _is_cited(self, tokens, doc_id):
+        """Document cité : au moins la moitié des jetons du titre, ou l'auteur complet."""
+        title_tokens, author_tokens = self._doc_tokens[doc_id]
+        if title_tokens and len(tokens & title_tokens) * 2 >= len(title_tokens):
+            return True
+        return bool(author_tokens) and author_tokens <= tokens
+
+    def context_for(self, message):
+        """Extrait compact (titre, auteur, statut, numérique) des documents cités, borné en tokens ; '' si aucun."""
+        doc_ids = self.find_ids(message)
+        if not doc_ids:
+            return ''
+        # Statut lu en direct (quelques lectures par clé primaire) : jamais périmé
+        rows = {row.id: row for row in db.session.query(
+            Document.id, Document.title, Document.author, Document.status,
+            Document.is_physical, Document.is_digital).filter(Document.id.in_(doc_ids))}
+        lines = []
+        budget = self.max_context_tokens * CHARS_PER_TOKEN
+        for doc_id in doc_ids:
+            row = rows.get(doc_id)
+            if row is None:
+                continue # Supprimé depuis la construction de l'index
+            physical = row.status if row.is_physical else 'non'
+            line = f"- « {row.title} »{' de ' + row.author if row.author else ''} : physique {physical} ; numérique {'oui' if row.is_digital else 'non'}"
+            if len(line) > budget:
+                break
+            budget -= len(line)
+            lines.append(line)
+        return '\n'.join(lines)
@@ -0,0 +1,126 @@
+# chat_cache.py
+# Cache des réponses du chatbot : clé = question normalisée + version du prompt ; LRU + TTL en mémoire,
+# stockage SQLite optionnel sur disque (survit aux redémarrages, partagé entre workers gunicorn).
+from collections import OrderedDict
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+import re
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def normalize_question(question):
+    """Minuscules, sans accents, sans ponctuation, espaces réduits : 'Horaires ?!' == 'horaires'."""
+    text = unicodedata.normalize('NFKD', question or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+def cache_key(question, prompt_version):
+    return hashlib.sha256(f"{prompt_version}\x00{normalize_question(question)}".encode('utf-8')).hexdigest()
+
+
+class ChatResponseCache:
+    def __init__(self, max_entries=1000, ttl=86400, path=None, max_disk_entries=50000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict() # clé -> (expire_à, réponse), ordre = récence d'utilisation
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._writes_since_prune = 0
+        if path:
+            with self._connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS chat_cache "
+                    "(key TEXT PRIMARY KEY, reply TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+                )
+                connection.execute("CREATE INDEX IF NOT EXISTS ix_chat_cache_last_used ON chat_cache (last_used)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, question, prompt_version):
+        """Réponse en cache ou None (compte un succès ou un échec)."""
+        key = cache_key(question, prompt_version)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._memory[key]
+        reply = self._disk_get(key, now)
+        with self._lock:
+            if reply is None:
+                self.misses += 1
+                return None
+            self.hits += 1; self.disk_hits += 1
+            self._memory_put(key, reply, now + self.ttl)
+        return reply
+
+    def put(self, question, prompt_version, reply):
+        key = cache_key(question, prompt_version)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._memory_put(key, reply, expires_at)
+        self._disk_put(key, reply, expires_at)
+
+    def _memory_put(self, key, reply, expires_at):
+        self._memory[key] = (expires_at, reply)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False) # Éviction LRU
+
+    def _disk_get(self, key, now):
+        if not self.path:
+            return None
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT reply FROM chat_cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+                if row:
+                    connection.execute("UPDATE chat_cache SET last_used = ? WHERE key = ?", (now, key))
+                return row[0] if row else None
+        except sqlite3.Error as e:
+            log.warning("[Chat Cache] Erreur lecture disque: %s", e)
+            return None
+
+    def _disk_put(self, key, reply, expires_at):
+        if not self.path:
+            return
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO chat_cache (key, reply, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, reply, expires_at, time.time()))
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= 100: # Nettoyage périodique : expirés + LRU au-delà de la limite
+                    self._writes_since_prune = 0
+                    connection.execute("DELETE FROM chat_cache WHERE expires_at <= ?", (time.time(),))
+                    connection.execute(
+                        "DELETE FROM chat_cache WHERE key IN (SELECT key FROM chat_cache "
+                        "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,))
+        except sqlite3.Error as e:
+            log.warning("[Chat Cache] Erreur écriture disque: %s", e)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'memory_entries': len(self._memory), 'max_entries': self.max_entries,
+                'ttl': self.ttl, 'disk': bool(self.path),
+            }
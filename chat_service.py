@@ -0,0 +1,173 @@
+# chat_service.py
+# Appels au modèle du chatbot hors des workers de requêtes : pool de threads borné, file d'attente limitée, streaming.
+from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
+import threading
+import hashlib
+import time
+import queue
+import json
+import os
+import httpx
+import openai
+import logging
+
+log = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = """
+        Tu es BiblioBot IA, un assistant virtuel pour la bibliothèque BiblioTech IA.
+        Réponds aux questions des utilisateurs de manière concise et amicale, en français.
+        Tes connaissances incluent :
+        - Horaires : 9h à 18h, lundi au samedi.
+        - Recherche : Utiliser la barre de recherche du catalogue.
+        - Prêts numériques : 14 jours.
+        - Réservations physiques : Possible si livre emprunté.
+        - Disponibilité d'un livre : utilise uniquement les informations catalogue fournies (temps réel). Si aucune ne concerne le livre demandé, invite à consulter le catalogue.
+        - Compte utilisateur : explique que tu n'y as pas accès et qu'il faut consulter le tableau de bord.
+        - Refuse poliment les questions hors sujet de la bibliothèque.
+        """
+MODEL_ENGINE = "gpt-3.5-turbo" # Bon point de départ
+COMPLETION_OPTIONS = dict(
+    max_tokens=150,  # Limiter la réponse pour la vitesse et le coût
+    temperature=0.7, # Contrôle la créativité (0 = déterministe, >1 = très créatif)
+    n=1,             # Demander une seule réponse
+    stop=None        # Pas de séquence d'arrêt spécifique
+)
+# Version du prompt : change automatiquement avec le prompt/modèle (invalide le cache des réponses)
+PROMPT_VERSION = hashlib.sha1(f"{MODEL_ENGINE}\x00{SYSTEM_PROMPT}".encode('utf-8')).hexdigest()[:12]
+
+# Limites par processus, dérivées des threads du worker : chaque demande admise (en cours ou en attente) occupe
+# un thread de requête jusqu'à la fin de la réponse ; RESERVED_THREADS restent toujours libres pour le reste du site.
+# Pas de plafond global : avec N workers gunicorn, jusqu'à N x CHAT_MAX_CONCURRENCY appels simultanés au modèle
+# (dimensionner CHAT_MAX_CONCURRENCY d'après le quota du fournisseur divisé par le nombre de workers)
+WEB_THREADS = int(os.getenv('WEB_THREADS', 8)) # Procfile : gunicorn --threads $WEB_THREADS
+RESERVED_THREADS = int(os.getenv('CHAT_RESERVED_THREADS', max(1, WEB_THREADS // 2)))
+CHAT_THREADS = max(1, WEB_THREADS - RESERVED_THREADS) # Demandes admises au plus (en cours + en attente)
+MAX_CONCURRENCY = max(1, min(int(os.getenv('CHAT_MAX_CONCURRENCY', max(1, CHAT_THREADS // 2))), CHAT_THREADS))
+MAX_QUEUE = max(0, min(int(os.getenv('CHAT_MAX_QUEUE', CHAT_THREADS - MAX_CONCURRENCY)), CHAT_THREADS - MAX_CONCURRENCY))
+UPSTREAM_TIMEOUT = float(os.getenv('CHAT_UPSTREAM_TIMEOUT', 30))
+RESULT_GRACE = 5 # Secondes d'attente au-delà de UPSTREAM_TIMEOUT (file d'attente du pool) avant abandon
+_DONE = object()
+
+
+class ChatBusy(Exception):
+    """Pool et file d'attente pleins : la demande est refusée immédiatement."""
+
+
+def build_messages(user_message, catalogue_context=''):
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if catalogue_context:
+        messages.append({"role": "system", "content": "Informations catalogue (temps réel) :\n" + catalogue_context})
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+class ChatService:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE, timeout=UPSTREAM_TIMEOUT, on_upstream=None):
+        self.timeout = timeout
+        self.on_upstream = on_upstream # Rappel (mode, secondes, 'ok' | 'error') après chaque appel au modèle
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='chat')
+        self._slots = threading.BoundedSemaphore(max_concurrency + max_queue) # En cours + en attente
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def client(self):
+        """Client OpenAI partagé ; OPENAI_BASE_URL permet de viser un serveur de complétion local (tests)."""
+        with self._client_lock:
+            if self._client is None:
+                # http_client explicite : openai 1.0.0 passe 'proxies' à httpx, refusé par httpx >= 0.28
+                self._client = openai.OpenAI(
+                    api_key=openai.api_key, base_url=os.getenv('OPENAI_BASE_URL') or None,
+                    timeout=self.timeout, max_retries=0,
+                    http_client=httpx.Client(timeout=self.timeout)
+                )
+            return self._client
+
+    def _observe(self, mode, started, outcome):
+        if self.on_upstream:
+            try:
+                self.on_upstream(mode, time.perf_counter() - started, outcome)
+            except Exception as e:
+                log.warning("[Chatbot] Erreur mesure latence: %s", e)
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise ChatBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release(); raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def complete(self, user_message, catalogue_context=''):
+        """Réponse complète (non streamée), calculée dans le pool. Lève ChatBusy, TimeoutError ou les erreurs OpenAI."""
+        def call():
+            started = time.perf_counter()
+            try:
+                completion = self.client().chat.completions.create(
+                    model=MODEL_ENGINE, messages=build_messages(user_message, catalogue_context), **COMPLETION_OPTIONS)
+            except Exception:
+                self._observe('complete', started, 'error'); raise
+            self._observe('complete', started, 'ok')
+            return completion.choices[0].message.content.strip()
+        future = self._submit(call)
+        try:
+            return future.result(timeout=self.timeout + RESULT_GRACE)
+        except concurrent.futures.TimeoutError: # Distinct du TimeoutError natif avant Python 3.11
+            future.cancel() # Encore en file : ne sera pas exécutée
+            raise TimeoutError(f"Pas de réponse du modèle après {self.timeout + RESULT_GRACE:.0f} s")
+
+    def stream(self, user_message, catalogue_context=''):
+        """Itérateur des fragments de texte, produits par un thread du pool. Lève ChatBusy à l'admission."""
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+
+        def call():
+            started = time.perf_counter()
+            try:
+                response = self.client().chat.completions.create(
+                    model=MODEL_ENGINE, messages=build_messages(user_message, catalogue_context), stream=True, **COMPLETION_OPTIONS)
+                try:
+                    for chunk in response:
+                        if cancelled.is_set():
+                            break
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            chunks.put(chunk.choices[0].delta.content)
+                finally:
+                    response.response.close()
+                self._observe('stream', started, 'ok')
+                chunks.put(_DONE)
+            except Exception as e:
+                self._observe('stream', started, 'error')
+                chunks.put(e)
+
+        self._submit(call)
+        return ChatStream(chunks, cancelled, self.timeout)
+
+
+class ChatStream:
+    """Fragments d'une réponse streamée. cancel() libère le thread du pool : à brancher sur la fermeture de la
+    réponse HTTP (call_on_close), appelée même si le client part avant le premier fragment."""
+    def __init__(self, chunks, cancelled, timeout):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self.timeout = timeout
+
+    def __iter__(self):
+        while not self._cancelled.is_set():
+            item = self._chunks.get(timeout=self.timeout)
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+def sse_event(data, event=None):
+    """Formate un événement Server-Sent Events (données JSON)."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,137 @@
+# circulation.py
+# Prêts / retours physiques au comptoir : transitions de statut conditionnelles en une instruction
+# (UPDATE ... WHERE status = attendu, puis contrôle du rowcount) au lieu de lire-vérifier-écrire en Python.
+# Plusieurs postes peuvent scanner le même exemplaire : un seul UPDATE réussit, sans verrou global.
+from sqlalchemy import update, exists
+from models import db, User, Document, Reservation, PhysicalLoan, next_version
+from datetime import datetime, timedelta
+import reservation_queue
+import stats
+
+LOAN_DAYS = 21 # Durée d'un prêt physique
+
+
+def member_number(user_id):
+    """N° de carte membre attribué à l'inscription (ex: MBR000042)."""
+    return f"MBR{user_id:06d}"
+
+
+def find_member(scan):
+    """Membre par n° de carte (index unique), sinon par nom d'utilisateur (index unique)."""
+    scan = (scan or '').strip()
+    if not scan:
+        return None
+    return User.query.filter_by(member_number=scan, role='membre').first() or \
+        User.query.filter_by(username=scan, role='membre').first()
+
+
+def find_documents(scans):
+    """{scan: Document} pour une liste de scans, en deux requêtes (codes-barres, puis IDs restants)."""
+    scans = [scan.strip() for scan in scans if scan and scan.strip()]
+    found = {doc.barcode: doc for doc in Document.query.filter(Document.barcode.in_(scans))} if scans else {}
+    ids = {int(scan) for scan in scans if scan not in found and scan.isdigit()}
+    by_id = {doc.id: doc for doc in Document.query.filter(Document.id.in_(ids))} if ids else {}
+    for scan in scans:
+        if scan not in found and scan.isdigit() and int(scan) in by_id:
+            found[scan] = by_id[int(scan)]
+    return found
+
+
+def find_document(scan):
+    """Document par code-barres (index unique), sinon par ID numérique (clé primaire)."""
+    scan = (scan or '').strip()
+    if not scan:
+        return None
+    doc = Document.query.filter_by(barcode=scan).first()
+    if doc is None and scan.isdigit():
+        doc = db.session.get(Document, int(scan))
+    return doc
+
+
+def _transition(doc_id, expected, new_status, *conditions):
+    """UPDATE document conditionnel : True si le statut était bien `expected` (et a été remplacé)."""
+    result = db.session.execute(
+        update(Document).where(Document.id == doc_id, Document.is_physical == True, Document.status == expected, *conditions)
+        .values(status=new_status, version=next_version()).execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+
+def checkout(doc, member, loan_days=LOAN_DAYS):
+    """Prêt au comptoir (sans commit). Retourne (True, PhysicalLoan) ou (False, motif) ; aucune écriture en cas d'échec."""
+    now = datetime.utcnow()
+    if _transition(doc.id, 'disponible', 'emprunte'):
+        stats.bump(physical_available=-1, physical_borrowed=1)
+    else:
+        # Mis de côté : seul le membre dont la réservation est 'ready' peut le retirer
+        held_for_member = exists().where(Reservation.document_id == Document.id, Reservation.user_id == member.id,
+                                         Reservation.status == 'ready')
+        if not _transition(doc.id, 'reserve', 'emprunte', held_for_member):
+            db.session.refresh(doc)
+            return False, 'reserved_for_other' if doc.status == 'reserve' else 'unavailable'
+        db.session.execute(
+            update(Reservation).where(Reservation.document_id == doc.id, Reservation.user_id == member.id,
+                                      Reservation.status == 'ready')
+            .values(status='honored').execution_options(synchronize_session=False))
+        stats.bump(physical_borrowed=1, active_reservations=-1)
+    loan = PhysicalLoan(user_id=member.id, document_id=doc.id, loan_date=now, due_date=now + timedelta(days=loan_days))
+    db.session.add(loan)
+    return True, loan
+
+
+def close_loans(doc_id, now=None):
+    """Clôture le prêt physique actif d'un document (un UPDATE). Retourne le nombre."""
+    result = db.session.execute(
+        update(PhysicalLoan).where(PhysicalLoan.document_id == doc_id, PhysicalLoan.status == 'active')
+        .values(status='returned', returned_at=now or datetime.utcnow()).execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+def checkin(doc, hold_days=reservation_queue.HOLD_DAYS):
+    """Retour au comptoir (sans commit) : 'reserve' (remis au premier de la file), 'disponible', ou None si non emprunté."""
+    now = datetime.utcnow()
+    if not _transition(doc.id, 'emprunte', 'disponible'):
+        return None
+    close_loans(doc.id, now)
+    if reservation_queue.hand_off([doc.id], now, hold_days):
+        _transition(doc.id, 'disponible', 'reserve')
+        stats.bump(physical_borrowed=-1)
+        return 'reserve'
+    stats.bump(physical_borrowed=-1, physical_available=1)
+    return 'disponible'
+
+
+FAILURE_MESSAGES = {
+    'not_found': "Document introuvable",
+    'not_physical': "Document non physique",
+    'unavailable': "Non disponible",
+    'reserved_for_other': "Mis de côté pour un autre membre",
+    'not_borrowed': "Non emprunté",
+}
+
+
+def process_batch(action, scans, member=None, loan_days=LOAN_DAYS, hold_days=reservation_queue.HOLD_DAYS):
+    """Prêts ('loan', membre requis) ou retours ('return') d'une liste de scans dans la transaction courante (sans commit).
+    Chaque élément est indépendant (un échec n'écrit rien) ; retourne un résultat par scan, dans l'ordre."""
+    documents = find_documents(scans)
+    results = []
+    for scan in scans:
+        doc = documents.get(scan.strip())
+        result = {'scan': scan, 'ok': False}
+        if doc is None:
+            result['error'] = 'not_found'
+        elif not doc.is_physical:
+            result.update(document_id=doc.id, title=doc.title, error='not_physical')
+        elif action == 'loan':
+            ok, outcome = checkout(doc, member, loan_days)
+            result.update(document_id=doc.id, title=doc.title, ok=ok)
+            if ok: result.update(status='emprunte', due_date=outcome.due_date.strftime('%Y-%m-%d'))
+            else: result['error'] = outcome
+        else:
+            new_status = checkin(doc, hold_days)
+            result.update(document_id=doc.id, title=doc.title, ok=new_status is not None)
+            if new_status: result['status'] = new_status
+            else: result['error'] = 'not_borrowed'
+        if 'error' in result:
+            result['message'] = FAILURE_MESSAGES[result['error']]
+        results.append(result)
+    return results
@@ -0,0 +1,115 @@
+# covers.py
+# Variantes redimensionnées des images de couverture (carte catalogue, page détail) : WebP + JPEG de repli,
+# sans métadonnées (EXIF, GPS...). L'original reste stocké ; la base ne garde que son nom de fichier.
+import os
+import logging
+
+log = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # Pillow absent : les templates se rabattent sur l'image originale
+    Image = None
+
+THUMBS_SUBDIR = 'thumbs'
+# Largeurs (1x, 2x) par usage ; les images plus petites ne sont jamais agrandies
+VARIANTS = {
+    'card': (400, 800),
+    'detail': (800, 1200),
+}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def _stem(filename):
+    return filename.rsplit('.', 1)[0]
+
+
+def variant_name(filename, width, fmt):
+    return f"{_stem(filename)}_{width}.{fmt}"
+
+
+def all_widths():
+    return sorted({width for widths in VARIANTS.values() for width in widths})
+
+
+def variant_paths(folder, filename):
+    thumbs = os.path.join(folder, THUMBS_SUBDIR)
+    return [os.path.join(thumbs, variant_name(filename, width, fmt))
+            for width in all_widths() for fmt in ('webp', 'jpg')]
+
+
+def process_cover(folder, filename):
+    """Génère toutes les variantes d'une couverture. Retourne le nombre de fichiers écrits (0 si impossible)."""
+    if Image is None:
+        log.warning("Pillow non installé, variantes de couverture non générées.")
+        return 0
+    thumbs = os.path.join(folder, THUMBS_SUBDIR)
+    os.makedirs(thumbs, exist_ok=True)
+    written = 0
+    with Image.open(os.path.join(folder, filename)) as source:
+        image = ImageOps.exif_transpose(source) # Appliquer l'orientation avant de jeter l'EXIF
+        if image.mode not in ('RGB', 'L'):
+            # Transparence aplatie sur fond blanc (JPEG ne la gère pas)
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        image = image.convert('RGB')
+        for width in all_widths():
+            resized = image.copy()
+            resized.thumbnail((width, width * 2), Image.LANCZOS)
+            # Sans paramètre exif/icc : métadonnées retirées
+            resized.save(os.path.join(thumbs, variant_name(filename, width, 'webp')), 'WEBP', quality=WEBP_QUALITY, method=4)
+            resized.save(os.path.join(thumbs, variant_name(filename, width, 'jpg')), 'JPEG', quality=JPEG_QUALITY,
+                         optimize=True, progressive=True)
+            written += 2
+    return written
+
+
+def delete_cover(folder, filename):
+    """Supprime l'original et ses variantes (erreurs ignorées, journalisées)."""
+    for path in [os.path.join(folder, filename)] + variant_paths(folder, filename):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("Err suppr img %s: %s", path, e)
+
+
+def has_variants(folder, filename):
+    return all(os.path.exists(path) for path in variant_paths(folder, filename))
+
+
+def cover_sources(folder, url_for, filename, kind):
+    """URLs pour <picture> : {'webp': srcset, 'jpeg': srcset, 'src': url} ou None si pas de variantes."""
+    if not filename or not has_variants(folder, filename):
+        return None
+    def srcset(fmt):
+        return ', '.join(
+            f"{url_for('static', filename=f'uploads/covers/{THUMBS_SUBDIR}/' + variant_name(filename, width, fmt))} {density}x"
+            for density, width in enumerate(VARIANTS[kind], start=1))
+    return {
+        'webp': srcset('webp'),
+        'jpeg': srcset('jpg'),
+        'src': url_for('static', filename=f'uploads/covers/{THUMBS_SUBDIR}/' + variant_name(filename, VARIANTS[kind][0], 'jpg')),
+    }
+
+
+def backfill(folder, force=False):
+    """Génère les variantes manquantes pour toutes les couvertures existantes. Retourne (fichiers traités, erreurs)."""
+    processed, errors = [], 0
+    for filename in sorted(os.listdir(folder)):
+        path = os.path.join(folder, filename)
+        if not os.path.isfile(path) or '.' not in filename:
+            continue
+        if not force and has_variants(folder, filename):
+            continue
+        try:
+            process_cover(folder, filename)
+            processed.append(filename)
+        except Exception as e:
+            errors += 1
+            log.exception("Erreur variantes couverture %s", filename)
+    return processed, errors
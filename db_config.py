@@ -0,0 +1,68 @@
+# db_config.py
+# Configuration du moteur SQL par variables d'environnement : SQLite (WAL, pragmas à la connexion) par défaut,
+# ou toute URL SQLAlchemy (ex. PostgreSQL) via DATABASE_URL, avec dimensionnement du pool.
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import sqlite3
+import os
+
+# Valeurs par défaut des pragmas SQLite (surchargées par SQLITE_<NOM>)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',   # Lecteurs non bloqués par l'écrivain (plusieurs workers gunicorn)
+    'synchronous': 'NORMAL', # En WAL : pas de fsync à chaque commit, durable au checkpoint
+    'busy_timeout': '5000',  # Attente (ms) du verrou d'écriture au lieu de "database is locked"
+    'mmap_size': str(256 * 1024 * 1024),
+    'cache_size': str(-64 * 1024), # Négatif = Kio (64 Mio par connexion)
+    'temp_store': 'MEMORY',
+}
+_sqlite_pragmas = {}
+
+
+def database_uri(default_sqlite_path):
+    """DATABASE_URL si définie (postgres:// accepté), sinon fichier SQLite local."""
+    uri = os.getenv('DATABASE_URL')
+    if not uri:
+        return 'sqlite:///' + default_sqlite_path
+    if uri.startswith('postgres://'): # Forme historique (Heroku) refusée par SQLAlchemy 2
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def sqlite_pragmas():
+    return {name: os.getenv(f'SQLITE_{name.upper()}', default) for name, default in SQLITE_PRAGMAS.items()}
+
+
+def engine_options(uri):
+    """Options create_engine selon le backend (pool pour les serveurs, pré-ping des connexions)."""
+    if uri.startswith('sqlite'):
+        # Connexions locales bon marché : pool par défaut de SQLAlchemy, attente gérée par busy_timeout
+        return {'connect_args': {'timeout': int(sqlite_pragmas()['busy_timeout']) / 1000}}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)), # Avant coupure côté serveur / proxy
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', '1') == '1',
+    }
+
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Pragmas appliqués à chaque nouvelle connexion SQLite (ils ne sont pas persistés, sauf journal_mode)."""
+    if not _sqlite_pragmas or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _sqlite_pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def init_app(app, default_sqlite_path):
+    """Renseigne SQLALCHEMY_DATABASE_URI / SQLALCHEMY_ENGINE_OPTIONS (avant db.init_app)."""
+    uri = database_uri(default_sqlite_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+    if uri.startswith('sqlite'):
+        _sqlite_pragmas.update({name: value for name, value in sqlite_pragmas().items() if value})
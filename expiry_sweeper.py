@@ -0,0 +1,102 @@
+# expiry_sweeper.py
+# Expiration périodique des prêts numériques échus, des abonnements terminés et des mises de côté non retirées : UPDATE ensemblistes par lots bornés
+# (transactions courtes), compteurs du gérant ajustés. Lancé par `flask expire-sweep` (cron) ou par un thread en
+# arrière-plan dans le seul processus qui a EXPIRY_SWEEPER=1.
+from sqlalchemy import select, update
+from models import db, User, Loan
+from datetime import datetime
+import threading
+import time
+import logging
+import stats
+import reservation_queue
+
+DEFAULT_BATCH_SIZE = 500
+
+log = logging.getLogger(__name__)
+
+
+def expire_loans(now, batch_size=DEFAULT_BATCH_SIZE):
+    """Passe les prêts actifs échus à 'expired', un lot par transaction (index status + due_date). Retourne le nombre."""
+    total = 0
+    while True:
+        batch = select(Loan.id).where(Loan.status == 'active', Loan.due_date < now).limit(batch_size)
+        result = db.session.execute(
+            update(Loan).where(Loan.id.in_(batch.scalar_subquery()), Loan.status == 'active')
+            .values(status='expired').execution_options(synchronize_session=False))
+        count = result.rowcount
+        if count:
+            stats.bump(active_digital_loans=-count)
+        db.session.commit()
+        total += count
+        if count < batch_size:
+            return total
+
+
+def expire_subscriptions(now, batch_size=DEFAULT_BATCH_SIZE):
+    """Passe les abonnements actifs terminés à 'expired'. Retourne (nombre, ids des membres concernés)."""
+    user_ids = []
+    while True:
+        ids = db.session.execute(
+            select(User.id).where(User.role == 'membre', User.subscription_status == 'active',
+                                  User.subscription_end_date < now).limit(batch_size)).scalars().all()
+        if not ids:
+            db.session.commit()
+            return len(user_ids), user_ids
+        # Condition répétée : un paiement concurrent entre SELECT et UPDATE n'est pas écrasé
+        result = db.session.execute(
+            update(User).where(User.id.in_(ids), User.subscription_status == 'active', User.subscription_end_date < now)
+            .values(subscription_status='expired').execution_options(synchronize_session=False))
+        if result.rowcount:
+            stats.bump(active_members=-result.rowcount)
+        db.session.commit()
+        user_ids.extend(ids)
+        if len(ids) < batch_size:
+            return len(user_ids), user_ids
+
+
+def sweep(batch_size=DEFAULT_BATCH_SIZE, identity_cache=None, hold_days=reservation_queue.HOLD_DAYS):
+    """Une passe complète. Retourne {'loans': n, 'subscriptions': n, 'holds': n, 'seconds': durée}."""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    loans = expire_loans(now, batch_size)
+    subscriptions, user_ids = expire_subscriptions(now, batch_size)
+    holds = reservation_queue.expire_holds(now, batch_size, hold_days) # Remise au suivant de la file
+    if identity_cache is not None:
+        for user_id in user_ids: # Cache de ce processus ; les autres workers suivent au TTL
+            identity_cache.invalidate(user_id)
+    return {'loans': loans, 'subscriptions': subscriptions, 'holds': holds, 'seconds': round(time.perf_counter() - started, 3)}
+
+
+class ExpirySweeper:
+    """Thread démon qui lance sweep() toutes les `interval` secondes dans un contexte applicatif."""
+    def __init__(self, app, interval, batch_size=DEFAULT_BATCH_SIZE, identity_cache=None, hold_days=reservation_queue.HOLD_DAYS):
+        self.app = app
+        self.hold_days = hold_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.identity_cache = identity_cache
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        delay = min(60, self.interval) # Première passe peu après le démarrage
+        while not self._stop.wait(delay):
+            delay = self.interval
+            try:
+                with self.app.app_context():
+                    report = sweep(self.batch_size, self.identity_cache, self.hold_days)
+                if report['loans'] or report['subscriptions'] or report['holds']:
+                    log.info("[Expiry Sweeper] %s prêt(s), %s abonnement(s), %s mise(s) de côté expiré(s) en %ss",
+                             report['loans'], report['subscriptions'], report['holds'], report['seconds'],
+                             extra={'event': 'expiry.sweep', **report})
+            except Exception as e: # Session jetée avec le contexte ; nouvelle tentative à la passe suivante
+                log.exception("[Expiry Sweeper] Erreur")
@@ -0,0 +1,69 @@
+# fragment_cache.py
+# Cache (par processus) du HTML rendu des cartes du catalogue et de l'en-tête des pages de détail. Clé = gabarit,
+# document et contexte de rendu ; l'entrée garde la version du document (document.version, incrémentée à chaque
+# modification, prêt, retour ou mise de côté) : une version différente = défaut de cache, quel que soit le worker
+# qui a fait la modification. LRU borné en nombre d'entrées, compteurs succès/échecs.
+from collections import OrderedDict
+from flask import render_template
+from markupsafe import Markup
+import threading
+
+
+class FragmentCache:
+    def __init__(self, max_entries=5000, on_lookup=None):
+        self.max_entries = max_entries # 0 = désactivé (rendu à chaque fois)
+        self.on_lookup = on_lookup # Rappel (gabarit, succès) pour les métriques
+        self._entries = OrderedDict() # clé -> (version, html), ordre = récence d'utilisation
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, html):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (version, html) # Remplace l'ancienne version du même fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False) # Éviction LRU
+
+    def render(self, template, doc, **context):
+        """HTML du gabarit pour `doc` : en cache si la version n'a pas changé. Le gabarit ne doit dépendre que de
+        `doc` et de `context` (pas de session ni d'utilisateur courant : ce qui varie passe par `context`)."""
+        key = (template, doc.id) + tuple(sorted(context.items()))
+        html = self.get(key, doc.version)
+        if self.on_lookup is not None:
+            self.on_lookup(template, html is not None)
+        if html is None:
+            html = Markup(render_template(template, doc=doc, **context))
+            self.put(key, doc.version, html)
+        return html
+
+    def invalidate(self, doc_id):
+        """Retire les fragments d'un document (suppression) ; les autres workers les évincent par LRU."""
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == doc_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+                'entries': len(self._entries), 'max_entries': self.max_entries,
+            }
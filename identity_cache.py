@@ -0,0 +1,59 @@
+# identity_cache.py
+# Cache (par processus, avec TTL) de l'utilisateur connecté : évite un SELECT user à chaque rendu de template.
+import threading
+import time
+
+# Champs copiés depuis User (pas d'objet ORM en cache : pas de session détachée ni de lazy-load surprise)
+CACHED_FIELDS = ('id', 'username', 'role', 'email', 'member_number', 'subscription_status', 'subscription_type',
+                 'subscription_start_date', 'subscription_end_date')
+
+
+class CachedUser:
+    """Copie en lecture seule des champs d'un User (utilisable dans les templates comme current_user)."""
+    __slots__ = CACHED_FIELDS
+
+    def __init__(self, user):
+        for field in CACHED_FIELDS:
+            object.__setattr__(self, field, getattr(user, field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CachedUser est en lecture seule")
+
+    def __repr__(self):
+        return f'<CachedUser {self.username} ({self.role})>'
+
+
+class IdentityCache:
+    """Dictionnaire user_id -> CachedUser borné en taille, avec expiration (TTL en secondes)."""
+    def __init__(self, ttl=60, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, cached_user = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return cached_user
+
+    def put(self, user):
+        cached_user = CachedUser(user)
+        with self._lock:
+            if len(self._entries) >= self.max_size and user.id not in self._entries:
+                self._entries.pop(next(iter(self._entries))) # Évince la plus ancienne insertion
+            self._entries[user.id] = (time.monotonic() + self.ttl, cached_user)
+        return cached_user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,143 @@
+# migrations.py
+# Migrations de schéma versionnées pour les bases existantes (db.create_all() ne modifie pas les tables déjà créées).
+# Chaque migration est idempotente : elle peut tourner sur une base neuve créée par create_all().
+from sqlalchemy import text, inspect
+from models import db, User, Document, Reservation, Loan, PhysicalLoan, StatsSnapshot
+from datetime import datetime
+from circulation import member_number
+import search_index
+
+VERSION_TABLE = 'schema_version'
+
+
+def _create_model_indexes(connection):
+    """Crée les index déclarés dans les modèles (__table_args__) s'ils manquent.
+    Ignore ceux dont les colonnes n'existent pas encore (créés par la migration qui les ajoute)."""
+    inspector = inspect(connection)
+    for model in (User, Document, Reservation, Loan, PhysicalLoan):
+        if not inspector.has_table(model.__tablename__):
+            continue
+        columns = {column['name'] for column in inspector.get_columns(model.__tablename__)}
+        for index in model.__table__.indexes:
+            if all(column.name in columns for column in index.columns):
+                index.create(bind=connection, checkfirst=True)
+
+
+def _create_stats_snapshot(connection):
+    StatsSnapshot.__table__.create(bind=connection, checkfirst=True)
+
+
+def _add_reservation_queue(connection):
+    """Colonnes de la file d'attente ; numéros de passage des réservations existantes dans l'ordre de date."""
+    columns = {column['name'] for column in inspect(connection).get_columns('reservation')}
+    if 'queue_position' not in columns:
+        connection.execute(text("ALTER TABLE reservation ADD COLUMN queue_position INTEGER"))
+    if 'hold_expires_at' not in columns:
+        connection.execute(text("ALTER TABLE reservation ADD COLUMN hold_expires_at TIMESTAMP"))
+    connection.execute(text(
+        "UPDATE reservation SET queue_position = (SELECT count(*) FROM reservation AS r2 "
+        "WHERE r2.document_id = reservation.document_id AND (r2.reservation_date < reservation.reservation_date "
+        "OR (r2.reservation_date = reservation.reservation_date AND r2.id <= reservation.id))) "
+        "WHERE queue_position IS NULL"
+    ))
+    _create_model_indexes(connection)
+
+
+def _add_physical_circulation(connection):
+    """Codes-barres, n° de carte membre (attribués aux membres existants) et table physical_loan."""
+    inspector = inspect(connection)
+    if 'barcode' not in {column['name'] for column in inspector.get_columns('document')}:
+        connection.execute(text("ALTER TABLE document ADD COLUMN barcode VARCHAR(64)"))
+    if 'member_number' not in {column['name'] for column in inspector.get_columns('user')}:
+        connection.execute(text('ALTER TABLE "user" ADD COLUMN member_number VARCHAR(30)'))
+    member_ids = connection.execute(text(
+        "SELECT id FROM \"user\" WHERE role = 'membre' AND member_number IS NULL")).scalars().all()
+    if member_ids:
+        connection.execute(text('UPDATE "user" SET member_number = :number WHERE id = :id'),
+                           [{'id': user_id, 'number': member_number(user_id)} for user_id in member_ids])
+    PhysicalLoan.__table__.create(bind=connection, checkfirst=True)
+    _create_model_indexes(connection)
+
+
+def _add_document_version(connection):
+    """Version par document (ETag de l'API JSON) ; les documents existants partent de 1."""
+    if 'version' not in {column['name'] for column in inspect(connection).get_columns('document')}:
+        connection.execute(text("ALTER TABLE document ADD COLUMN version BIGINT NOT NULL DEFAULT 1"))
+
+
+def _unique_queue_positions(connection):
+    """Numéros de passage renumérotés (1..n, ordre conservé) pour les documents ayant des doublons, puis index unique."""
+    rows = connection.execute(text(
+        "SELECT id, document_id FROM reservation WHERE queue_position IS NOT NULL AND document_id IN "
+        "(SELECT document_id FROM reservation WHERE queue_position IS NOT NULL "
+        "GROUP BY document_id, queue_position HAVING count(*) > 1) "
+        "ORDER BY document_id, queue_position, id")).all()
+    renumbered, previous, number = [], None, 0
+    for resa_id, document_id in rows:
+        number = number + 1 if document_id == previous else 1
+        previous = document_id
+        renumbered.append({'id': resa_id, 'position': number})
+    if renumbered:
+        connection.execute(text("UPDATE reservation SET queue_position = :position WHERE id = :id"), renumbered)
+    _create_model_indexes(connection)
+
+
+def _create_search_index(connection):
+    """Index plein texte FTS5 (SQLite) créé et rempli s'il manque : les workers le détectent sans redémarrage."""
+    search_index.create_table(connection)
+
+
+# (version, description, fonction(connection))
+MIGRATIONS = [
+    (1, "Index composites (catalogue, prêts, réservations, utilisateurs)", _create_model_indexes),
+    (2, "Table stats_snapshot (statistiques gérant)", _create_stats_snapshot),
+    (3, "File d'attente des réservations (queue_position, hold_expires_at)", _add_reservation_queue),
+    (4, "Prêts physiques (physical_loan), codes-barres et n° de carte membre", _add_physical_circulation),
+    (5, "Version par document (document.version, ETag de l'API)", _add_document_version),
+    (6, "Index plein texte du catalogue (document_fts, SQLite)", _create_search_index),
+    (7, "Index document.version (synchronisation incrémentale)", _create_model_indexes),
+    (8, "Numéro de passage unique par document (ux_reservation_document_position)", _unique_queue_positions),
+]
+
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} "
+        "(version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)"
+    ))
+
+
+def current_version():
+    """Version du schéma appliquée (0 si aucune migration)."""
+    with db.engine.begin() as connection:
+        _ensure_version_table(connection)
+        return connection.execute(text(f"SELECT coalesce(max(version), 0) FROM {VERSION_TABLE}")).scalar()
+
+
+def upgrade():
+    """Applique les migrations manquantes, chacune dans sa propre transaction. Retourne la liste appliquée."""
+    applied = []
+    version = current_version()
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        with db.engine.begin() as connection:
+            migrate(connection)
+            connection.execute(
+                text(f"INSERT INTO {VERSION_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': number, 'd': description, 't': datetime.utcnow()}
+            )
+        applied.append((number, description))
+    return applied
+
+
+def missing_indexes():
+    """Index déclarés dans les modèles mais absents de la base (diagnostic)."""
+    inspector = inspect(db.engine)
+    missing = []
+    for model in (User, Document, Reservation, Loan, PhysicalLoan):
+        if not inspector.has_table(model.__tablename__):
+            missing += [ix.name for ix in model.__table__.indexes]; continue
+        existing = {ix['name'] for ix in inspector.get_indexes(model.__tablename__)}
+        missing += [ix.name for ix in model.__table__.indexes if ix.name not in existing]
+    return missing
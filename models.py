@@ -1,16 +1,26 @@
 # models.py
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, case
+from sqlalchemy.orm import object_session
 from datetime import datetime, timedelta
+import time
 import os
 
 db = SQLAlchemy()
 
+
+def version_clock():
+    """Horloge des versions de document (ms)."""
+    return time.time_ns() // 1000000
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False) # Hash
     role = db.Column(db.String(50), nullable=False) # 'membre', 'bibliothecaire', ...
     email = db.Column(db.String(120), unique=True, nullable=True) # Ajout email (optionnel mais recommandé)
+    member_number = db.Column(db.String(30), nullable=True) # N° de carte membre scanné au comptoir (ex: MBR000042)
 
     # --- AJOUT : Champs Abonnement (pour rôle 'membre') ---
     subscription_status = db.Column(db.String(20), default='inactive', nullable=False) # inactive, active, pending, expired
@@ -22,6 +32,14 @@ class User(db.Model):
     # Relations
     reservations = db.relationship('Reservation', backref='user', lazy=True, cascade="all, delete-orphan")
     loans = db.relationship('Loan', backref='user', lazy=True, cascade="all, delete-orphan")
+    physical_loans = db.relationship('PhysicalLoan', backref='user', lazy=True, cascade="all, delete-orphan")
+
+    # Index : listes/compteurs par rôle (gérant), filtres rôle + statut d'abonnement, scan de carte membre
+    __table_args__ = (
+        db.Index('ix_user_role_status', 'role', 'subscription_status'),
+        db.Index('ix_user_role_username', 'role', 'username'),
+        db.Index('ux_user_member_number', 'member_number', unique=True),
+    )
 
     def __repr__(self):
         sub_info = ""
@@ -38,7 +56,7 @@ class Document(db.Model):
     author = db.Column(db.String(150), nullable=True)
     summary = db.Column(db.Text, nullable=True)
     # Statut principal (souvent lié à la disponibilité physique)
-    status = db.Column(db.String(50), nullable=False, default='disponible') # 'disponible', 'emprunte'
+    status = db.Column(db.String(50), nullable=False, default='disponible') # 'disponible', 'emprunte', 'reserve' (mis de côté)
 
     # --- Indicateurs de format ---
     is_physical = db.Column(db.Boolean, default=True, nullable=False)
@@ -51,10 +69,26 @@ class Document(db.Model):
     # Stocke le nom du fichier image (ex: 'uuid_couverture.jpg')
     cover_image_filename = db.Column(db.String(100), nullable=True)
     # ----------------------------------------------
+    barcode = db.Column(db.String(64), nullable=True) # Code-barres de l'exemplaire physique (scan comptoir)
+    # Horodatage (ms) de la dernière modification, strictement croissant par document (next_version() : ORM via
+    # l'événement ci-dessous, UPDATE ensemblistes explicitement). ETag de l'API, clé des fragments en cache, et
+    # synchronisation incrémentale (WHERE version > dernier vu, index). Un horodatage plutôt que 1 à la création :
+    # SQLite réattribue l'id du dernier document supprimé, le nouveau ne doit pas hériter de (id, version)
+    version = db.Column(db.BigInteger, nullable=False, default=version_clock)
    
     # Relations
     reservations = db.relationship('Reservation', backref='document', lazy=True, cascade="all, delete-orphan")
     loans = db.relationship('Loan', backref='document', lazy=True, cascade="all, delete-orphan")
+    physical_loans = db.relationship('PhysicalLoan', backref='document', lazy=True, cascade="all, delete-orphan")
+
+    # Index : pagination par curseur du catalogue (tri titre, id), filtres format + statut, scan code-barres
+    __table_args__ = (
+        db.Index('ix_document_title_id', 'title', 'id'),
+        db.Index('ix_document_physical_status', 'is_physical', 'status'),
+        db.Index('ix_document_digital', 'is_digital'),
+        db.Index('ux_document_barcode', 'barcode', unique=True),
+        db.Index('ix_document_version', 'version'),
+    )
 
     def __repr__(self):
         formats = []
@@ -63,17 +97,42 @@ class Document(db.Model):
         img_status = " (avec image)" if self.cover_image_filename else ""
         return f'<Document {self.id}: {self.title}{img_status} ({", ".join(formats)})>'
 
+
+def next_version():
+    """Expression SQL de la version suivante : horodatage courant, ou version + 1 s'il n'est pas plus grand."""
+    now = version_clock()
+    return case((Document.version + 1 > now, Document.version + 1), else_=now)
+
+
+@event.listens_for(Document, 'before_update')
+def _bump_document_version(mapper, connection, target):
+    """Modification par l'ORM (édition) : version suivante calculée en SQL (sûr face aux UPDATE concurrents)."""
+    if object_session(target).is_modified(target, include_collections=False): # Appelé aussi sans changement de colonne
+        target.version = next_version()
+
 # Modèle Reservation (pour le physique)
 class Reservation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
     reservation_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    # Statut: 'active', 'cancelled', 'honored'
+    # Statut: 'active' (en file), 'ready' (mis de côté), 'honored', 'cancelled', 'expired'
     status = db.Column(db.String(50), nullable=False, default='active')
+    queue_position = db.Column(db.Integer, nullable=True) # Numéro de passage dans la file du document (croissant)
+    hold_expires_at = db.Column(db.DateTime, nullable=True) # Fin de la mise de côté (statut 'ready')
 
     # backrefs définis dans User et Document
 
+    # Index : réservations d'un membre (tableau de bord), réservations actives d'un document,
+    # tête de file / rang d'un membre, mises de côté échues, numéro de passage unique par document
+    __table_args__ = (
+        db.Index('ix_reservation_user_status', 'user_id', 'status', 'reservation_date'),
+        db.Index('ix_reservation_status_document', 'status', 'document_id'),
+        db.Index('ix_reservation_document_queue', 'document_id', 'status', 'queue_position'),
+        db.Index('ix_reservation_status_hold', 'status', 'hold_expires_at'),
+        db.Index('ux_reservation_document_position', 'document_id', 'queue_position', unique=True),
+    )
+
     def __repr__(self):
         return f'<Reservation ID {self.id} - User {self.user_id} Doc {self.document_id} ({self.status})>'
 
@@ -89,5 +148,57 @@ class Loan(db.Model):
 
     # backrefs définis dans User et Document
 
+    # Index : prêts d'un membre (tri échéance), prêts actifs par document, prêts actifs par échéance
+    __table_args__ = (
+        db.Index('ix_loan_user_status_due', 'user_id', 'status', 'due_date'),
+        db.Index('ix_loan_status_document', 'status', 'document_id'),
+        db.Index('ix_loan_status_due', 'status', 'due_date'),
+    )
+
+    def __repr__(self):
+        return f'<Loan ID {self.id} - User {self.user_id} Doc {self.document_id} Due: {self.due_date} ({self.status})>'
+
+
+# Modèle PhysicalLoan (prêt d'un exemplaire physique, enregistré au comptoir)
+class PhysicalLoan(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=False)
+    loan_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    due_date = db.Column(db.DateTime, nullable=False)
+    returned_at = db.Column(db.DateTime, nullable=True)
+    # Statut: 'active', 'returned'
+    status = db.Column(db.String(50), nullable=False, default='active')
+
+    # backrefs définis dans User et Document
+
+    # Index : au plus un prêt actif par document (garde-fou en base), prêts d'un membre, retards
+    __table_args__ = (
+        db.Index('ux_physical_loan_active_document', 'document_id', unique=True,
+                 sqlite_where=db.text("status = 'active'"), postgresql_where=db.text("status = 'active'")),
+        db.Index('ix_physical_loan_user_status_due', 'user_id', 'status', 'due_date'),
+        db.Index('ix_physical_loan_status_due', 'status', 'due_date'),
+    )
+
+    def __repr__(self):
+        return f'<PhysicalLoan ID {self.id} - User {self.user_id} Doc {self.document_id} Due: {self.due_date} ({self.status})>'
+
+
+# Instantané des statistiques du tableau de bord gérant (une seule ligne, id=1)
+# Compteurs recalculés en une passe (TTL / rafraîchissement manuel) et ajustés au fil des routes
+class StatsSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    total_documents = db.Column(db.Integer, nullable=False, default=0)
+    physical_available = db.Column(db.Integer, nullable=False, default=0)
+    physical_borrowed = db.Column(db.Integer, nullable=False, default=0)
+    digital_documents = db.Column(db.Integer, nullable=False, default=0)
+    active_digital_loans = db.Column(db.Integer, nullable=False, default=0)
+    active_reservations = db.Column(db.Integer, nullable=False, default=0)
+    total_members = db.Column(db.Integer, nullable=False, default=0)
+    active_members = db.Column(db.Integer, nullable=False, default=0)
+    total_staff = db.Column(db.Integer, nullable=False, default=0)
+    most_loaned_json = db.Column(db.Text, nullable=True) # Top 5 [[titre, nb], ...]
+    computed_at = db.Column(db.DateTime, nullable=True) # None = à recalculer
+
     def __repr__(self):
-        return f'<Loan ID {self.id} - User {self.user_id} Doc {self.document_id} Due: {self.due_date} ({self.status})>'
\ No newline at end of file
+        return f'<StatsSnapshot calculé le {self.computed_at}>'
@@ -0,0 +1,101 @@
+# pagination.py
+# Pagination par curseur (keyset) : la page N coûte autant que la page 1 (pas d'OFFSET).
+from sqlalchemy import tuple_
+import base64
+import json
+
+
+def encode_cursor(values):
+    """Encode les valeurs de tri de la dernière ligne en curseur opaque (base64 url-safe)."""
+    raw = json.dumps(list(values), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _python_type(column):
+    """Type Python attendu pour une colonne de tri (None si inconnu, ex. score calculé)."""
+    try:
+        return column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return None
+
+
+def _valid_value(value, expected):
+    """Valeur scalaire compatible avec le type de la colonne (jamais de liste, d'objet ni de booléen)."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return False
+    if expected is int:
+        return isinstance(value, int)
+    if expected is float:
+        return isinstance(value, (int, float))
+    if expected is str:
+        return isinstance(value, str)
+    return True
+
+
+def decode_cursor(cursor, size, sort_columns=None):
+    """Décode un curseur ; retourne None s'il est invalide (on repart alors de la première page).
+    Avec `sort_columns`, chaque valeur doit correspondre au type de sa colonne (curseur forgé = ignoré)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    if sort_columns is not None and not all(
+            _valid_value(value, _python_type(column)) for value, column in zip(values, sort_columns)):
+        return None
+    return values
+
+
+class KeysetPage:
+    """Une page de résultats avec les curseurs vers les pages voisines."""
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_query(query, sort_columns, page_size, after_values=None, before_values=None):
+    """Requête d'une page (non exécutée) : colonnes de tri ajoutées, filtre sur la clé, page_size + 1 lignes."""
+    key = tuple_(*sort_columns)
+    query = query.add_columns(*sort_columns)
+    if before_values is not None:
+        query = query.filter(key < tuple_(*before_values)).order_by(*[col.desc() for col in sort_columns])
+    else:
+        if after_values is not None:
+            query = query.filter(key > tuple_(*after_values))
+        query = query.order_by(*sort_columns)
+    return query.limit(page_size + 1)
+
+
+def keyset_paginate(query, sort_columns, page_size, after=None, before=None):
+    """Pagine `query` sur le tuple `sort_columns` (ordre croissant, dernier élément unique, ex. id).
+
+    `after` / `before` sont des curseurs encodés (un seul à la fois). La requête ne doit pas être triée.
+    """
+    after_values = decode_cursor(after, len(sort_columns), sort_columns)
+    before_values = decode_cursor(before, len(sort_columns), sort_columns) if after_values is None else None
+    rows = keyset_query(query, sort_columns, page_size, after_values, before_values).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before_values is not None:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first_key = encode_cursor(rows[0][1:]) if rows else None
+    last_key = encode_cursor(rows[-1][1:]) if rows else None
+    if before_values is not None:
+        return KeysetPage(items, next_cursor=last_key, prev_cursor=first_key if has_more else None)
+    return KeysetPage(items, next_cursor=last_key if has_more else None,
+                      prev_cursor=first_key if after_values is not None else None)
@@ -0,0 +1,82 @@
+# passwords.py
+# Hachage des mots de passe : schéma et coût configurables (scrypt, PBKDF2, argon2 si installé), re-hachage
+# transparent à la connexion quand le schéma ou le coût change, calculs simultanés bornés par processus
+# (une rafale de connexions attend un créneau ou est refusée au lieu d'occuper tous les threads des workers).
+from werkzeug.security import generate_password_hash, check_password_hash
+from contextlib import contextmanager
+import threading
+import os
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import VerificationError, InvalidHashError
+except ImportError: # Dépendance optionnelle : pip install argon2-cffi
+    PasswordHasher = None
+
+SCHEMES = ('scrypt', 'pbkdf2', 'argon2')
+SCHEME = os.getenv('PASSWORD_SCHEME', 'scrypt')
+SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', 32768)) # Coût CPU/mémoire (128 * N * r octets)
+SCRYPT_R = int(os.getenv('PASSWORD_SCRYPT_R', 8))
+SCRYPT_P = int(os.getenv('PASSWORD_SCRYPT_P', 1))
+PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 600000))
+ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', 3))
+ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_ARGON2_MEMORY_KIB', 65536))
+# Hachages / vérifications simultanés par processus, et attente maximale d'un créneau (secondes)
+MAX_CONCURRENCY = int(os.getenv('PASSWORD_HASH_CONCURRENCY', 2))
+MAX_WAIT = float(os.getenv('PASSWORD_HASH_WAIT', 2))
+
+
+class HashingBusy(Exception):
+    """Aucun créneau de hachage libéré à temps : la demande est refusée (réessayer plus tard)."""
+
+
+class PasswordService:
+    def __init__(self, scheme=SCHEME, max_concurrency=MAX_CONCURRENCY, max_wait=MAX_WAIT):
+        if scheme not in SCHEMES:
+            raise ValueError(f"PASSWORD_SCHEME invalide : {scheme} (attendu : {', '.join(SCHEMES)})")
+        if scheme == 'argon2' and PasswordHasher is None:
+            raise ValueError("PASSWORD_SCHEME=argon2 nécessite le paquet argon2-cffi.")
+        self.scheme = scheme
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._argon2 = PasswordHasher(time_cost=ARGON2_TIME_COST, memory_cost=ARGON2_MEMORY_COST) if PasswordHasher else None
+        # Méthode werkzeug courante (préfixe des hachages produits, comparé pour décider d'un re-hachage)
+        self.method = f"scrypt:{SCRYPT_N}:{SCRYPT_R}:{SCRYPT_P}" if scheme == 'scrypt' else \
+            f"pbkdf2:sha256:{PBKDF2_ITERATIONS}" if scheme == 'pbkdf2' else None
+
+    @contextmanager
+    def _slot(self):
+        if not self._slots.acquire(timeout=self.max_wait):
+            raise HashingBusy()
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Hachage au schéma courant. Lève HashingBusy."""
+        with self._slot():
+            if self.scheme == 'argon2':
+                return self._argon2.hash(password)
+            return generate_password_hash(password, method=self.method)
+
+    def needs_rehash(self, stored):
+        """Vrai si le hachage enregistré n'utilise pas le schéma / coût courant."""
+        if stored.startswith('$argon2'):
+            return self.scheme != 'argon2' or self._argon2.check_needs_rehash(stored)
+        return self.scheme == 'argon2' or stored.split('$', 1)[0] != self.method
+
+    def verify(self, stored, password):
+        """(mot de passe correct, hachage à renouveler). Lève HashingBusy."""
+        if not stored:
+            return False, False
+        with self._slot():
+            if stored.startswith('$argon2'):
+                if self._argon2 is None:
+                    raise ValueError("Hachage argon2 enregistré mais argon2-cffi non installé.")
+                try:
+                    ok = self._argon2.verify(stored, password)
+                except (VerificationError, InvalidHashError):
+                    ok = False
+            else:
+                ok = check_password_hash(stored, password)
+        return ok, ok and self.needs_rehash(stored)
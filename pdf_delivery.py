@@ -0,0 +1,61 @@
+# pdf_delivery.py
+# Livraison des PDF de prêts numériques : URL signées courtes par prêt (sans accès base pour les requêtes Range suivantes),
+# réponses conditionnelles / partielles (206) ou délégation au proxy (X-Sendfile / X-Accel-Redirect).
+from flask import Response, send_from_directory
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from urllib.parse import quote
+from datetime import timezone
+import os
+import time
+
+DELIVERY_MODES = ('direct', 'x-sendfile', 'x-accel')
+
+
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt='pdf-loan-access')
+
+
+def make_token(secret_key, loan_id, user_id, file_path, due_date):
+    """Jeton signé (horodaté) donnant accès au fichier d'un prêt pour un utilisateur, jamais au-delà de l'échéance."""
+    due_timestamp = due_date.replace(tzinfo=timezone.utc).timestamp() # due_date stockée en UTC naïf
+    return _serializer(secret_key).dumps({'l': loan_id, 'u': user_id, 'f': file_path, 'd': due_timestamp})
+
+
+def load_token(secret_key, token, max_age):
+    """Retourne le contenu du jeton ou None si signature invalide, URL expirée ou échéance du prêt dépassée."""
+    try:
+        claims = _serializer(secret_key).loads(token, max_age=max_age)
+    except (SignatureExpired, BadSignature):
+        return None
+    return claims if claims['d'] > time.time() else None
+
+
+def seconds_left(claims, max_age):
+    """Durée de mise en cache navigateur : bornée par la validité de l'URL et l'échéance du prêt."""
+    return max(0, int(min(max_age, claims['d'] - time.time())))
+
+
+def is_safe_filename(file_path):
+    return bool(file_path) and '..' not in file_path and not file_path.startswith('/') and os.path.basename(file_path) == file_path
+
+
+def pdf_response(folder, file_path, mode='direct', accel_prefix='/protected-pdfs/', max_age=0):
+    """Réponse PDF selon le mode de livraison ; en direct, Range/If-Range/ETag/Last-Modified gérés par Werkzeug."""
+    if mode == 'x-accel':
+        # nginx sert le fichier (location internal) et gère lui-même Range et validateurs
+        response = Response(status=200, mimetype='application/pdf')
+        response.headers['X-Accel-Redirect'] = accel_prefix + quote(file_path)
+    elif mode == 'x-sendfile':
+        full_path = os.path.join(folder, file_path)
+        if not os.path.isfile(full_path):
+            raise FileNotFoundError(full_path)
+        response = Response(status=200, mimetype='application/pdf')
+        response.headers['X-Sendfile'] = full_path
+    else:
+        response = send_from_directory(folder, file_path, mimetype='application/pdf', as_attachment=False,
+                                       conditional=True, etag=True, max_age=max_age)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.cache_control.public = False # send_file marque 'public' : le PDF reste propre à l'emprunteur
+    response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    return response
@@ -0,0 +1,94 @@
+# query_budget.py
+# Budget de requêtes SQL par requête HTTP : détecte les régressions N+1 (échec bruyant en debug/test).
+from flask import g, request, has_app_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+
+log = logging.getLogger(__name__)
+
+_active_counters = ContextVar('active_query_counters', default=())
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Levée quand une route (ou un bloc assert_max_queries) dépasse son budget de requêtes."""
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+def query_budget(max_queries):
+    """Décorateur de vue : budget de requêtes SQL propre à la route (sinon QUERY_BUDGET_DEFAULT)."""
+    def decorator(view):
+        view._query_budget = max_queries
+        return view
+    return decorator
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and 'query_counter' in g:
+        g.query_counter.count += 1
+        g.query_counter.statements.append(statement)
+    for counter in _active_counters.get():
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """Compte les requêtes exécutées dans le bloc : `with count_queries() as counter: ...; counter.count`."""
+    counter = QueryCounter()
+    token = _active_counters.set(_active_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active_counters.reset(token)
+
+
+@contextmanager
+def assert_max_queries(max_queries):
+    """Échoue si le bloc exécute plus de `max_queries` requêtes SQL (pour les tests)."""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > max_queries:
+        raise QueryBudgetExceeded(_budget_message(max_queries, counter, 'bloc'))
+
+
+def _budget_message(max_queries, counter, where):
+    statements = '\n  '.join(counter.statements)
+    return f"{counter.count} requêtes SQL pour {where} (budget {max_queries}) :\n  {statements}"
+
+
+def init_app(app):
+    """Active le comptage par requête HTTP. Échec si dépassement quand QUERY_BUDGET_ENFORCE est vrai."""
+    app.config.setdefault('QUERY_BUDGET_DEFAULT', 20)
+    app.config.setdefault('QUERY_BUDGET_ENFORCE', None) # None = actif en debug/test uniquement
+
+    @app.before_request
+    def _start_query_budget():
+        g.query_counter = QueryCounter()
+
+    @app.after_request
+    def _check_query_budget(response):
+        counter = g.get('query_counter')
+        if counter is None:
+            return response
+        view = current_app.view_functions.get(request.endpoint)
+        max_queries = getattr(view, '_query_budget', current_app.config['QUERY_BUDGET_DEFAULT'])
+        enforce = current_app.config['QUERY_BUDGET_ENFORCE']
+        if enforce is None:
+            enforce = current_app.debug or current_app.testing
+        if enforce:
+            response.headers['X-Query-Count'] = str(counter.count)
+        if counter.count > max_queries:
+            message = _budget_message(max_queries, counter, request.endpoint)
+            if enforce:
+                raise QueryBudgetExceeded(message)
+            log.warning("[Query Budget] %s", message.splitlines()[0], extra={'event': 'db.query_budget', 'queries': counter.count})
+        return response
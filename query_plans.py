@@ -0,0 +1,82 @@
+# query_plans.py
+# Vérification EXPLAIN QUERY PLAN (SQLite) des requêtes chaudes de chaque route : aucune ne doit parcourir une table entière.
+# Les requêtes sont construites par les mêmes fonctions que les routes (SQL identique à la production).
+from sqlalchemy import select
+from sqlalchemy.orm import raiseload
+from models import db, User, Document, Loan, StatsSnapshot
+from pagination import keyset_query
+import api
+import reservation_queue
+import search_index
+import stats
+import re
+
+PAGE_SIZE = 24
+SEARCH_SAMPLE = "horla maupassant" # Saisie représentative de la recherche catalogue
+_FTS_MATCH = re.compile(r'VIRTUAL TABLE INDEX \d+:\S*M') # Contrainte MATCH passée à la table FTS5
+
+
+def _catalogue_queries(route, query_builder):
+    """Première page, page suivante et recherche (FTS5 si l'index existe) d'une liste paginée du catalogue."""
+    sort_columns = [Document.title, Document.id]
+    search_builder, search_sort = search_index.apply_search(query_builder, SEARCH_SAMPLE)
+    return [
+        (route, 'première page (tri titre, id)', keyset_query(query_builder, sort_columns, PAGE_SIZE).statement),
+        (route, 'page suivante (curseur titre, id)',
+         keyset_query(query_builder, sort_columns, PAGE_SIZE, after_values=['M', 1]).statement),
+        (route, 'recherche, première page',
+         keyset_query(search_builder, search_sort, PAGE_SIZE).statement),
+        (route, 'recherche, page suivante',
+         keyset_query(search_builder, search_sort, PAGE_SIZE, after_values=[-1.0, 1]).statement),
+    ]
+
+
+def hot_queries():
+    """Requêtes représentatives des routes, sous forme (route, description, statement)."""
+    return [
+        ('dashboard (membre)', 'prêts actifs du membre',
+         Loan.query.filter_by(user_id=1, status='active').order_by(Loan.due_date).statement),
+        ('dashboard (membre)', 'réservations en cours du membre (avec rang)',
+         reservation_queue.member_reservations(1).statement),
+        # Recalcul complet (stats.counters_statement) exclu : une passe par TTL, hors requête, parcours voulu
+        ('dashboard (gérant)', 'instantané des statistiques',
+         select(StatsSnapshot).where(StatsSnapshot.id == stats.SNAPSHOT_ID)),
+        ('dashboard (gérant)', 'documents numériques les plus prêtés', stats.most_loaned_query().statement),
+        ('dashboard (gérant)', 'liste des membres',
+         User.query.options(raiseload('*')).filter_by(role='membre').order_by(User.username).statement),
+        *_catalogue_queries('catalogue', Document.query),
+        *_catalogue_queries('api_documents', api.filter_documents(
+            Document.query.options(api.load_fields(api.LIST_FIELDS)), status='disponible')),
+        ('document_detail', 'prêt en cours du membre',
+         Loan.query.filter_by(user_id=1, document_id=1, status='active').statement),
+        ('document_detail', 'réservation en cours du membre',
+         reservation_queue.open_reservation(1, 1).statement),
+        ('borrow_digital', 'prêt existant',
+         Loan.query.filter_by(user_id=1, document_id=1, status='active').statement),
+        ('reserve_document', 'réservation existante', reservation_queue.open_reservation(1, 1).statement),
+        ('login', 'utilisateur par nom',
+         User.query.filter_by(username='membre').statement),
+    ]
+
+
+def explain(statement):
+    """Retourne les lignes 'detail' du plan SQLite de la requête."""
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).fetchall()
+    return [row[-1] for row in rows]
+
+
+def is_full_scan(detail):
+    """'SCAN table' sans index = parcours complet ('SCAN t USING INDEX ...', 'SEARCH ...' et la table FTS5 filtrée
+    par MATCH, 'VIRTUAL TABLE INDEX n:M...', sont acceptés)."""
+    return detail.startswith('SCAN ') and 'USING' not in detail and not _FTS_MATCH.search(detail)
+
+
+
+def check_query_plans():
+    """Retourne [(route, description, plan, ok)] pour chaque requête chaude."""
+    results = []
+    for route, description, statement in hot_queries():
+        plan = explain(statement)
+        results.append((route, description, plan, not any(is_full_scan(d) for d in plan)))
+    return results
@@ -0,0 +1,127 @@
+# rate_limit.py
+# Limitation de débit par seau à jetons (token bucket) pour les routes coûteuses : clé = utilisateur connecté, sinon IP.
+# État partagé entre workers gunicorn dans un fichier SQLite local : chaque passage est un seul UPSERT conditionnel
+# (atomique, sans verrou applicatif). Dépassement : 429 immédiat avec Retry-After, avant tout travail de la route.
+from flask import request, session, jsonify, make_response, current_app
+import logging
+import math
+import sqlite3
+import threading
+import time
+import os
+
+log = logging.getLogger(__name__)
+
+PRUNE_EVERY = 1000 # Passages entre deux purges des seaux inactifs
+IDLE_SECONDS = 3600 # Seau inactif depuis plus longtemps = plein : sa ligne peut être supprimée
+
+
+def parse_budget(text):
+    """'10/60' -> (capacité 10 jetons, recharge 10 jetons par 60 s). '0' ou vide = pas de limite."""
+    text = (text or '').strip()
+    if not text or text == '0':
+        return None
+    capacity, _, period = text.partition('/')
+    capacity, period = float(capacity), float(period or 1)
+    if capacity < 1 or period <= 0:
+        raise ValueError(f"Budget de débit invalide : {text} (attendu : jetons/secondes)")
+    return capacity, capacity / period
+
+
+def rate_limit(bucket, methods=None, only_if=None):
+    """Décorateur de vue : consomme un jeton du seau `bucket` (méthodes HTTP / condition optionnelles)."""
+    def decorator(view):
+        view._rate_limit = (bucket, methods, only_if)
+        return view
+    return decorator
+
+
+class TokenBucketLimiter:
+    def __init__(self, path, budgets):
+        self.path = path
+        self.budgets = {name: budget for name, budget in budgets.items() if budget} # nom -> (capacité, jetons/s)
+        self._local = threading.local() # Une connexion par thread (et par processus après fork)
+        self._calls = 0 # Passages de ce processus (purge périodique)
+        self._calls_lock = threading.Lock()
+        with sqlite3.connect(path, timeout=5) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS rate_bucket "
+                               "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        connection.close()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None) # Autocommit : un UPSERT = une transaction
+            connection.execute("PRAGMA synchronous=NORMAL") # État reconstructible : pas de fsync par passage
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def hit(self, bucket, identity, now=None):
+        """Consomme un jeton. Retourne (autorisé, secondes avant le prochain jeton)."""
+        capacity, rate = self.budgets[bucket]
+        key = f"{bucket}:{identity}"
+        now = time.time() if now is None else now
+        connection = self._connection()
+        # Recharge proportionnelle au temps écoulé, plafonnée à la capacité ; la mise à jour n'a lieu que s'il reste
+        # au moins un jeton (rowcount 0 = refus, l'état n'est pas modifié)
+        cursor = connection.execute(
+            "INSERT INTO rate_bucket (key, tokens, updated) VALUES (?1, ?2 - 1, ?4) "
+            "ON CONFLICT (key) DO UPDATE SET tokens = min(?2, tokens + (?4 - updated) * ?3) - 1, updated = ?4 "
+            "WHERE min(?2, tokens + (?4 - updated) * ?3) >= 1",
+            (key, capacity, rate, now))
+        with self._calls_lock:
+            self._calls += 1
+            prune = self._calls % PRUNE_EVERY == 0
+        if prune:
+            connection.execute("DELETE FROM rate_bucket WHERE updated < ?", (now - IDLE_SECONDS,))
+        if cursor.rowcount == 1:
+            return True, 0
+        row = connection.execute("SELECT tokens, updated FROM rate_bucket WHERE key = ?", (key,)).fetchone()
+        tokens = min(capacity, row[0] + (now - row[1]) * rate) if row else 0
+        return False, max(1, math.ceil((1 - tokens) / rate))
+
+
+def _identity():
+    """Utilisateur connecté, sinon adresse client (remote_addr corrigée par ProxyFix derrière un routeur)."""
+    user_id = session.get('user_id')
+    return f"u{user_id}" if user_id is not None else f"ip{request.remote_addr}"
+
+
+def _throttled_response(retry_after):
+    message = "Trop de requêtes, veuillez réessayer dans quelques instants."
+    if request.is_json:
+        response = jsonify({"reply": message, "retry_after": retry_after}) # Format attendu par le widget du chatbot
+    else:
+        response = make_response(message)
+        response.mimetype = 'text/plain'
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def init_app(app, limiter):
+    """Contrôle les routes décorées par rate_limit() avant leur exécution (désactivé si RATE_LIMIT_ENABLED est faux)."""
+    app.config.setdefault('RATE_LIMIT_ENABLED', True)
+
+    @app.before_request
+    def _check_rate_limit():
+        if not current_app.config['RATE_LIMIT_ENABLED']:
+            return None
+        view = current_app.view_functions.get(request.endpoint)
+        rule = getattr(view, '_rate_limit', None)
+        if rule is None:
+            return None
+        bucket, methods, only_if = rule
+        if bucket not in limiter.budgets or (methods and request.method not in methods) or (only_if and not only_if()):
+            return None
+        try:
+            allowed, retry_after = limiter.hit(bucket, _identity())
+        except sqlite3.Error as e: # Base indisponible : on laisse passer plutôt que de bloquer le site
+            log.warning("[Rate Limit] Erreur état partagé: %s", e)
+            return None
+        if allowed:
+            return None
+        log.info("[Rate Limit] %s limité", bucket, extra={'event': 'ratelimit.throttled', 'bucket': bucket,
+                                                          'retry_after': retry_after})
+        return _throttled_response(retry_after)
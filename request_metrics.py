@@ -0,0 +1,307 @@
+# request_metrics.py
+# Instrumentation des requêtes HTTP : nombre de requêtes SQL et temps base par requête (en-tête Server-Timing),
+# journal des requêtes SQL lentes (instruction, paramètres, route d'origine), métriques au format Prometheus.
+# Plusieurs workers gunicorn : chaque processus écrit ses deltas dans un fichier SQLite partagé (METRICS_PATH, par
+# défaut instance/metrics.db), /metrics additionne les compteurs de tous les processus (y compris ceux redémarrés)
+# et les jauges des vivants.
+from flask import g, request, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import closing
+import sqlite3
+import threading
+import time
+import os
+import logging
+
+# Bornes (secondes) des histogrammes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPSTREAM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+FLUSH_INTERVAL = 5 # Secondes entre deux écritures des deltas dans le fichier partagé
+MAX_LOGGED_PARAMS = 500 # Caractères des paramètres liés dans le journal des requêtes lentes
+
+log = logging.getLogger(__name__)
+
+# Familles exposées : nom -> (type, description)
+FAMILIES = {
+    'biblio_http_requests_total': ('counter', "Requêtes HTTP traitées, par route, méthode et code."),
+    'biblio_http_request_duration_seconds': ('histogram', "Durée de traitement des requêtes HTTP (jusqu'aux en-têtes)."),
+    'biblio_http_requests_in_flight': ('gauge', "Requêtes HTTP en cours de traitement (tous workers)."),
+    'biblio_db_queries_total': ('counter', "Requêtes SQL exécutées, par route."),
+    'biblio_db_query_seconds_total': ('counter', "Temps cumulé passé en base, par route."),
+    'biblio_db_slow_queries_total': ('counter', "Requêtes SQL au-delà du seuil SLOW_QUERY_MS, par route."),
+    'biblio_chat_upstream_seconds': ('histogram', "Durée des appels au modèle du chatbot (jusqu'au dernier fragment), par mode et issue."),
+    'biblio_fragment_cache_lookups_total': ('counter', "Recherches dans le cache des fragments HTML, par gabarit et résultat (hit/miss)."),
+}
+# Bornes de chaque histogramme (toutes exposées, même à zéro)
+HISTOGRAM_BUCKETS = {
+    'biblio_http_request_duration_seconds': LATENCY_BUCKETS,
+    'biblio_chat_upstream_seconds': UPSTREAM_BUCKETS,
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def format_value(value):
+    """Valeur en pleine précision : entier tel quel (compteurs), sinon repr du flottant (pas de '%g' arrondi)."""
+    value = float(value)
+    if value.is_integer() and abs(value) < 2 ** 53:
+        return str(int(value))
+    return repr(value)
+
+
+def _sample(name, labels, value):
+    return f"{name}{{{labels}}} {format_value(value)}" if labels else f"{name} {format_value(value)}"
+
+
+class MetricsRegistry:
+    """Compteurs / histogrammes / jauges de ce processus ; agrégation inter-processus optionnelle (fichier SQLite)."""
+
+    def __init__(self, path=None, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._totals = {}  # (série, labels, le) -> valeur cumulée dans ce processus
+        self._pending = {} # idem, deltas pas encore écrits dans le fichier partagé
+        self._gauges = {}  # (série, labels) -> valeur courante dans ce processus
+        self._flusher_pid = None
+        if path:
+            with closing(self._connect()) as connection, connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS metric_counter "
+                    "(name TEXT NOT NULL, labels TEXT NOT NULL, le TEXT NOT NULL, value REAL NOT NULL, "
+                    "PRIMARY KEY (name, labels, le))")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS metric_gauge "
+                    "(pid INTEGER NOT NULL, name TEXT NOT NULL, labels TEXT NOT NULL, value REAL NOT NULL, "
+                    "PRIMARY KEY (pid, name, labels))")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _add(self, key, amount):
+        self._totals[key] = self._totals.get(key, 0) + amount
+        if self.path:
+            self._pending[key] = self._pending.get(key, 0) + amount
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._add((name, labels, ''), amount)
+        self._ensure_flusher()
+
+    def observe(self, name, labels, value):
+        """Histogramme cumulatif (bornes HISTOGRAM_BUCKETS) : _bucket{le=...} pour chaque borne >= valeur, +Inf, _sum, _count."""
+        with self._lock:
+            for bound in HISTOGRAM_BUCKETS[name]:
+                if value <= bound:
+                    self._add((name + '_bucket', labels, repr(bound)), 1)
+            self._add((name + '_bucket', labels, '+Inf'), 1)
+            self._add((name + '_sum', labels, ''), value)
+            self._add((name + '_count', labels, ''), 1)
+        self._ensure_flusher()
+
+    def gauge_add(self, name, labels, delta):
+        with self._lock:
+            self._gauges[(name, labels)] = self._gauges.get((name, labels), 0) + delta
+
+    # --- Agrégation entre processus ---
+    def _ensure_flusher(self):
+        """Thread d'écriture périodique, démarré dans chaque processus (après le fork des workers)."""
+        if not self.path or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Ajoute les deltas de ce processus au fichier partagé et y remplace ses jauges."""
+        if not self.path:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            gauges = dict(self._gauges)
+        pid = os.getpid()
+        try:
+            with closing(self._connect()) as connection, connection:
+                connection.executemany(
+                    "INSERT INTO metric_counter (name, labels, le, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value",
+                    [(name, labels, le, value) for (name, labels, le), value in pending.items()])
+                connection.execute("DELETE FROM metric_gauge WHERE pid = ?", (pid,))
+                connection.executemany(
+                    "INSERT INTO metric_gauge (pid, name, labels, value) VALUES (?, ?, ?, ?)",
+                    [(pid, name, labels, value) for (name, labels), value in gauges.items()])
+        except sqlite3.Error as e:
+            log.warning("[Metrics] Erreur écriture %s: %s", self.path, e)
+            with self._lock: # Deltas conservés pour la prochaine écriture
+                for key, value in pending.items():
+                    self._pending[key] = self._pending.get(key, 0) + value
+
+    def _collect_shared(self):
+        self.flush()
+        with closing(self._connect()) as connection, connection:
+            counters = {(name, labels, le): value for name, labels, le, value in
+                        connection.execute("SELECT name, labels, le, value FROM metric_counter")}
+            gauges, dead = {}, set()
+            for pid, name, labels, value in connection.execute("SELECT pid, name, labels, value FROM metric_gauge"):
+                if pid in dead or not _process_alive(pid):
+                    dead.add(pid); continue
+                gauges[(name, labels)] = gauges.get((name, labels), 0) + value
+            if dead: # Worker arrêté : ses jauges ne comptent plus (ses compteurs restent acquis)
+                connection.executemany("DELETE FROM metric_gauge WHERE pid = ?", [(pid,) for pid in dead])
+        return counters, gauges
+
+    def collect(self):
+        """(compteurs, jauges) agrégés : tous les processus si METRICS_PATH, sinon ce processus seul."""
+        if self.path:
+            return self._collect_shared()
+        with self._lock:
+            return dict(self._totals), dict(self._gauges)
+
+    def render(self):
+        """Texte au format d'exposition Prometheus (version 0.0.4)."""
+        counters, gauges = self.collect()
+        lines = []
+        for family, (kind, description) in FAMILIES.items():
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {kind}")
+            if kind == 'gauge':
+                series = sorted((labels, value) for (name, labels), value in gauges.items() if name == family)
+                if not series:
+                    lines.append(f"{family} 0")
+                for labels, value in series:
+                    lines.append(_sample(family, labels, value))
+            elif kind == 'histogram':
+                for labels in sorted(labels for (name, labels, le) in counters if name == family + '_count'):
+                    for le in [repr(bound) for bound in HISTOGRAM_BUCKETS[family]] + ['+Inf']:
+                        all_labels = ','.join(part for part in (labels, f'le="{le}"') if part)
+                        lines.append(_sample(family + '_bucket', all_labels, counters.get((family + '_bucket', labels, le), 0)))
+                    lines.append(_sample(family + '_sum', labels, counters.get((family + '_sum', labels, ''), 0)))
+                    lines.append(_sample(family + '_count', labels, counters[(family + '_count', labels, '')]))
+            else:
+                for labels, value in sorted((labels, value) for (name, labels, le), value in counters.items() if name == family):
+                    lines.append(_sample(family, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# --- Temps base et requêtes lentes (écouteurs SQLAlchemy globaux) ---
+_slow_query_seconds = None # Fixé par init_app (None = pas de journal)
+_registry = None
+
+
+def _current_route():
+    if has_request_context():
+        return request.endpoint or 'none'
+    return 'hors-requete' # CLI, balayage en arrière-plan, pool du chatbot
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append((id(cursor), time.perf_counter()))
+
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_query_timer(exception_context):
+    """Instruction en échec : after_cursor_execute n'est pas appelé, on retire son départ de la pile."""
+    connection, context = exception_context.connection, exception_context.execution_context
+    cursor = getattr(context, 'cursor', None) # Pas de curseur : échec avant before_cursor_execute
+    if connection is None or cursor is None:
+        return
+    started = connection.info.get('query_started')
+    if started and started[-1][0] == id(cursor):
+        started.pop()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query_time(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()[1]
+    if has_request_context() and 'request_metrics' in g:
+        g.request_metrics['queries'] += 1
+        g.request_metrics['db_seconds'] += elapsed
+    if _slow_query_seconds is not None and elapsed >= _slow_query_seconds:
+        route = _current_route()
+        params = repr(parameters)
+        if len(params) > MAX_LOGGED_PARAMS:
+            params = params[:MAX_LOGGED_PARAMS] + '...'
+        log.warning("[Slow Query] %.1f ms route=%s", elapsed * 1000, route,
+                    extra={'event': 'db.slow_query', 'duration_ms': round(elapsed * 1000, 1),
+                           'statement': ' '.join(statement.split()), 'params': params})
+        if _registry is not None:
+            _registry.inc('biblio_db_slow_queries_total', format_labels(route=route))
+
+
+def observe_chat_upstream(mode, seconds, outcome):
+    """Latence d'un appel au modèle (appelé depuis le pool du chatbot)."""
+    if _registry is not None:
+        _registry.observe('biblio_chat_upstream_seconds', format_labels(mode=mode, outcome=outcome), seconds)
+
+
+def observe_fragment_cache(template, hit):
+    """Succès / échec du cache des fragments (cartes, détail)."""
+    if _registry is not None:
+        _registry.inc('biblio_fragment_cache_lookups_total', format_labels(fragment=template, result='hit' if hit else 'miss'))
+
+
+def init_app(app, registry):
+    """Mesures par requête (Server-Timing, histogrammes, en cours) ; journal des requêtes SQL lentes."""
+    global _slow_query_seconds, _registry
+    app.config.setdefault('SLOW_QUERY_MS', 200) # 0 = désactivé
+    app.config.setdefault('SERVER_TIMING', True)
+    _slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000 if app.config['SLOW_QUERY_MS'] > 0 else None
+    _registry = registry
+
+    @app.before_request
+    def _start_request_metrics():
+        g.request_metrics = {'started': time.perf_counter(), 'queries': 0, 'db_seconds': 0.0}
+        registry.gauge_add('biblio_http_requests_in_flight', '', 1)
+
+    @app.after_request
+    def _record_request_metrics(response):
+        metrics = g.get('request_metrics')
+        if metrics is None:
+            return response
+        elapsed = time.perf_counter() - metrics['started']
+        route = request.endpoint or 'none'
+        registry.inc('biblio_http_requests_total', format_labels(route=route, method=request.method, status=response.status_code))
+        registry.observe('biblio_http_request_duration_seconds', format_labels(route=route, method=request.method), elapsed)
+        if metrics['queries']:
+            registry.inc('biblio_db_queries_total', format_labels(route=route), metrics['queries'])
+            registry.inc('biblio_db_query_seconds_total', format_labels(route=route), metrics['db_seconds'])
+        if current_app.config['SERVER_TIMING']:
+            response.headers.add('Server-Timing', f'db;dur={metrics["db_seconds"] * 1000:.1f};desc="{metrics["queries"]} SQL"')
+            response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+        return response
+
+    @app.teardown_request
+    def _end_request_metrics(exc):
+        if g.pop('request_metrics', None) is not None: # Aussi après une exception
+            registry.gauge_add('biblio_http_requests_in_flight', '', -1)
@@ -0,0 +1,149 @@
+# reservation_queue.py
+# File d'attente FIFO des réservations physiques par document : numéro de passage (queue_position, unique par document)
+# attribué à l'insertion, remise au premier de la file par un seul UPDATE au retour, expiration des mises de côté par lots.
+# Statuts : 'active' (en file), 'ready' (document mis de côté jusqu'à hold_expires_at), 'honored', 'cancelled', 'expired'.
+from sqlalchemy import select, update, func, exists, tuple_, case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased, joinedload
+from models import db, Document, Reservation, next_version
+from datetime import datetime, timedelta
+import stats
+
+HOLD_DAYS = 3 # Délai de retrait d'un document mis de côté
+OPEN_STATUSES = ('active', 'ready') # Réservations en cours (file + mise de côté)
+ENQUEUE_ATTEMPTS = 3 # Numéro de passage déjà pris par une insertion concurrente : nouvel essai
+
+
+def next_position(doc_id):
+    """Expression SQL du prochain numéro de passage (évalué dans l'INSERT : pas de lecture préalable)."""
+    other = aliased(Reservation)
+    return select(func.coalesce(func.max(other.queue_position), 0) + 1) \
+        .where(other.document_id == doc_id).scalar_subquery()
+
+
+def enqueue(user_id, doc_id):
+    """Réservation en fin de file (sans commit). L'index unique (document, numéro) refuse un numéro pris entre-temps
+    par une insertion concurrente : nouvel essai dans un point de sauvegarde, la transaction appelante est conservée."""
+    for attempt in range(ENQUEUE_ATTEMPTS):
+        try:
+            with db.session.begin_nested():
+                resa = Reservation(user_id=user_id, document_id=doc_id, queue_position=next_position(doc_id))
+                db.session.add(resa)
+            return resa
+        except IntegrityError:
+            if attempt == ENQUEUE_ATTEMPTS - 1:
+                raise
+
+
+def _head_of_queue(document_ids):
+    """Condition : réservation en tête de file (une seule par document, ordre numéro puis id) sans mise de côté en cours."""
+    other = aliased(Reservation)
+    head = select(other.id).where(other.document_id == Reservation.document_id, other.status == 'active') \
+        .order_by(other.queue_position, other.id).limit(1).scalar_subquery()
+    held = exists().where(other.document_id == Reservation.document_id, other.status == 'ready')
+    return (Reservation.document_id.in_(document_ids), Reservation.status == 'active', Reservation.id == head, ~held)
+
+
+def hand_off(document_ids, now, hold_days=HOLD_DAYS):
+    """Met de côté chaque document pour le premier de sa file (un seul UPDATE). Retourne le nombre de remises."""
+    result = db.session.execute(
+        update(Reservation).where(*_head_of_queue(document_ids))
+        .values(status='ready', hold_expires_at=now + timedelta(days=hold_days))
+        .execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+def _settle_documents(document_ids):
+    """Documents 'reserve' sans mise de côté restante -> 'disponible'. Retourne le nombre."""
+    held = exists().where(Reservation.document_id == Document.id, Reservation.status == 'ready')
+    result = db.session.execute(
+        update(Document).where(Document.id.in_(document_ids), Document.status == 'reserve', ~held)
+        .values(status='disponible', version=next_version()).execution_options(synchronize_session=False))
+    if result.rowcount:
+        stats.bump(physical_available=result.rowcount)
+    return result.rowcount
+
+
+def release_hold(doc_id, hold_days=HOLD_DAYS):
+    """Mise de côté libérée (annulation) : au suivant de la file, sinon document disponible. Sans commit."""
+    if not hand_off([doc_id], datetime.utcnow(), hold_days):
+        _settle_documents([doc_id])
+
+
+def cancel_hold(doc_id):
+    """Annule la mise de côté en cours d'un document (sans remise au suivant). Retourne le nombre."""
+    result = db.session.execute(
+        update(Reservation).where(Reservation.document_id == doc_id, Reservation.status == 'ready')
+        .values(status='cancelled').execution_options(synchronize_session=False))
+    if result.rowcount:
+        stats.bump(active_reservations=-result.rowcount)
+    return result.rowcount
+
+
+def cancel_all(doc_id):
+    """Annule toutes les réservations en cours d'un document (un UPDATE). Retourne le nombre."""
+    result = db.session.execute(
+        update(Reservation).where(Reservation.document_id == doc_id, Reservation.status.in_(OPEN_STATUSES))
+        .values(status='cancelled').execution_options(synchronize_session=False))
+    if result.rowcount:
+        stats.bump(active_reservations=-result.rowcount)
+    return result.rowcount
+
+
+def expire_holds(now, batch_size=500, hold_days=HOLD_DAYS):
+    """Mises de côté non retirées -> 'expired', puis remise au suivant ou document disponible. Par lots ; retourne le nombre."""
+    total = 0
+    while True:
+        rows = db.session.execute(
+            select(Reservation.id, Reservation.document_id)
+            .where(Reservation.status == 'ready', Reservation.hold_expires_at < now).limit(batch_size)).all()
+        if not rows:
+            db.session.commit()
+            return total
+        result = db.session.execute(
+            update(Reservation).where(Reservation.id.in_([row.id for row in rows]), Reservation.status == 'ready')
+            .values(status='expired').execution_options(synchronize_session=False))
+        if result.rowcount:
+            stats.bump(active_reservations=-result.rowcount)
+        document_ids = list({row.document_id for row in rows})
+        hand_off(document_ids, now, hold_days)
+        _settle_documents(document_ids)
+        db.session.commit()
+        total += result.rowcount
+        if len(rows) < batch_size:
+            return total
+
+
+def member_reservations(user_id):
+    """Réservations en cours d'un membre avec leur rang (tableau de bord), document chargé dans la même requête."""
+    return db.session.query(Reservation, position_column()) \
+        .options(joinedload(Reservation.document)) \
+        .filter(Reservation.user_id == user_id, Reservation.status.in_(OPEN_STATUSES)) \
+        .order_by(Reservation.reservation_date.desc())
+
+
+def open_reservation(user_id, doc_id):
+    """Requête de la réservation en cours d'un membre pour un document (détail, nouvelle réservation)."""
+    return Reservation.query.filter(Reservation.user_id == user_id, Reservation.document_id == doc_id,
+                                    Reservation.status.in_(OPEN_STATUSES))
+
+
+def position_column():
+    """Colonne SQL : rang dans la file (1 = en tête) pour une réservation 'active', 0 si mise de côté."""
+    other = aliased(Reservation)
+    ahead = select(func.count(other.id)).where(
+        other.document_id == Reservation.document_id, other.status == 'active',
+        tuple_(other.queue_position, other.id) < tuple_(Reservation.queue_position, Reservation.id)
+    ).correlate(Reservation).scalar_subquery()
+    return case((Reservation.status == 'ready', 0), else_=ahead + 1)
+
+
+def position(resa):
+    """Rang d'une réservation dans sa file (index document + statut + position)."""
+    if resa.status == 'ready':
+        return 0
+    ahead = db.session.execute(
+        select(func.count(Reservation.id)).where(
+            Reservation.document_id == resa.document_id, Reservation.status == 'active',
+            tuple_(Reservation.queue_position, Reservation.id) < tuple_(resa.queue_position, resa.id))).scalar()
+    return ahead + 1
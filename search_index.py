@@ -0,0 +1,141 @@
+# search_index.py
+# Index plein texte (SQLite FTS5) du catalogue : titre, auteur, résumé.
+from sqlalchemy import text, select, literal_column, or_, false
+from models import db, Document
+import time
+import re
+
+FTS_TABLE = 'document_fts'
+# Tokenizer unicode61 sans diacritiques : "Misérables" == "miserables"
+FTS_TOKENIZE = 'unicode61 remove_diacritics 2'
+# Poids bm25 par colonne (titre > auteur > résumé)
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+RECHECK_SECONDS = 30 # Index absent : nouvelle vérification après ce délai (créé entre-temps par une migration)
+# Élisions françaises (l', d', qu'...) retirées avant découpage : "l'explosion" -> "explosion"
+_ELISION = re.compile(r"\b(?:qu|[cdjlmnst])['’]", re.IGNORECASE)
+
+_fts_available = None # Cache par processus : True définitif, False revérifié (None = pas encore vérifié)
+_fts_checked_at = 0.0
+
+
+def is_available():
+    """Indique si la table FTS5 existe (SQLite uniquement). Un résultat négatif n'est gardé que RECHECK_SECONDS."""
+    global _fts_available, _fts_checked_at
+    if _fts_available or (_fts_available is not None and time.monotonic() - _fts_checked_at < RECHECK_SECONDS):
+        return _fts_available
+    _fts_available = db.engine.dialect.name == 'sqlite' and db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {'name': FTS_TABLE}
+    ).first() is not None
+    _fts_checked_at = time.monotonic()
+    return _fts_available
+
+
+def create_table(connection):
+    """Crée la table FTS5 sur `connection` et la remplit depuis document si elle n'existait pas. Retourne True si créée."""
+    if connection.dialect.name != 'sqlite':
+        return False
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {'name': FTS_TABLE}).first()
+    if exists:
+        return False
+    connection.execute(text(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} "
+        f"USING fts5(title, author, summary, tokenize='{FTS_TOKENIZE}', prefix='2 3')"
+    ))
+    connection.execute(text(
+        f"INSERT INTO {FTS_TABLE}(rowid, title, author, summary) "
+        "SELECT id, title, coalesce(author, ''), coalesce(summary, '') FROM document"
+    ))
+    return True
+
+
+def create_index():
+    """Crée (et remplit) la table FTS5 si elle n'existe pas encore."""
+    global _fts_available
+    if db.engine.dialect.name != 'sqlite':
+        _fts_available = False
+        return False
+    create_table(db.session.connection())
+    db.session.commit()
+    _fts_available = True
+    return True
+
+
+def rebuild_index():
+    """Reconstruit entièrement l'index depuis la table document. Retourne le nombre de lignes indexées."""
+    if db.engine.dialect.name != 'sqlite':
+        return 0
+    db.session.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+    db.session.commit()
+    create_index() # Table recréée et remplie
+    db.session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')"))
+    db.session.commit()
+    return db.session.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+
+
+def index_document(doc):
+    """Ajoute/remplace l'entrée d'un document (dans la transaction courante, sans commit)."""
+    if not is_available():
+        return
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': doc.id})
+    db.session.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, title, author, summary) VALUES (:id, :title, :author, :summary)"),
+        {'id': doc.id, 'title': doc.title or '', 'author': doc.author or '', 'summary': doc.summary or ''}
+    )
+
+
+def index_many(rows, replace=True):
+    """Ajoute/remplace plusieurs entrées (dicts id/title/author/summary) en deux executemany, sans commit.
+    replace=False : documents tout juste insérés, pas d'ancienne entrée à retirer."""
+    if not rows or not is_available():
+        return
+    if replace:
+        db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), [{'id': row['id']} for row in rows])
+    db.session.execute(
+        text(f"INSERT INTO {FTS_TABLE}(rowid, title, author, summary) VALUES (:id, :title, :author, :summary)"),
+        [{'id': row['id'], 'title': row['title'] or '', 'author': row.get('author') or '', 'summary': row.get('summary') or ''}
+         for row in rows]
+    )
+
+
+def remove_document(doc_id):
+    """Retire un document de l'index (dans la transaction courante, sans commit)."""
+    if not is_available():
+        return
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': doc_id})
+
+
+def build_match_query(search_query):
+    """Transforme la saisie utilisateur en requête MATCH sûre (ET implicite, recherche par préfixe).
+    Les mots d'une lettre sont cherchés tels quels (un préfixe d'une lettre parcourt tout le vocabulaire)."""
+    tokens = re.findall(r'\w+', _ELISION.sub(' ', search_query or ''))
+    return ' '.join('"' + token.replace('"', '""') + '"' + ('*' if len(token) > 1 else '') for token in tokens)
+
+
+def match_subquery(search_query):
+    """Sous-requête (doc_id, score) des documents correspondants ; score bm25, plus petit = plus pertinent."""
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    return select(
+        literal_column('rowid').label('doc_id'),
+        literal_column(f'bm25({FTS_TABLE}, {weights})').label('score')
+    ).select_from(text(FTS_TABLE)).where(
+        text(f'{FTS_TABLE} MATCH :fts_query').bindparams(fts_query=build_match_query(search_query))
+    ).subquery('fts_match')
+
+
+def apply_search(query_builder, search_query):
+    """Filtre une requête Document sur la recherche (repli ILIKE si l'index est absent).
+
+    Retourne (requête non triée, colonnes de tri) : score de pertinence puis id, ou titre puis id en repli.
+    """
+    if is_available():
+        if not build_match_query(search_query):
+            return query_builder.filter(false()), [Document.title, Document.id]
+        matches = match_subquery(search_query)
+        query_builder = query_builder.join(matches, Document.id == matches.c.doc_id)
+        return query_builder, [matches.c.score, Document.id]
+    # Repli (index absent ou base non SQLite) : ancien comportement ILIKE
+    search_term = f"%{search_query}%"
+    query_builder = query_builder.filter(or_(Document.title.ilike(search_term), Document.author.ilike(search_term)))
+    return query_builder, [Document.title, Document.id]
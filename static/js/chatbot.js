@@ -26,30 +26,24 @@ async function sendChatMessage() {
     appendTypingIndicator(messagesContainer);
 
     try {
-        const response = await fetch('/chat', { /* ... options fetch ... */
+        // Variante streamée : la réponse arrive fragment par fragment (Server-Sent Events)
+        const response = await fetch('/chat/stream', {
              method: 'POST',
-             headers: { 'Content-Type': 'application/json', },
+             headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
              body: JSON.stringify({ message: messageToSend })
          });
 
         // *** Supprimer l'indicateur DÈS qu'on a une réponse (succès ou erreur) ***
         removeTypingIndicator();
 
-        if (!response.ok) {
+        if (!response.ok || !response.body) {
             console.error("Erreur serveur:", response.status, response.statusText);
             let errorReply = "Désolé, une erreur serveur est survenue.";
             try { const errorData = await response.json(); if (errorData && errorData.reply) errorReply = errorData.reply; } catch(e) {}
             // Afficher le message d'erreur après avoir enlevé l'indicateur
             appendMessage('Bot Erreur', errorReply, messagesContainer, true);
         } else {
-            const data = await response.json();
-            console.log("Réponse reçue:", data);
-            if (data && data.reply) {
-                // Afficher la réponse de l'IA après avoir enlevé l'indicateur
-                appendMessage('BiblioBot IA', data.reply, messagesContainer, true);
-            } else {
-                 appendMessage('Bot Erreur', "Réponse invalide du serveur.", messagesContainer, true);
-            }
+            await readChatStream(response, messagesContainer);
         }
     } catch (error) {
          // *** Supprimer l'indicateur AUSSI en cas d'erreur réseau ***
@@ -59,6 +53,47 @@ async function sendChatMessage() {
     }
 }
 
+// Lit le flux SSE (événements token / done / error) et remplit une bulle au fil de l'eau
+async function readChatStream(response, messagesContainer) {
+    const bubble = appendMessage('BiblioBot IA', '', messagesContainer, true);
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let reply = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let separator;
+        while ((separator = buffer.indexOf('\n\n')) >= 0) {
+            const rawEvent = buffer.slice(0, separator);
+            buffer = buffer.slice(separator + 2);
+            let eventName = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            const payload = data ? JSON.parse(data) : {};
+            if (eventName === 'error') {
+                bubble.parentElement.remove();
+                appendMessage('Bot Erreur', payload.reply || "Réponse invalide du serveur.", messagesContainer, true);
+                return;
+            }
+            if (payload.token) {
+                reply += payload.token;
+                bubble.innerHTML = reply.replace(/\n/g, '<br>');
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            }
+        }
+    }
+    if (!reply) {
+        bubble.parentElement.remove();
+        appendMessage('Bot Erreur', "Réponse invalide du serveur.", messagesContainer, true);
+    }
+}
+
 // Fonction pour ajouter un message à la zone de chat
 function appendMessage(sender, message, container, isBot) {
     const messageDiv = document.createElement('div');
@@ -79,6 +114,7 @@ function appendMessage(sender, message, container, isBot) {
     messageDiv.appendChild(messageBubble);
     container.appendChild(messageDiv);
     container.scrollTop = container.scrollHeight;
+    return messageBubble; // Permet de compléter la bulle (streaming)
 }
 
 // Fonction contenant la logique de réponse (très simple) du bot
@@ -0,0 +1,128 @@
+# static_assets.py
+# Fichiers statiques : URL versionnées par empreinte du contenu (?v=), Cache-Control immutable,
+# variantes précompressées (.br / .gz, générées par `flask precompress-static`) servies selon Accept-Encoding.
+from flask import request, send_from_directory
+import hashlib
+import mimetypes
+import gzip
+import os
+import threading
+
+try:
+    import brotli
+except ImportError: # brotli absent : seules les variantes gzip sont générées
+    brotli = None
+
+IMMUTABLE_MAX_AGE = 31536000 # 1 an
+# Noms déjà uniques (UUID à l'upload, variantes dérivées) : contenu jamais modifié, pas d'empreinte nécessaire
+CONTENT_ADDRESSED_PREFIXES = ('uploads/covers/',)
+# Types texte seulement : les images (PNG, JPEG, WebP) sont déjà compressées
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.svg', '.html', '.json', '.txt', '.map'}
+ENCODINGS = (('br', '.br'), ('gzip', '.gz')) # Ordre de préférence
+
+_fingerprints = {} # chemin relatif -> (mtime, empreinte)
+_lock = threading.Lock()
+
+
+def fingerprint(static_folder, filename):
+    """Empreinte courte du contenu (recalculée seulement si le fichier change), None si fichier absent."""
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    with _lock:
+        cached = _fingerprints.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.md5(f.read()).hexdigest()[:10]
+    with _lock:
+        _fingerprints[filename] = (mtime, digest)
+    return digest
+
+
+def is_content_addressed(filename):
+    return filename.startswith(CONTENT_ADDRESSED_PREFIXES)
+
+
+def _accepted_encodings():
+    accept = request.accept_encodings
+    return [(name, suffix) for name, suffix in ENCODINGS if accept[name]]
+
+
+def _precompressed_variant(static_folder, filename):
+    """(encodage, nom de la variante) acceptée par le client et à jour par rapport à l'original, sinon None."""
+    if os.path.splitext(filename)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+        return None
+    source = os.path.join(static_folder, filename)
+    for name, suffix in _accepted_encodings():
+        variant = source + suffix
+        try:
+            if os.path.getmtime(variant) >= os.path.getmtime(source):
+                return name, filename + suffix
+        except OSError:
+            continue
+    return None
+
+
+def init_app(app):
+    """Versionne url_for('static', ...) et remplace la vue static (précompression + en-têtes de cache)."""
+    static_folder = app.static_folder
+
+    @app.url_defaults
+    def _add_static_fingerprint(endpoint, values):
+        if endpoint != 'static' or 'v' in values:
+            return
+        filename = values.get('filename', '')
+        if is_content_addressed(filename):
+            return
+        digest = fingerprint(static_folder, filename)
+        if digest:
+            values['v'] = digest
+
+    def static(filename):
+        variant = _precompressed_variant(static_folder, filename)
+        if variant:
+            encoding, variant_filename = variant
+            # Type MIME de l'original (pas application/gzip)
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(static_folder, variant_filename, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = send_from_directory(static_folder, filename)
+        response.vary.add('Accept-Encoding')
+        if 'v' in request.args or is_content_addressed(filename):
+            response.cache_control.no_cache = None # Ajouté par send_file quand SEND_FILE_MAX_AGE_DEFAULT est vide
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        return response
+
+    app.view_functions['static'] = static
+
+
+def precompress(static_folder, force=False):
+    """Écrit les variantes .gz (et .br si brotli installé) des fichiers texte. Retourne le nombre de fichiers écrits."""
+    written = 0
+    for root, _, files in os.walk(static_folder):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            source = os.path.join(root, name)
+            with open(source, 'rb') as f:
+                data = f.read()
+            outputs = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                outputs.append(('.br', lambda: brotli.compress(data, quality=11)))
+            for suffix, compress in outputs:
+                target = source + suffix
+                if not force and os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+                    continue
+                compressed = compress()
+                if len(compressed) >= len(data):
+                    continue # Pas de gain : variante inutile
+                with open(target, 'wb') as f:
+                    f.write(compressed)
+                written += 1
+    return written
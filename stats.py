@@ -0,0 +1,97 @@
+# stats.py
+# Instantané des statistiques du gérant : une passe d'agrégation, lecture O(1) d'une ligne, ajustements incrémentaux.
+from sqlalchemy import select, func, case, and_, update, true
+from models import db, User, Document, Reservation, Loan, StatsSnapshot
+from datetime import datetime, timedelta
+import json
+
+SNAPSHOT_ID = 1
+COUNTERS = (
+    'total_documents', 'physical_available', 'physical_borrowed', 'digital_documents',
+    'active_digital_loans', 'active_reservations', 'total_members', 'active_members', 'total_staff',
+)
+STAFF_ROLES = ('bibliothecaire', 'prepose', 'gerant')
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def counters_statement():
+    """Requête unique de tous les compteurs (agrégats conditionnels par table)."""
+    documents = select(
+        func.count(Document.id).label('total_documents'),
+        _count_if(and_(Document.is_physical == True, Document.status == 'disponible')).label('physical_available'),
+        _count_if(and_(Document.is_physical == True, Document.status == 'emprunte')).label('physical_borrowed'),
+        _count_if(Document.is_digital == True).label('digital_documents'),
+    ).subquery()
+    users = select(
+        _count_if(User.role == 'membre').label('total_members'),
+        _count_if(and_(User.role == 'membre', User.subscription_status == 'active')).label('active_members'),
+        _count_if(User.role.in_(STAFF_ROLES)).label('total_staff'),
+    ).subquery()
+    # Prêts / réservations : seuls les actifs comptent -> comptage via index (status, ...) plutôt qu'une passe sur l'historique
+    active_loans = select(func.count(Loan.id)).where(Loan.status == 'active').scalar_subquery()
+    active_reservations = select(func.count(Reservation.id)).where(Reservation.status.in_(('active', 'ready'))).scalar_subquery()
+
+    # Deux agrégats d'une ligne chacun : produit cartésien volontaire (1 x 1)
+    return select(
+        documents, users,
+        active_loans.label('active_digital_loans'),
+        active_reservations.label('active_reservations'),
+    ).select_from(documents.join(users, true()))
+
+
+def compute_counters():
+    """Calcule tous les compteurs en une seule requête."""
+    row = db.session.execute(counters_statement()).mappings().one()
+    return {name: int(row[name] or 0) for name in COUNTERS}
+
+
+def most_loaned_query(limit=5):
+    """Documents numériques les plus prêtés (prêts actifs) : (titre, nombre de prêts)."""
+    return db.session.query(
+            Document.title, func.count(Loan.id).label('loan_count')
+        ).join(Loan).filter(Loan.status == 'active') \
+         .group_by(Document.id).order_by(func.count(Loan.id).desc()).limit(limit)
+
+
+def compute_most_loaned(limit=5):
+    rows = most_loaned_query(limit).all()
+    return [[title, count] for title, count in rows]
+
+
+def refresh_snapshot():
+    """Recalcule et enregistre l'instantané (commit). Retourne l'objet StatsSnapshot."""
+    snapshot = db.session.get(StatsSnapshot, SNAPSHOT_ID) or StatsSnapshot(id=SNAPSHOT_ID)
+    for name, value in compute_counters().items():
+        setattr(snapshot, name, value)
+    snapshot.most_loaned_json = json.dumps(compute_most_loaned(), ensure_ascii=False)
+    snapshot.computed_at = datetime.utcnow()
+    db.session.add(snapshot)
+    db.session.commit()
+    return snapshot
+
+
+def get_snapshot(ttl_seconds):
+    """Statistiques pour le tableau de bord ; recalcule si absentes, invalidées ou plus vieilles que le TTL."""
+    snapshot = db.session.get(StatsSnapshot, SNAPSHOT_ID)
+    if snapshot is None or snapshot.computed_at is None or \
+            datetime.utcnow() - snapshot.computed_at > timedelta(seconds=ttl_seconds):
+        snapshot = refresh_snapshot()
+    stats = {name: getattr(snapshot, name) for name in COUNTERS}
+    stats['most_loaned_digital'] = json.loads(snapshot.most_loaned_json or '[]')
+    stats['computed_at'] = snapshot.computed_at
+    return stats
+
+
+def bump(**deltas):
+    """Ajuste des compteurs (ex. bump(active_reservations=1)) dans la transaction courante, sans commit."""
+    values = {name: getattr(StatsSnapshot, name) + delta for name, delta in deltas.items() if name in COUNTERS and delta}
+    if values:
+        db.session.execute(update(StatsSnapshot).where(StatsSnapshot.id == SNAPSHOT_ID).values(**values))
+
+
+def invalidate():
+    """Force un recalcul complet à la prochaine lecture (changement trop complexe pour un ajustement)."""
+    db.session.execute(update(StatsSnapshot).where(StatsSnapshot.id == SNAPSHOT_ID).values(computed_at=None))
@@ -0,0 +1,148 @@
+# structured_logging.py
+# Journalisation structurée : enregistrements JSON à niveaux, identifiant de requête (X-Request-ID), échantillonnage
+# des événements fréquents. Les threads de requête ne font qu'empiler dans une file bornée (QueueHandler) ;
+# un thread dédié (QueueListener) formate et écrit sur la sortie standard.
+from flask import g, request, session, has_request_context
+from datetime import datetime, timezone
+import logging
+import logging.handlers
+import atexit
+import json
+import queue
+import random
+import copy
+import uuid
+import sys
+import re
+
+# Proportion conservée par événement (extra={'event': ...}) ; WARNING et au-delà ne sont jamais échantillonnés
+DEFAULT_SAMPLE_RATES = {'catalogue.search': 0.1, 'ratelimit.throttled': 0.1}
+QUEUE_SIZE = 10000
+REQUEST_ID_HEADER = 'X-Request-ID'
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+# Attributs standard d'un LogRecord : tout le reste (extra=...) devient un champ JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+_TEXT_FORMAT = '%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s'
+
+
+def parse_sample_rates(text):
+    """'catalogue.search=0.05,chat.request=0.5' -> {'catalogue.search': 0.05, 'chat.request': 0.5}"""
+    rates = {}
+    for item in (text or '').split(','):
+        if '=' in item:
+            event, rate = item.split('=', 1)
+            rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class RequestContextFilter(logging.Filter):
+    """Ajoute l'identifiant et la route de la requête en cours (exécuté dans le thread de la requête)."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id') or '-'
+            record.method = request.method
+            record.path = request.path
+            record.route = request.endpoint
+            record.user_id = session.get('user_id')
+        else:
+            record.request_id = '-'
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Ne garde qu'une fraction des événements volumineux ; la fraction est notée dans l'enregistrement."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, 'event', None))
+        if rate is None or rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Empile sans jamais attendre : file pleine = enregistrement abandonné (et compté)."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Message et trace figés ici (arguments et pile encore valides) ; le formatage JSON se fait dans le listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par ligne : ts, level, logger, msg, champs de contexte et champs extra."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and value is not None:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _request_id():
+    """Identifiant reçu du proxy (X-Request-ID) s'il est sûr, sinon généré."""
+    incoming = request.headers.get(REQUEST_ID_HEADER, '')
+    return incoming if _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+
+
+def init_app(app, level='INFO', fmt='json', sample_rates=None, queue_size=QUEUE_SIZE, stream=None):
+    """Remplace les handlers du logger racine par la file + listener ; identifiant de requête en en-tête de réponse."""
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(dict(DEFAULT_SAMPLE_RATES, **(sample_rates or {})))) # Avant le contexte : rien à calculer pour un rejet
+    queue_handler.addFilter(RequestContextFilter())
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else logging.Formatter(_TEXT_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop) # Vide la file à l'arrêt du processus
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    app.logger.handlers.clear() # Le logger Flask remonte à la racine (même file, même format)
+    app.extensions['structured_logging'] = {'handler': queue_handler, 'listener': listener}
+
+    @app.before_request
+    def _assign_request_id():
+        g.request_id = _request_id()
+
+    @app.after_request
+    def _expose_request_id(response):
+        if 'request_id' in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
+    return queue_handler
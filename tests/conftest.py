@@ -0,0 +1,56 @@
+# tests/conftest.py
+# Application sur une base SQLite temporaire (jamais instance/), limiteur de débit désactivé, un utilisateur par rôle.
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+_tmpdir = tempfile.mkdtemp(prefix='biblio-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmpdir, 'library.db')
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+os.environ['RATE_LIMIT_PATH'] = os.path.join(_tmpdir, 'rate_limit.db')
+os.environ['METRICS_PATH'] = '' # Métriques du seul processus de test
+os.environ['METRICS_TOKEN'] = 'test'
+os.environ.setdefault('LOG_FORMAT', 'text')
+
+import app as biblio # noqa: E402  (après la configuration par variables d'environnement)
+import migrations # noqa: E402
+from models import db, User # noqa: E402
+
+PASSWORD = 'password'
+ROLES = {'membre': 'membre', 'biblio': 'bibliothecaire', 'prepose': 'prepose', 'gerant': 'gerant'}
+
+
+@pytest.fixture
+def app():
+    biblio.app.config['TESTING'] = True
+    with biblio.app.app_context():
+        db.drop_all()
+        db.session.execute(db.text("DROP TABLE IF EXISTS document_fts"))
+        db.session.execute(db.text("DROP TABLE IF EXISTS schema_version"))
+        db.session.commit()
+        db.create_all()
+        migrations.upgrade()
+        password = biblio.password_service.hash(PASSWORD)
+        for username, role in ROLES.items():
+            db.session.add(User(username=username, password=password, role=role,
+                                subscription_status='active' if role == 'membre' else 'n/a'))
+        db.session.commit()
+    biblio.fragment_cache.clear()
+    biblio.identity_cache.clear()
+    yield biblio.app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, username):
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    assert response.status_code == 302
+    return response
@@ -0,0 +1,98 @@
+# tests/test_api.py
+# API JSON /api/v1 : ETag et 304 (liste et détail), curseurs invalides ou forgés, erreurs JSON.
+import base64
+import json
+
+import pytest
+
+from conftest import login
+from models import db, Document
+from pagination import encode_cursor
+
+
+@pytest.fixture
+def documents(app):
+    with app.app_context():
+        docs = [Document(title=f"Titre {i:02d}", author="Auteur", is_physical=True, status='disponible') for i in range(5)]
+        db.session.add_all(docs)
+        db.session.commit()
+        return [doc.id for doc in docs]
+
+
+@pytest.fixture
+def api_client(client):
+    login(client, 'membre')
+    return client
+
+
+def _raw_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def _touch(app, doc_id):
+    with app.app_context():
+        db.session.get(Document, doc_id).summary = "Modifié"
+        db.session.commit()
+
+
+def test_list_etag_and_not_modified(app, api_client, documents):
+    response = api_client.get('/api/v1/documents?limit=2')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert [item['id'] for item in response.get_json()['data']] == documents[:2]
+
+    cached = api_client.get('/api/v1/documents?limit=2', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag and not cached.data
+
+    _touch(app, documents[0]) # Nouvelle version : la page change
+    changed = api_client.get('/api/v1/documents?limit=2', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+
+def test_detail_etag_and_not_modified(app, api_client, documents):
+    doc_id = documents[0]
+    response = api_client.get(f'/api/v1/documents/{doc_id}')
+    etag = response.headers['ETag']
+    assert api_client.get(f'/api/v1/documents/{doc_id}', headers={'If-None-Match': etag}).status_code == 304
+    # Autre jeu de champs : autre représentation
+    assert api_client.get(f'/api/v1/documents/{doc_id}?fields=title', headers={'If-None-Match': etag}).status_code == 200
+    _touch(app, doc_id)
+    assert api_client.get(f'/api/v1/documents/{doc_id}', headers={'If-None-Match': etag}).status_code == 200
+    assert api_client.get('/api/v1/documents/999999', headers={'If-None-Match': etag}).status_code == 404
+
+
+def test_cursor_pages_follow_each_other(api_client, documents):
+    first = api_client.get('/api/v1/documents?limit=2').get_json()
+    second = api_client.get(first['links']['next']).get_json()
+    assert [item['id'] for item in second['data']] == documents[2:4]
+    previous = api_client.get(second['links']['prev']).get_json()
+    assert [item['id'] for item in previous['data']] == documents[:2]
+
+
+@pytest.mark.parametrize('cursor', [
+    'pas-un-curseur!!',
+    _raw_cursor([{'a': 1}, 1]),   # Objet à la place du titre
+    _raw_cursor(["Titre 01", "1"]), # id sous forme de texte
+    _raw_cursor(["Titre 01"]),     # Trop peu de valeurs
+    _raw_cursor([True, 1]),
+])
+def test_invalid_cursor_restarts_at_first_page(api_client, documents, cursor):
+    for param in ('after', 'before'):
+        response = api_client.get(f'/api/v1/documents?limit=2&{param}={cursor}')
+        assert response.status_code == 200
+        assert [item['id'] for item in response.get_json()['data']] == documents[:2]
+
+
+def test_valid_cursor_is_used(api_client, documents):
+    response = api_client.get('/api/v1/documents?limit=2&after=' + encode_cursor(["Titre 01", documents[1]]))
+    assert [item['id'] for item in response.get_json()['data']] == documents[2:4]
+
+
+def test_errors_are_json(client, documents):
+    assert client.get('/api/v1/documents').get_json()['error']
+    assert client.get('/api/v1/documents').status_code == 401
+    login(client, 'membre')
+    response = client.get('/api/v1/documents?fields=titre')
+    assert response.status_code == 400 and 'titre' in response.get_json()['error']
+    assert client.get('/api/v1/documents?status=perdu').status_code == 400
@@ -0,0 +1,99 @@
+# tests/test_catalogue_import.py
+# Import en masse : doublons ignorés ou mis à jour, reprise après interruption, conflits de code-barres signalés,
+# index plein texte des documents insérés.
+import json
+
+import pytest
+from sqlalchemy import select
+
+import catalogue_import
+import search_index
+from models import db, Document
+
+
+def _write_jsonl(path, records):
+    path.write_text('\n'.join(json.dumps(record, ensure_ascii=False) for record in records) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def _book(i, **fields):
+    return dict({'title': f"Livre {i:03d}", 'author': "Auteur", 'barcode': f"BC{i:05d}", 'is_physical': True}, **fields)
+
+
+def _search_ids(text):
+    """Ids trouvés par l'index plein texte (même requête MATCH que le catalogue)."""
+    matches = search_index.match_subquery(text)
+    return sorted(db.session.execute(select(matches.c.doc_id)).scalars())
+
+
+def _import(path, **options):
+    messages = []
+    progress = catalogue_import.import_catalogue(path, report=messages.append, **options)
+    return progress, messages
+
+
+def test_skip_then_upsert(app, tmp_path):
+    path = _write_jsonl(tmp_path / 'catalogue.jsonl', [_book(i) for i in range(5)] + [{'title': ''}])
+    with app.app_context():
+        progress, messages = _import(path, batch_size=2)
+        assert (progress['inserted'], progress['updated'], progress['errors']) == (5, 0, 1)
+        assert any('title requis' in message for message in messages)
+        assert _search_ids("Livre") == sorted(doc.id for doc in Document.query)
+
+        _write_jsonl(tmp_path / 'catalogue.jsonl', [_book(0, title="Nouveau titre"), _book(5)])
+        progress, _ = _import(path)
+        assert (progress['inserted'], progress['updated'], progress['skipped']) == (1, 0, 1)
+        assert Document.query.filter_by(barcode='BC00000').one().title == "Livre 000"
+
+        version = Document.query.filter_by(barcode='BC00000').one().version
+        progress, _ = _import(path, on_duplicate='upsert')
+        assert (progress['inserted'], progress['updated']) == (0, 2)
+        doc = Document.query.filter_by(barcode='BC00000').one()
+        assert doc.title == "Nouveau titre" and doc.version > version
+        assert _search_ids("Nouveau") == [doc.id]
+
+
+def test_resume_after_interruption(app, tmp_path, monkeypatch):
+    path = _write_jsonl(tmp_path / 'catalogue.jsonl', [_book(i) for i in range(10)])
+    import_batch = catalogue_import.import_batch
+    batches = []
+
+    def failing_batch(rows, on_duplicate):
+        batches.append(len(rows))
+        if len(batches) == 3:
+            raise RuntimeError("interruption")
+        return import_batch(rows, on_duplicate)
+
+    with app.app_context():
+        monkeypatch.setattr(catalogue_import, 'import_batch', failing_batch)
+        with pytest.raises(RuntimeError):
+            _import(path, batch_size=3)
+        db.session.rollback()
+        assert Document.query.count() == 6
+        monkeypatch.setattr(catalogue_import, 'import_batch', import_batch)
+
+        progress, messages = _import(path, batch_size=3)
+        assert messages[0].startswith("Reprise après 6")
+        assert (progress['records'], progress['inserted']) == (10, 10)
+        assert Document.query.count() == 10
+        assert catalogue_import.load_checkpoint(path) is None
+
+
+def test_barcode_taken_meanwhile_is_reported(app, tmp_path, monkeypatch):
+    """Code-barres attribué par un autre écrivain entre la recherche des doublons et l'écriture : ligne signalée,
+    le reste du lot importé."""
+    path = _write_jsonl(tmp_path / 'catalogue.jsonl', [_book(1), _book(2)])
+    existing_ids = catalogue_import._existing_ids
+
+    def racing_existing_ids(rows):
+        found = existing_ids(rows)
+        db.session.add(Document(title="Saisi au comptoir", barcode='BC00002', is_physical=True))
+        db.session.flush()
+        return found
+
+    with app.app_context():
+        monkeypatch.setattr(catalogue_import, '_existing_ids', racing_existing_ids)
+        progress, messages = _import(path)
+        assert (progress['inserted'], progress['errors']) == (1, 1)
+        assert any("'BC00002' déjà attribué" in message for message in messages)
+        assert Document.query.filter_by(barcode='BC00002').one().title == "Saisi au comptoir"
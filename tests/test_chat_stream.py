@@ -0,0 +1,123 @@
+# tests/test_chat_stream.py
+# /chat/stream contre le faux serveur de complétion (tools/fake_openai_server.py) : événements SSE, cache des
+# réponses, refus (503) quand le pool est plein, place libérée quand le client part avant le premier fragment,
+# 504 quand le modèle ne répond pas à temps.
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import openai
+import pytest
+
+import app as biblio
+from chat_cache import ChatResponseCache
+import chat_service
+from chat_service import ChatService
+from tools.fake_openai_server import FakeCompletionHandler, REPLY
+
+
+class SlowCompletionHandler(FakeCompletionHandler):
+    delay = 0.3
+
+
+@pytest.fixture
+def fake_openai(app, monkeypatch):
+    """Faux serveur sur un port libre ; service de chat neuf (client OpenAI visant ce serveur, pool de `slots` places)."""
+    def start(handler, slots=2):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setenv('OPENAI_BASE_URL', f"http://127.0.0.1:{server.server_port}/v1")
+        monkeypatch.setattr(biblio, 'chat_service', ChatService(max_concurrency=slots, max_queue=0))
+        return server
+
+    servers = []
+    monkeypatch.setattr(openai, 'api_key', 'factice')
+    monkeypatch.setattr(biblio, 'chat_cache', ChatResponseCache()) # Cache vide, en mémoire
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    biblio.catalogue_retriever.stop()
+
+
+def _events(body):
+    """Corps SSE -> [(événement, données)]."""
+    events = []
+    for block in body.strip().split('\n\n'):
+        name, data = 'message', None
+        for line in block.splitlines():
+            if line.startswith('event: '):
+                name = line[len('event: '):]
+            elif line.startswith('data: '):
+                data = json.loads(line[len('data: '):])
+        events.append((name, data))
+    return events
+
+
+def test_stream_tokens_then_done(client, fake_openai):
+    fake_openai(FakeCompletionHandler)
+    response = client.post('/chat/stream', json={'message': 'Horaires ?'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = _events(response.get_data(as_text=True))
+    assert events[-1][0] == 'done'
+    reply = ''.join(data['token'] for name, data in events if name == 'message')
+    assert reply.strip() == f"{REPLY} (Question : Horaires ?)"
+
+    # Même question : réponse servie par le cache, en un seul fragment
+    events = _events(client.post('/chat/stream', json={'message': 'Horaires ?'}).get_data(as_text=True))
+    assert [name for name, _ in events] == ['message', 'done']
+    assert biblio.chat_cache.stats()['hits'] == 1
+
+
+def test_stream_rejects_empty_message(client, fake_openai):
+    fake_openai(FakeCompletionHandler)
+    response = client.post('/chat/stream', json={'message': '   '})
+    assert response.status_code == 400
+
+
+def test_full_pool_answers_busy_then_frees_on_disconnect(client, fake_openai):
+    fake_openai(SlowCompletionHandler, slots=1)
+    first = client.post('/chat/stream', json={'message': 'Question lente'}, buffered=False)
+    assert first.status_code == 200
+    busy = client.post('/chat/stream', json={'message': 'Autre question'})
+    assert busy.status_code == 503
+    assert 'sollicité' in busy.get_json()['reply']
+
+    first.close() # Client parti sans lire : call_on_close annule le flux et libère la place
+    deadline = time.monotonic() + 5
+    while True:
+        response = client.post('/chat/stream', json={'message': 'Autre question'}, buffered=False)
+        if response.status_code == 200 or time.monotonic() > deadline:
+            break
+        time.sleep(0.1)
+    assert response.status_code == 200
+    response.close()
+
+
+class _BlockedCompletions:
+    """Client OpenAI factice dont l'appel ne répond jamais à temps."""
+    def __init__(self):
+        self.release = threading.Event()
+        self.chat = self
+        self.completions = self
+
+    def create(self, **options):
+        self.release.wait(5)
+        raise RuntimeError("trop tard")
+
+
+def test_upstream_timeout_returns_504(client, fake_openai, monkeypatch):
+    fake_openai(FakeCompletionHandler)
+    blocked = _BlockedCompletions()
+    service = ChatService(max_concurrency=1, max_queue=0, timeout=0.2)
+    monkeypatch.setattr(service, 'client', lambda: blocked)
+    monkeypatch.setattr(chat_service, 'RESULT_GRACE', 0)
+    monkeypatch.setattr(biblio, 'chat_service', service)
+    try:
+        response = client.post('/chat', json={'message': 'Horaires ?'})
+    finally:
+        blocked.release.set()
+    assert response.status_code == 504
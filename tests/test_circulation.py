@@ -0,0 +1,103 @@
+# tests/test_circulation.py
+# Circulation au comptoir : transition conditionnelle (un seul gagnant pour un même exemplaire), lots partiels.
+import threading
+
+import pytest
+
+import circulation
+from conftest import login
+from models import db, User, Document, Reservation, PhysicalLoan
+
+
+@pytest.fixture
+def desk(app):
+    """Exemplaires de test et deux membres ; retourne {nom: id}."""
+    with app.app_context():
+        member = User.query.filter_by(username='membre').one()
+        other = User(username='autre', password='-', role='membre', subscription_status='active')
+        documents = {
+            'libre': Document(title="Libre", barcode='LIB1', is_physical=True, status='disponible'),
+            'sorti': Document(title="Sorti", barcode='OUT1', is_physical=True, status='emprunte'),
+            'numerique': Document(title="Numérique", barcode='NUM1', is_physical=False, is_digital=True, file_path='n.pdf'),
+            'de_cote': Document(title="De côté", barcode='HOLD1', is_physical=True, status='reserve'),
+        }
+        db.session.add_all([other] + list(documents.values()))
+        db.session.flush()
+        db.session.add(Reservation(user_id=other.id, document_id=documents['de_cote'].id, status='ready', queue_position=1))
+        db.session.commit()
+        ids = {name: doc.id for name, doc in documents.items()}
+        ids.update(membre=member.id, autre=other.id)
+        return ids
+
+
+def test_concurrent_checkouts_have_one_winner(app, desk):
+    """Deux postes scannent le même exemplaire en même temps (documents lus avant les écritures)."""
+    barrier = threading.Barrier(2)
+    outcomes = []
+
+    def scan(member_id):
+        with app.app_context():
+            try:
+                doc = db.session.get(Document, desk['libre'])
+                member = db.session.get(User, member_id)
+                barrier.wait() # Les deux postes ont lu 'disponible'
+                ok, _ = circulation.checkout(doc, member)
+                if ok:
+                    db.session.commit()
+                else:
+                    db.session.rollback()
+                outcomes.append(ok)
+            except Exception as e: # Verrou SQLite non obtenu : aucun prêt enregistré pour ce poste
+                db.session.rollback()
+                outcomes.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=scan, args=(desk[name],)) for name in ('membre', 'autre')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert outcomes.count(True) == 1
+    with app.app_context():
+        assert PhysicalLoan.query.filter_by(document_id=desk['libre'], status='active').count() == 1
+        assert db.session.get(Document, desk['libre']).status == 'emprunte'
+
+
+def test_stale_copy_cannot_check_out_twice(app, desk):
+    with app.app_context():
+        stale = db.session.get(Document, desk['libre']) # Lu 'disponible' par ce poste
+        with app.app_context(): # Autre poste (autre session) : prêt validé entre-temps
+            assert circulation.checkout(db.session.get(Document, desk['libre']), db.session.get(User, desk['autre']))[0]
+            db.session.commit()
+        assert stale.status == 'disponible'
+        assert circulation.checkout(stale, db.session.get(User, desk['membre'])) == (False, 'unavailable')
+        db.session.rollback()
+        assert PhysicalLoan.query.filter_by(document_id=desk['libre']).count() == 1
+
+
+def test_batch_loan_reports_each_failure(app, client, desk):
+    login(client, 'prepose')
+    response = client.post('/circulation/batch', json={
+        'action': 'loan', 'member_id': 'membre', 'document_ids': ['LIB1', 'OUT1', 'NUM1', 'HOLD1', 'INCONNU']})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['succeeded'], body['failed']) == (1, 4)
+    assert [(result['scan'], result['ok'], result.get('error')) for result in body['results']] == [
+        ('LIB1', True, None), ('OUT1', False, 'unavailable'), ('NUM1', False, 'not_physical'),
+        ('HOLD1', False, 'reserved_for_other'), ('INCONNU', False, 'not_found')]
+    with app.app_context():
+        assert PhysicalLoan.query.filter_by(status='active').count() == 1
+        assert db.session.get(Document, desk['de_cote']).status == 'reserve' # Échec : rien d'écrit
+
+    response = client.post('/circulation/batch', json={'action': 'return', 'document_ids': ['LIB1', 'LIB1']})
+    assert [(result['ok'], result.get('error')) for result in response.get_json()['results']] == [
+        (True, None), (False, 'not_borrowed')]
+
+
+def test_batch_requires_attendant_and_member(client, desk):
+    login(client, 'membre')
+    assert client.post('/circulation/batch', json={'action': 'loan', 'document_ids': ['LIB1']}).status_code == 403
+    login(client, 'prepose')
+    response = client.post('/circulation/batch', json={'action': 'loan', 'document_ids': ['LIB1']})
+    assert response.status_code == 400
@@ -0,0 +1,62 @@
+# tests/test_query_budget.py
+# Budgets de requêtes SQL (anti N+1) : le nombre de requêtes d'une page ne doit pas croître avec son contenu.
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import login
+from models import db, User, Document, Loan, Reservation
+from query_budget import QueryBudgetExceeded, assert_max_queries
+
+
+def _add_documents(count):
+    documents = [Document(title=f"Document {i:03d}", author=f"Auteur {i % 7}", is_physical=True, status='disponible')
+                 for i in range(count)]
+    db.session.add_all(documents)
+    db.session.commit()
+    return documents
+
+
+def test_catalogue_within_budget(app, client):
+    with app.app_context():
+        _add_documents(60)
+    login(client, 'membre')
+    response = client.get('/catalogue')
+    assert response.status_code == 200
+    assert int(response.headers['X-Query-Count']) <= 5
+    # Défilement infini : chaque page suivante garde le même budget
+    url = '/catalogue/page'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert int(response.headers['X-Query-Count']) <= 5
+        url = response.headers.get('X-Next-Page')
+
+
+def test_member_dashboard_query_count_constant(app, client):
+    """Prêts et réservations chargés avec leur document : même nombre de requêtes pour 1 ou 15 lignes."""
+    login(client, 'membre')
+    counts = []
+    for count in (1, 15):
+        with app.app_context():
+            member = User.query.filter_by(username='membre').one()
+            now = datetime.utcnow()
+            documents = _add_documents(2 * count) # Documents distincts : aucun chargé par l'autre liste
+            for doc in documents[:count]:
+                db.session.add(Loan(user_id=member.id, document_id=doc.id, due_date=now + timedelta(days=14)))
+            for doc in documents[count:]:
+                db.session.add(Reservation(user_id=member.id, document_id=doc.id))
+            db.session.commit()
+        response = client.get('/dashboard')
+        assert response.status_code == 200
+        counts.append(int(response.headers['X-Query-Count']))
+    assert counts[0] == counts[1]
+
+
+def test_budget_exceeded_fails_loudly(app):
+    with app.app_context():
+        _add_documents(3)
+        with pytest.raises(QueryBudgetExceeded):
+            with assert_max_queries(2):
+                for doc_id in (1, 2, 3):
+                    db.session.get(Document, doc_id)
@@ -0,0 +1,16 @@
+# tests/test_query_plans.py
+# Plans SQLite des requêtes chaudes (construites comme dans les routes) : aucun parcours complet de table.
+import query_plans
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        results = query_plans.check_query_plans()
+    scans = [(route, description, plan) for route, description, plan, ok in results if not ok]
+    assert scans == []
+    assert any('recherche' in description for _, description, _, _ in results)
+
+
+def test_unconstrained_fts_scan_is_reported():
+    assert query_plans.is_full_scan('SCAN document_fts VIRTUAL TABLE INDEX 0:')
+    assert not query_plans.is_full_scan('SCAN document_fts VIRTUAL TABLE INDEX 0:M3')
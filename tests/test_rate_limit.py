@@ -0,0 +1,45 @@
+# tests/test_rate_limit.py
+# Seau à jetons par client : 429 + Retry-After au-delà du budget, adresse réelle lue derrière le routeur.
+import pytest
+
+import app as biblio
+
+
+@pytest.fixture
+def limited(app, monkeypatch):
+    """Limiteur actif, budget de connexion réduit à 2 tentatives, seaux vidés."""
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(biblio.rate_limiter.budgets, 'login', (2, 2 / 60))
+    biblio.rate_limiter._connection().execute("DELETE FROM rate_bucket")
+    return app
+
+
+def _login_attempt(client, forwarded_for):
+    return client.post('/login', data={'username': 'membre', 'password': 'mauvais'},
+                       headers={'X-Forwarded-For': forwarded_for})
+
+
+def test_login_throttled_with_retry_after(client, limited):
+    assert _login_attempt(client, '203.0.113.1').status_code == 302
+    assert _login_attempt(client, '203.0.113.1').status_code == 302
+    response = _login_attempt(client, '203.0.113.1')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_forwarded_clients_have_separate_buckets(client, limited):
+    for _ in range(2):
+        _login_attempt(client, '203.0.113.1')
+    assert _login_attempt(client, '203.0.113.1').status_code == 429
+    # Même routeur (remote_addr identique), autre client : son propre seau
+    assert _login_attempt(client, '203.0.113.2').status_code == 302
+
+
+def test_json_clients_get_retry_after_in_body(client, limited, monkeypatch):
+    monkeypatch.setitem(biblio.rate_limiter.budgets, 'chat', (1, 1 / 60))
+    monkeypatch.setattr(biblio.openai, 'api_key', None) # Réponse 503 immédiate, sans appel au modèle
+    headers = {'X-Forwarded-For': '203.0.113.3'}
+    assert client.post('/chat', json={'message': 'Bonjour'}, headers=headers).status_code == 503
+    response = client.post('/chat', json={'message': 'Bonjour'}, headers=headers)
+    assert response.status_code == 429
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
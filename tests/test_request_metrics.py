@@ -0,0 +1,37 @@
+# tests/test_request_metrics.py
+# Exposition Prometheus : valeurs en pleine précision, toutes les bornes d'histogramme, pile des chronos SQL.
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db
+from request_metrics import MetricsRegistry, HISTOGRAM_BUCKETS, format_labels
+
+
+def test_counters_keep_full_precision():
+    registry = MetricsRegistry()
+    registry.inc('biblio_db_queries_total', format_labels(route='catalogue'), 1234567)
+    registry.inc('biblio_db_query_seconds_total', format_labels(route='catalogue'), 1234.5678912)
+    text = registry.render()
+    assert 'biblio_db_queries_total{route="catalogue"} 1234567\n' in text
+    assert 'biblio_db_query_seconds_total{route="catalogue"} 1234.5678912\n' in text
+
+
+def test_histogram_exposes_every_bucket():
+    registry = MetricsRegistry()
+    labels = format_labels(route='catalogue', method='GET')
+    registry.observe('biblio_http_request_duration_seconds', labels, 0.2)
+    lines = [line for line in registry.render().splitlines()
+             if line.startswith('biblio_http_request_duration_seconds_bucket')]
+    buckets = HISTOGRAM_BUCKETS['biblio_http_request_duration_seconds']
+    assert len(lines) == len(buckets) + 1
+    assert lines[0] == f'biblio_http_request_duration_seconds_bucket{{{labels},le="{buckets[0]!r}"}} 0'
+    assert lines[-1] == f'biblio_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1'
+
+
+def test_failed_statement_does_not_leave_timer(app):
+    with app.app_context():
+        connection = db.session.connection()
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("SELECT * FROM table_absente")
+        assert not connection.info.get('query_started')
+        db.session.rollback()
@@ -0,0 +1,90 @@
+# tests/test_reservation_queue.py
+# File d'attente des réservations : ordre FIFO, une seule mise de côté par retour, numéro de passage unique.
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import circulation
+import reservation_queue
+from models import db, User, Document, Reservation
+
+
+def _as(client, user_id, role='membre'):
+    with client.session_transaction() as session:
+        session['user_id'], session['user_role'] = user_id, role
+
+
+@pytest.fixture
+def borrowed(app):
+    """Document emprunté et trois membres ; retourne (id du document, ids des membres)."""
+    with app.app_context():
+        doc = Document(title="Le Horla", author="Maupassant", is_physical=True, status='emprunte')
+        members = [User(username=f"lecteur{i}", password='-', role='membre', subscription_status='active') for i in range(3)]
+        db.session.add_all([doc] + members)
+        db.session.commit()
+        return doc.id, [member.id for member in members]
+
+
+def _statuses(doc_id):
+    return [(resa.user_id, resa.status) for resa in
+            Reservation.query.filter_by(document_id=doc_id).order_by(Reservation.queue_position)]
+
+
+def test_reservations_queue_in_arrival_order(app, client, borrowed):
+    doc_id, members = borrowed
+    for member_id in members:
+        _as(client, member_id)
+        assert client.post(f'/reserve_document/{doc_id}').status_code == 302
+    with app.app_context():
+        queue = Reservation.query.filter_by(document_id=doc_id).order_by(Reservation.queue_position).all()
+        assert [resa.user_id for resa in queue] == members
+        assert [reservation_queue.position(resa) for resa in queue] == [1, 2, 3]
+
+
+def test_return_hands_off_to_one_member(app, client, borrowed):
+    doc_id, members = borrowed
+    with app.app_context():
+        for member_id in members:
+            reservation_queue.enqueue(member_id, doc_id)
+        db.session.commit()
+
+        assert circulation.checkin(db.session.get(Document, doc_id)) == 'reserve'
+        db.session.commit()
+        assert _statuses(doc_id) == [(members[0], 'ready'), (members[1], 'active'), (members[2], 'active')]
+
+        # Mise de côté annulée : au suivant, toujours un seul document mis de côté
+        reservation_queue.cancel_hold(doc_id)
+        reservation_queue.release_hold(doc_id)
+        db.session.commit()
+        assert _statuses(doc_id) == [(members[0], 'cancelled'), (members[1], 'ready'), (members[2], 'active')]
+
+
+def test_queue_position_unique_per_document(app, borrowed):
+    doc_id, members = borrowed
+    with app.app_context():
+        reservation_queue.enqueue(members[0], doc_id)
+        db.session.commit()
+        db.session.add(Reservation(user_id=members[1], document_id=doc_id, queue_position=1))
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+
+def test_enqueue_retries_taken_position(app, borrowed, monkeypatch):
+    """Numéro calculé par une insertion concurrente (simulée) : nouvel essai avec le numéro suivant."""
+    doc_id, members = borrowed
+    next_position = reservation_queue.next_position
+    positions = iter([None, 1]) # 2e appel : numéro 1, déjà pris
+    calls = []
+
+    def racing_position(doc):
+        calls.append(doc)
+        return next(positions, None) or next_position(doc)
+
+    monkeypatch.setattr(reservation_queue, 'next_position', racing_position)
+    with app.app_context():
+        reservation_queue.enqueue(members[0], doc_id)
+        resa = reservation_queue.enqueue(members[1], doc_id)
+        db.session.commit()
+        assert len(calls) == 3
+        assert resa.queue_position == 2
+        assert _statuses(doc_id) == [(members[0], 'active'), (members[1], 'active')]
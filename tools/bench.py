@@ -0,0 +1,279 @@
+# tools/bench.py
+# Charge scriptée sur les routes principales (recherche, tableaux de bord, emprunt / retour, accès PDF) :
+# débit, latences p50/p95/p99 et requêtes SQL par route, comparaison à une référence avec seuils de régression.
+# Usage : python tools/seed_data.py --reset --scale 0.05                  (jeu de données + manifeste)
+#         python tools/bench.py --duration 30 --threads 4 --save-baseline bench_baseline.json
+#         python tools/bench.py --duration 30 --threads 4 --baseline bench_baseline.json   (code 1 si régression)
+#         python tools/bench.py --url http://127.0.0.1:8000 ...   (serveur déjà lancé, ex. gunicorn)
+# En mode intégré (défaut) l'application tourne dans ce processus via le client de test : les requêtes SQL sont
+# comptées exactement. Avec --url, elles sont lues dans l'en-tête Server-Timing (db;desc="N SQL") du serveur.
+import os
+import sys
+import argparse
+import json
+import random
+import re
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('EXPIRY_SWEEP_INTERVAL', '0')
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0') # Mesure de l'application, pas du limiteur (--url : config du serveur)
+
+# Scénario -> poids dans le mélange (proportion des itérations)
+SCENARIOS = {
+    'search': 30,
+    'catalogue': 10,
+    'document': 15,
+    'member_dashboard': 15,
+    'manager_dashboard': 3,
+    'borrow': 8,
+    'return': 8,
+    'pdf_access': 11,
+}
+PERCENTILES = (50, 95, 99)
+LOAN_LINK = re.compile(r'/return_digital/(\d+)')
+ACCESS_LINK = re.compile(r'/access_document/(\d+)')
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) SQL"')
+
+
+class InProcessClient:
+    """Client WSGI (cookies de session conservés) ; compte les requêtes SQL exécutées pendant l'appel."""
+
+    def __init__(self):
+        from app import app
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None, headers=None):
+        import query_budget
+        with query_budget.count_queries() as counter:
+            response = self.client.open(path, method=method, data=data, headers=headers)
+            body = response.get_data()
+        return response.status_code, response.headers.get('Location', ''), body.decode('utf-8', 'replace'), counter.count
+
+
+class HttpClient:
+    """Client HTTP (serveur externe) ; nombre de requêtes SQL depuis Server-Timing (ou X-Query-Count) s'il est présent."""
+
+    def __init__(self, base_url):
+        import httpx
+        self.client = httpx.Client(base_url=base_url, follow_redirects=False, timeout=30)
+
+    def request(self, method, path, data=None, headers=None):
+        response = self.client.request(method, path, data=data, headers=headers)
+        match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        count = match.group(1) if match else response.headers.get('X-Query-Count')
+        return response.status_code, response.headers.get('Location', ''), response.text, int(count) if count else None
+
+
+class Recorder:
+    """Mesures par route, partagées entre les threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, route, seconds, queries, ok):
+        with self.lock:
+            entry = self.samples.setdefault(route, {'latencies': [], 'queries': [], 'errors': 0})
+            entry['latencies'].append(seconds)
+            if queries is not None:
+                entry['queries'].append(queries)
+            if not ok:
+                entry['errors'] += 1
+
+    def summary(self, elapsed):
+        report = {}
+        for route, entry in sorted(self.samples.items()):
+            latencies = sorted(entry['latencies'])
+            row = {'requests': len(latencies), 'errors': entry['errors'], 'rps': round(len(latencies) / elapsed, 2)}
+            for p in PERCENTILES:
+                row[f'p{p}_ms'] = round(_percentile(latencies, p) * 1000, 2)
+            if entry['queries']:
+                row['queries_avg'] = round(sum(entry['queries']) / len(entry['queries']), 2)
+                row['queries_max'] = max(entry['queries'])
+            report[route] = row
+        return report
+
+
+def _percentile(sorted_values, p):
+    """Rang le plus proche (nearest-rank)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class VirtualUser:
+    """Un membre connecté (plus un gérant pour son tableau de bord) qui enchaîne les scénarios tirés au sort."""
+
+    def __init__(self, make_client, manifest, username, recorder, rnd):
+        self.manifest = manifest
+        self.recorder = recorder
+        self.rnd = rnd
+        self.member = make_client()
+        self.manager = make_client()
+        self._login(self.member, username)
+        self._login(self.manager, manifest['manager'])
+
+    def _login(self, client, username):
+        status, location, _, _ = client.request('POST', '/login', {'username': username, 'password': self.manifest['password']})
+        if status != 302 or 'dashboard' not in location:
+            raise SystemExit(f"Connexion impossible pour {username} (relancer tools/seed_data.py ?)")
+
+    def call(self, route, client, method, path, data=None, headers=None, expect=(200,)):
+        started = time.perf_counter()
+        status, location, body, queries = client.request(method, path, data, headers)
+        self.recorder.add(route, time.perf_counter() - started, queries, status in expect)
+        return status, location, body
+
+    # --- Scénarios ---
+    def search(self):
+        self.call('search', self.member, 'GET', f"/catalogue?q={self.rnd.choice(self.manifest['search_terms'])}")
+
+    def catalogue(self):
+        self.call('catalogue', self.member, 'GET', '/catalogue')
+
+    def document(self):
+        self.call('document', self.member, 'GET', f"/document/{self.rnd.choice(self.manifest['documents'])}")
+
+    def member_dashboard(self):
+        return self.call('member_dashboard', self.member, 'GET', '/dashboard')[2]
+
+    def manager_dashboard(self):
+        self.call('manager_dashboard', self.manager, 'GET', '/dashboard')
+
+    def borrow(self):
+        doc_id = self.rnd.choice(self.manifest['digital_documents'])
+        self.call('borrow', self.member, 'POST', f"/borrow_digital/{doc_id}", expect=(302,))
+
+    def _active_loans(self, pattern):
+        status, _, body = self.call('member_dashboard', self.member, 'GET', '/dashboard')
+        return pattern.findall(body) if status == 200 else []
+
+    def return_(self):
+        loans = self._active_loans(LOAN_LINK)
+        if not loans:
+            return self.borrow()
+        self.call('return', self.member, 'POST', f"/return_digital/{self.rnd.choice(loans)}", expect=(302,))
+
+    def pdf_access(self):
+        loans = self._active_loans(ACCESS_LINK)
+        if not loans:
+            return self.borrow()
+        status, location, _ = self.call('pdf_access', self.member, 'GET', f"/access_document/{self.rnd.choice(loans)}",
+                                        expect=(302,))
+        if status == 302 and '/pdf/' in location:
+            path = location[location.index('/pdf/'):]
+            self.call('pdf_range', self.member, 'GET', path, headers={'Range': 'bytes=0-65535'}, expect=(206,))
+
+    def run_one(self, scenario):
+        getattr(self, 'return_' if scenario == 'return' else scenario)()
+
+
+def run(args, manifest):
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        from app import app
+        app.config['QUERY_BUDGET_ENFORCE'] = False # Mesure sans lever d'exception ; les dépassements restent visibles ici
+        make_client = InProcessClient
+    weights = {name: weight for name, weight in SCENARIOS.items() if not args.scenarios or name in args.scenarios}
+    recorder = Recorder()
+    members = manifest['members']
+    users = [VirtualUser(make_client, manifest, members[i % len(members)], recorder, random.Random(args.seed + i))
+             for i in range(args.threads)]
+
+    for user in users: # Échauffement (caches, plans de requêtes) non mesuré
+        for scenario in weights:
+            user.run_one(scenario)
+    recorder.samples.clear()
+
+    deadline = time.perf_counter() + args.duration
+    names, mix = list(weights), list(weights.values())
+
+    def worker(user):
+        while time.perf_counter() < deadline:
+            user.run_one(user.rnd.choices(names, mix)[0])
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - started
+    total = sum(len(entry['latencies']) for entry in recorder.samples.values())
+    return {'meta': {'duration': round(elapsed, 2), 'threads': args.threads, 'target': args.url or 'in-process',
+                     'requests': total, 'rps': round(total / elapsed, 2), 'dataset': manifest.get('counts', {})},
+            'routes': recorder.summary(elapsed)}
+
+
+def print_report(result):
+    meta = result['meta']
+    print(f"\n{meta['requests']} requêtes en {meta['duration']}s ({meta['rps']} req/s, {meta['threads']} thread(s), {meta['target']})")
+    print(f"{'route':<20}{'req':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'SQL moy':>9}{'SQL max':>9}{'err':>6}")
+    for route, row in result['routes'].items():
+        print(f"{route:<20}{row['requests']:>7}{row['rps']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}"
+              f"{row.get('queries_avg', '-'):>9}{row.get('queries_max', '-'):>9}{row['errors']:>6}")
+
+
+def compare(result, baseline, args):
+    """Liste des régressions par rapport à la référence (latence p95, débit, requêtes SQL, erreurs)."""
+    regressions = []
+    for route, base in baseline['routes'].items():
+        current = result['routes'].get(route)
+        if current is None:
+            continue
+        p95, base_p95 = current['p95_ms'], base['p95_ms']
+        if p95 > base_p95 * (1 + args.max_latency_regression) and p95 - base_p95 > args.min_delta_ms:
+            regressions.append(f"{route} : p95 {base_p95} -> {p95} ms")
+        if current['rps'] < base['rps'] * (1 - args.max_throughput_regression):
+            regressions.append(f"{route} : débit {base['rps']} -> {current['rps']} req/s")
+        if 'queries_max' in base and current.get('queries_max', 0) > base['queries_max'] + args.max_query_increase:
+            regressions.append(f"{route} : requêtes SQL max {base['queries_max']} -> {current['queries_max']}")
+        if current['errors'] > base['errors']:
+            regressions.append(f"{route} : erreurs {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesure de charge des routes principales.")
+    parser.add_argument('--manifest', default=None, help="Défaut : instance/bench_manifest.json (tools/seed_data.py)")
+    parser.add_argument('--url', default=None, help="Serveur cible ; sinon application dans ce processus.")
+    parser.add_argument('--duration', type=float, default=20, help="Secondes de mesure (après échauffement).")
+    parser.add_argument('--threads', type=int, default=4, help="Utilisateurs virtuels simultanés.")
+    parser.add_argument('--scenarios', nargs='*', choices=list(SCENARIOS), help="Sous-ensemble de scénarios.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Écrit le résultat JSON.")
+    parser.add_argument('--save-baseline', help="Enregistre le résultat comme référence.")
+    parser.add_argument('--baseline', help="Référence à comparer ; code de sortie 1 en cas de régression.")
+    parser.add_argument('--max-latency-regression', type=float, default=0.20, help="Hausse de p95 tolérée (fraction).")
+    parser.add_argument('--max-throughput-regression', type=float, default=0.20, help="Baisse de débit tolérée (fraction).")
+    parser.add_argument('--max-query-increase', type=int, default=0, help="Requêtes SQL supplémentaires tolérées par route.")
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help="Écart de p95 ignoré (bruit de mesure).")
+    args = parser.parse_args()
+
+    manifest_path = args.manifest or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                  'instance', 'bench_manifest.json')
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except OSError:
+        sys.exit(f"Manifeste introuvable ({manifest_path}) : lancer d'abord tools/seed_data.py.")
+
+    result = run(args, manifest)
+    print_report(result)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args)
+        if regressions:
+            print("\nRÉGRESSIONS :\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nAucune régression par rapport à la référence.")
+
+
+if __name__ == '__main__':
+    main()
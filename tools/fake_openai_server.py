@@ -0,0 +1,71 @@
+# tools/fake_openai_server.py
+# Faux serveur de complétion compatible OpenAI (chat.completions, normal et stream) pour tester le chatbot en local.
+# Usage : python tools/fake_openai_server.py --port 8001 --delay 0.05
+#         puis OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=factice flask --app app run
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+import json
+import time
+
+REPLY = "Bonjour ! La bibliothèque est ouverte de 9h à 18h, du lundi au samedi."
+
+
+class FakeCompletionHandler(BaseHTTPRequestHandler):
+    delay = 0.0 # Secondes par fragment (simule la latence du modèle)
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404); return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        question = body.get('messages', [{}])[-1].get('content', '')
+        reply = f"{REPLY} (Question : {question})"
+        if body.get('stream'):
+            self._stream(body.get('model', 'fake'), reply)
+        else:
+            time.sleep(self.delay * len(reply.split()))
+            self._json({
+                'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model', 'fake'),
+                'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': reply}}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+            })
+
+    def _json(self, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, model, reply):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for word in reply.split(' '):
+            time.sleep(self.delay)
+            chunk = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                     'choices': [{'index': 0, 'finish_reason': None, 'delta': {'content': word + ' '}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8')); self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n"); self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass # Silencieux
+
+
+def serve(port=8001, delay=0.0):
+    FakeCompletionHandler.delay = delay
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeCompletionHandler)
+    print(f"Faux serveur OpenAI sur http://127.0.0.1:{port}/v1 (délai {delay}s/fragment)")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--delay', type=float, default=0.0)
+    args = parser.parse_args()
+    serve(args.port, args.delay)
@@ -0,0 +1,279 @@
+# tools/seed_data.py
+# Jeu de données volumineux et réaliste pour les mesures de performance (catalogue, membres, prêts, files de réservation).
+# Usage : python tools/seed_data.py --reset                       (200k documents, 50k membres, 2M prêts + réservations)
+#         python tools/seed_data.py --reset --scale 0.05          (même répartition, 5 % du volume)
+#         DATABASE_URL=postgresql://... python tools/seed_data.py --reset
+# Écrit aussi un manifeste JSON (comptes, ids échantillons, termes de recherche) lu par tools/bench.py.
+import os
+import sys
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('EXPIRY_SWEEP_INTERVAL', '0') # Pas de balayage en arrière-plan pendant le remplissage
+
+from sqlalchemy import insert, text, func
+
+BENCH_PASSWORD = 'bench'
+STAFF_ACCOUNTS = (('gerant_bench', 'gerant'), ('biblio_bench', 'bibliothecaire'), ('prepose_bench', 'prepose'))
+SAMPLE_PDF = 'bench_sample.pdf'
+
+TITLE_WORDS = (
+    'mémoire', 'voyage', 'nuit', 'jardin', 'histoire', 'ombre', 'lumière', 'guerre', 'paix', 'océan', 'montagne',
+    'ville', 'enfance', 'secret', 'royaume', 'silence', 'hiver', 'été', 'rivière', 'forêt', 'étoile', 'chemin',
+    'cuisine', 'science', 'musique', 'philosophie', 'économie', 'peinture', 'algorithme', 'données', 'réseau',
+    'énergie', 'climat', 'médecine', 'droit', 'théâtre', 'poésie', 'roman', 'enquête', 'frontière', 'révolution',
+    'empire', 'famille', 'amour', 'mer', 'désert', 'île', 'ciel', 'temps', 'langage',
+)
+SUMMARY_WORDS = TITLE_WORDS + (
+    'un', 'une', 'le', 'la', 'des', 'dans', 'sur', 'avec', 'entre', 'après', 'pendant', 'récit', 'étude', 'portrait',
+    'analyse', 'personnages', 'siècle', 'pays', 'auteur', 'lecteur', 'destin', 'découverte', 'monde', 'société',
+)
+FIRST_NAMES = ('Marie', 'Jean', 'Camille', 'Louis', 'Chloé', 'Hugo', 'Léa', 'Paul', 'Inès', 'Nicolas', 'Sarah',
+               'Thomas', 'Julie', 'Antoine', 'Emma', 'Karim', 'Yasmine', 'Olivier', 'Claire', 'Mathieu')
+LAST_NAMES = ('Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+              'Simon', 'Laurent', 'Lefebvre', 'Michel', 'Garcia', 'David', 'Bertrand', 'Roux', 'Vincent', 'Fournier',
+              'Tremblay', 'Gagnon', 'Roy', 'Côté', 'Bouchard', 'Gauthier', 'Morin', 'Lavoie', 'Fortin', 'Gagné')
+
+# Répartition par défaut (multipliée par --scale)
+DEFAULT_DOCUMENTS = 200_000
+DEFAULT_MEMBERS = 50_000
+DEFAULT_DIGITAL_LOANS = 900_000
+DEFAULT_PHYSICAL_LOANS = 600_000
+DEFAULT_RESERVATIONS = 500_000
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Seeder:
+    """Génère les lignes (ids explicites, base vide) et les insère par lots en executemany."""
+
+    def __init__(self, args, now):
+        self.args = args
+        self.now = now
+        self.rnd = random.Random(args.seed)
+        self.first_member_id = len(STAFF_ACCOUNTS) + 1
+        self.member_ids = range(self.first_member_id, self.first_member_id + args.members)
+        self.statuses = {} # id document -> statut physique
+        self.physical_ids, self.digital_ids = [], []
+        # Popularité de type Zipf : quelques titres concentrent la majorité des prêts
+        self.popularity = list(range(1, args.documents + 1))
+        self.rnd.shuffle(self.popularity)
+
+    def popular_document(self, candidates=None):
+        pool = candidates if candidates is not None else self.popularity
+        return pool[int(len(pool) * self.rnd.random() ** 3)]
+
+    def member(self):
+        return self.rnd.choice(self.member_ids)
+
+    def past(self, max_days):
+        return self.now - timedelta(days=self.rnd.uniform(1, max_days))
+
+    # --- Lignes ---
+    def users(self):
+        from circulation import member_number
+        from app import password_service
+        password = password_service.hash(BENCH_PASSWORD) # Un seul hachage (schéma configuré) pour tous les comptes
+        for user_id, (username, role) in enumerate(STAFF_ACCOUNTS, start=1):
+            yield {'id': user_id, 'username': username, 'password': password, 'role': role, 'email': None,
+                   'member_number': None, 'subscription_status': 'n/a', 'subscription_type': None,
+                   'subscription_start_date': None, 'subscription_end_date': None}
+        for user_id in self.member_ids:
+            active = self.rnd.random() < 0.8
+            start = self.past(330) if active else self.past(900)
+            yield {'id': user_id, 'username': f"membre{user_id:06d}", 'password': password, 'role': 'membre',
+                   'email': f"membre{user_id:06d}@example.org", 'member_number': member_number(user_id),
+                   'subscription_status': 'active' if active else self.rnd.choice(('inactive', 'expired')),
+                   'subscription_type': 'annual' if active else None,
+                   'subscription_start_date': start, 'subscription_end_date': start + timedelta(days=365)}
+
+    def documents(self):
+        rnd = self.rnd
+        for doc_id in range(1, self.args.documents + 1):
+            is_physical = rnd.random() < 0.7
+            is_digital = rnd.random() < 0.5 or not is_physical
+            status = 'disponible'
+            if is_physical:
+                draw = rnd.random()
+                status = 'emprunte' if draw < 0.17 else 'reserve' if draw < 0.20 else 'disponible'
+                self.physical_ids.append(doc_id)
+                self.statuses[doc_id] = status
+            if is_digital:
+                self.digital_ids.append(doc_id)
+            words = rnd.sample(TITLE_WORDS, rnd.randint(2, 4))
+            yield {'id': doc_id, 'title': ' '.join(words).capitalize() + f" ({doc_id})",
+                   'author': f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+                   'summary': ' '.join(rnd.choices(SUMMARY_WORDS, k=rnd.randint(15, 40))).capitalize() + '.',
+                   'status': status, 'is_physical': is_physical, 'is_digital': is_digital,
+                   'file_path': SAMPLE_PDF if is_digital else None, 'cover_image_filename': None,
+                   'barcode': f"BC{doc_id:09d}" if is_physical else None}
+
+    def digital_loans(self):
+        rnd = self.rnd
+        for _ in range(self.args.digital_loans):
+            draw = rnd.random()
+            if draw < 0.04: # En cours
+                loan_date = self.now - timedelta(days=rnd.uniform(0, 13))
+                status = 'active'
+            else:
+                loan_date = self.past(730)
+                status = 'returned' if draw < 0.7 else 'expired'
+            yield {'user_id': self.member(), 'document_id': self.popular_document(self.digital_ids),
+                   'loan_date': loan_date, 'due_date': loan_date + timedelta(days=14), 'status': status}
+
+    def physical_loans(self):
+        rnd = self.rnd
+        borrowed = [doc_id for doc_id, status in self.statuses.items() if status == 'emprunte']
+        for doc_id in borrowed: # Un prêt actif par exemplaire emprunté (index unique partiel)
+            loan_date = self.now - timedelta(days=rnd.uniform(0, 30))
+            yield {'user_id': self.member(), 'document_id': doc_id, 'loan_date': loan_date,
+                   'due_date': loan_date + timedelta(days=21), 'returned_at': None, 'status': 'active'}
+        for _ in range(max(0, self.args.physical_loans - len(borrowed))):
+            loan_date = self.past(730)
+            yield {'user_id': self.member(), 'document_id': self.popular_document(self.physical_ids),
+                   'loan_date': loan_date, 'due_date': loan_date + timedelta(days=21),
+                   'returned_at': loan_date + timedelta(days=rnd.uniform(1, 30)), 'status': 'returned'}
+
+    def reservations(self):
+        """Historique (honorées / annulées / expirées), puis files ouvertes : mises de côté 'ready' et attentes 'active'."""
+        rnd = self.rnd
+        positions = {}
+        open_queues = []
+        for doc_id, status in self.statuses.items():
+            if status == 'reserve':
+                open_queues.append((doc_id, 1 + (rnd.random() < 0.3) * rnd.randint(1, 3)))
+            elif status == 'emprunte' and rnd.random() < 0.35:
+                open_queues.append((doc_id, rnd.randint(1, 5)))
+        history = max(0, self.args.reservations - sum(length for _, length in open_queues))
+        for _ in range(history):
+            doc_id = self.popular_document(self.physical_ids)
+            positions[doc_id] = positions.get(doc_id, 0) + 1
+            yield {'user_id': self.member(), 'document_id': doc_id, 'reservation_date': self.past(730),
+                   'status': rnd.choice(('honored', 'honored', 'cancelled', 'expired')),
+                   'queue_position': positions[doc_id], 'hold_expires_at': None}
+        for doc_id, length in open_queues:
+            for rank in range(length):
+                positions[doc_id] = positions.get(doc_id, 0) + 1
+                ready = rank == 0 and self.statuses[doc_id] == 'reserve'
+                yield {'user_id': self.member(), 'document_id': doc_id,
+                       'reservation_date': self.now - timedelta(days=30 - rank, minutes=rnd.randint(0, 600)),
+                       'status': 'ready' if ready else 'active', 'queue_position': positions[doc_id],
+                       'hold_expires_at': self.now + timedelta(days=rnd.uniform(0.5, 3)) if ready else None}
+
+    def manifest(self):
+        members = [f"membre{user_id:06d}" for user_id in self.member_ids[:self.args.bench_accounts]]
+        return {
+            'seed': self.args.seed, 'created_at': self.now.isoformat(), 'password': BENCH_PASSWORD,
+            'manager': STAFF_ACCOUNTS[0][0], 'attendant': STAFF_ACCOUNTS[2][0], 'members': members,
+            'documents': self.rnd.sample(range(1, self.args.documents + 1), min(2000, self.args.documents)),
+            'digital_documents': self.rnd.sample(self.digital_ids, min(2000, len(self.digital_ids))),
+            'search_terms': list(TITLE_WORDS) + [f"{a} {b}" for a, b in zip(TITLE_WORDS[::2], TITLE_WORDS[1::2])],
+            'counts': {'documents': self.args.documents, 'members': self.args.members},
+        }
+
+
+def _insert(table, rows, batch_size, label):
+    from models import db
+    started = time.perf_counter()
+    total = 0
+    for batch in _batches(rows, batch_size):
+        db.session.execute(insert(table), batch)
+        db.session.commit()
+        total += len(batch)
+        print(f"\r  {label} : {total}", end='', flush=True)
+    print(f"\r  {label} : {total} en {time.perf_counter() - started:.1f}s")
+    return total
+
+
+def _write_sample_pdf(folder):
+    """PDF minimal (~200 Ko) servi par les prêts numériques du jeu de données."""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, SAMPLE_PDF)
+    if not os.path.exists(path):
+        padding = b'%' + b'0' * 79 + b'\n'
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4\n' + padding * 2500 + b'%%EOF\n')
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remplit la base avec un jeu de données de performance.")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiplie tous les volumes par défaut.")
+    parser.add_argument('--documents', type=int)
+    parser.add_argument('--members', type=int)
+    parser.add_argument('--digital-loans', type=int)
+    parser.add_argument('--physical-loans', type=int)
+    parser.add_argument('--reservations', type=int)
+    parser.add_argument('--seed', type=int, default=42, help="Graine aléatoire (jeu de données reproductible).")
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--bench-accounts', type=int, default=200, help="Membres listés dans le manifeste pour tools/bench.py.")
+    parser.add_argument('--manifest', default=None, help="Défaut : instance/bench_manifest.json")
+    parser.add_argument('--reset', action='store_true', help="Supprime et recrée toutes les tables avant le remplissage.")
+    args = parser.parse_args()
+    for name, default in (('documents', DEFAULT_DOCUMENTS), ('members', DEFAULT_MEMBERS),
+                          ('digital_loans', DEFAULT_DIGITAL_LOANS), ('physical_loans', DEFAULT_PHYSICAL_LOANS),
+                          ('reservations', DEFAULT_RESERVATIONS)):
+        if getattr(args, name) is None:
+            setattr(args, name, max(1, int(default * args.scale)))
+
+    from app import app, PDF_UPLOAD_FOLDER
+    from models import db, User, Document, Loan, PhysicalLoan, Reservation
+    import migrations
+    import search_index
+    import stats
+
+    with app.app_context():
+        print(f"Base : {db.engine.url.render_as_string(hide_password=True)}")
+        if args.reset:
+            db.drop_all()
+            db.session.execute(text(f"DROP TABLE IF EXISTS {migrations.VERSION_TABLE}"))
+            db.session.execute(text(f"DROP TABLE IF EXISTS {search_index.FTS_TABLE}"))
+            db.session.commit()
+        db.create_all()
+        migrations.upgrade()
+        if db.session.execute(func.count(User.id).select()).scalar() or \
+                db.session.execute(func.count(Document.id).select()).scalar():
+            sys.exit("La base n'est pas vide : relancer avec --reset (supprime toutes les données).")
+
+        started = time.perf_counter()
+        seeder = Seeder(args, datetime.utcnow())
+        _insert(User.__table__, seeder.users(), args.batch_size, "utilisateurs")
+        _insert(Document.__table__, seeder.documents(), args.batch_size, "documents")
+        _insert(Loan.__table__, seeder.digital_loans(), args.batch_size, "prêts numériques")
+        _insert(PhysicalLoan.__table__, seeder.physical_loans(), args.batch_size, "prêts physiques")
+        _insert(Reservation.__table__, seeder.reservations(), args.batch_size, "réservations")
+        if db.engine.dialect.name == 'postgresql': # Ids explicites : réaligner les séquences
+            for table in ('user', 'document', 'loan', 'physical_loan', 'reservation'):
+                db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                                        f"(SELECT coalesce(max(id), 1) FROM \"{table}\"))"))
+            db.session.commit()
+
+        print(f"  index plein texte : {search_index.rebuild_index()} document(s)")
+        stats.refresh_snapshot()
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(text("ANALYZE")) # Statistiques pour le planificateur (grandes tables)
+            db.session.commit()
+        _write_sample_pdf(PDF_UPLOAD_FOLDER)
+
+        manifest_path = args.manifest or os.path.join(app.instance_path, 'bench_manifest.json')
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(seeder.manifest(), f, ensure_ascii=False, indent=1)
+        print(f"Jeu de données créé en {time.perf_counter() - started:.1f}s ; manifeste : {manifest_path}")
+        print(f"Comptes : {STAFF_ACCOUNTS[0][0]}, membre{seeder.first_member_id:06d}... (mot de passe '{BENCH_PASSWORD}')")
+
+
+if __name__ == '__main__':
+    main()